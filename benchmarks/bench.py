@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the local server and the native messaging host.
+
+`server` starts server.py on a free local port and times POSTing synthetic
+snapshots and fetching them back, over TCP and, with `--unix`, also over
+the server's Unix domain socket. `host` runs the native host over a pipe
+against the fake browser in fake_playwright and times whole clones. Both
+report throughput, p50/p99 latency and the peak RSS of the process under
+test; `--json` prints the same numbers for comparing runs.
+
+    python bench.py server --tabs 10 1000 100000 --unix
+    python bench.py host --tabs 1000 --latency-ms 20 --concurrency 8
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import os
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from snapshots import generate_snapshot
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'native-host'))
+
+from tab_server_client import UnixHTTPConnection  # noqa: E402
+
+SERVER = ROOT / 'local-server' / 'server.py'
+FAKE_HOST = Path(__file__).resolve().parent / 'fake_host.py'
+SERVER_START_TIMEOUT = 10
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def histogram_quantile(sample, fraction):
+    """Estimate a quantile from a getStats histogram sample, interpolating within buckets."""
+    total = sample['count']
+    if not total:
+        return None
+    rank = fraction * total
+    lower_bound = lower_count = 0.0
+    for bound, count in sample['buckets'].items():
+        upper_bound = float('inf') if bound == '+Inf' else float(bound)
+        if count >= rank:
+            if upper_bound == float('inf'):
+                return lower_bound
+            width = count - lower_count
+            return lower_bound + (upper_bound - lower_bound) * ((rank - lower_count) / width if width else 1)
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+
+def peak_rss_kb(pid):
+    """Peak resident set size of a running process in KiB (Linux), or None."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def summarize(name, tabs, latencies, elapsed, rss_kb, extra=None):
+    result = {
+        'benchmark': name,
+        'tabs': tabs,
+        'runs': len(latencies),
+        'tabsPerSecond': tabs * len(latencies) / elapsed if elapsed else None,
+        'p50Ms': percentile(latencies, 0.5) * 1000,
+        'p99Ms': percentile(latencies, 0.99) * 1000,
+        'peakRssMb': rss_kb / 1024 if rss_kb else None
+    }
+    result.update(extra or {})
+    return result
+
+
+def print_result(result):
+    rss = f"{result['peakRssMb']:.1f} MB" if result['peakRssMb'] else 'n/a'
+    line = (f"{result['benchmark']:<16} {result['tabs']:>7} tabs  {result['tabsPerSecond']:>11.0f} tabs/s  "
+            f"p50 {result['p50Ms']:>9.2f} ms  p99 {result['p99Ms']:>9.2f} ms  peak RSS {rss}")
+    if result.get('pageP50Ms') is not None:
+        line += f"  page p50 {result['pageP50Ms']:.1f} ms p99 {result['pageP99Ms']:.1f} ms"
+    print(line)
+
+
+class ServerProcess:
+    """
+    server.py running on a free port, with its history in a temporary
+    directory. With `unix` set, connection() goes through its Unix socket.
+    """
+
+    def __init__(self, workdir, history=False, extra_args=(), unix=False):
+        self.port = free_port()
+        self.socket_path = str(Path(workdir) / 'server.sock') if unix else None
+        args = [sys.executable, str(SERVER), '--port', str(self.port), '--db', str(Path(workdir) / 'snapshots.db')]
+        if not history:
+            args.append('--no-history')
+        if unix:
+            args += ['--unix', self.socket_path]
+        self.process = subprocess.Popen(args + list(extra_args), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._wait_ready()
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                if self.socket_path is None:
+                    probe = socket.create_connection(('127.0.0.1', self.port), timeout=1)
+                else:
+                    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    probe.connect(self.socket_path)
+                probe.close()
+                return
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('server.py did not start')
+                time.sleep(0.05)
+
+    def connection(self):
+        if self.socket_path is not None:
+            return UnixHTTPConnection(self.socket_path, timeout=120)
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+
+    def stop(self):
+        rss = peak_rss_kb(self.process.pid)
+        self.process.terminate()
+        self.process.wait()
+        return rss
+
+
+def bench_server(tabs, runs, compress=False, history=False, unix=False):
+    """Time POST / and GET /pending/<id> round trips of one snapshot size."""
+    body = json.dumps({'action': 'cloneToSidekick', 'data': generate_snapshot(tabs)}).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if compress:
+        body = gzip.compress(body, compresslevel=6)
+        headers['Content-Encoding'] = 'gzip'
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = ServerProcess(workdir, history, unix=unix)
+        try:
+            connection = server.connection()
+            post_times = []
+            get_times = []
+            for run in range(runs):
+                # The job ID rides in the body, so splice it in rather than re-encode
+                job_id = f'bench-{run}'
+                request_body = body
+                if not compress:
+                    request_body = b'{"jobId": "' + job_id.encode() + b'", ' + body[1:]
+                t0 = time.perf_counter()
+                connection.request('POST', '/', request_body, headers)
+                response = connection.getresponse()
+                reply = json.loads(response.read())
+                post_times.append(time.perf_counter() - t0)
+                if response.status != 200:
+                    raise RuntimeError(f'POST failed: {reply}')
+
+                t0 = time.perf_counter()
+                connection.request('GET', f"/pending/{reply['jobId']}")
+                response = connection.getresponse()
+                response.read()
+                get_times.append(time.perf_counter() - t0)
+            connection.close()
+        finally:
+            rss = server.stop()
+
+    name = 'server-unix' if unix else 'server'
+    if compress:
+        name += '-gzip'
+    return [summarize(f'{name}-post', tabs, post_times, sum(post_times), rss, {'bodyBytes': len(body)}),
+            summarize(f'{name}-get', tabs, get_times, sum(get_times), rss)]
+
+
+class HostProcess:
+    """The native host (on the fake browser) behind a pipe, in a throwaway HOME."""
+
+    def __init__(self, workdir, latency_ms, jitter, launch_ms):
+        env = dict(os.environ, HOME=str(workdir), FAKE_PAGE_LATENCY_MS=str(latency_ms),
+                   FAKE_PAGE_JITTER=str(jitter), FAKE_LAUNCH_MS=str(launch_ms), TAB_CLONER_PREWARM='0')
+        self.process = subprocess.Popen([sys.executable, str(FAKE_HOST)], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, env=env)
+
+    def send(self, message):
+        encoded = json.dumps(message).encode('utf-8')
+        self.process.stdin.write(struct.pack('I', len(encoded)))
+        self.process.stdin.write(encoded)
+        self.process.stdin.flush()
+
+    def _read_frame(self):
+        header = self.process.stdout.read(4)
+        if len(header) < 4:
+            raise RuntimeError('Native host exited')
+        return json.loads(self.process.stdout.read(struct.unpack('I', header)[0]))
+
+    def receive(self, request_id):
+        """The final reply to `request_id`, reassembling split envelopes and skipping progress frames."""
+        parts = {}
+        while True:
+            frame = self._read_frame()
+            if 'envelope' in frame:
+                if frame['envelope'] != 'identity':
+                    raise RuntimeError(f"Unexpected envelope encoding {frame['envelope']}")
+                parts[frame['part']] = frame['payload']
+                if len(parts) < frame['parts']:
+                    continue
+                frame = json.loads(''.join(parts[i] for i in range(len(parts))))
+                parts = {}
+            if frame.get('requestId') == request_id and frame.get('status') != 'progress':
+                return frame
+
+    def stop(self):
+        rss = peak_rss_kb(self.process.pid)
+        self.process.stdin.close()
+        self.process.wait()
+        if rss is None:
+            rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return rss
+
+
+def bench_host(tabs, runs, concurrency, latency_ms, jitter, launch_ms):
+    """Time whole clones of one snapshot size through the native host."""
+    snapshot = generate_snapshot(tabs)
+    options = {'cdpUrl': 'http://fake.invalid', 'concurrency': concurrency, 'perHostRate': None,
+               'perHostConcurrency': concurrency}
+    with tempfile.TemporaryDirectory() as workdir:
+        host = HostProcess(workdir, latency_ms, jitter, launch_ms)
+        try:
+            times = []
+            opened = 0
+            for run in range(runs):
+                request_id = f'bench-{run}'
+                t0 = time.perf_counter()
+                host.send({'action': 'cloneToSidekick', 'requestId': request_id, 'data': snapshot,
+                           'options': options})
+                reply = host.receive(request_id)
+                times.append(time.perf_counter() - t0)
+                if reply.get('status') != 'success':
+                    raise RuntimeError(f"Clone failed: {reply.get('error')}")
+                opened = reply['tabsCloned']
+            host.send({'action': 'getStats', 'requestId': 'stats'})
+            stats = host.receive('stats')['stats']
+        finally:
+            rss = host.stop()
+
+    extra = {'tabsOpened': opened, 'concurrency': concurrency, 'latencyMs': latency_ms}
+    pages = stats['tab_cloner_host_navigation_seconds']['samples']
+    page = next((s for s in pages if s['result'] == 'ok'), None)
+    if page is not None:
+        extra['pageP50Ms'] = histogram_quantile(page, 0.5) * 1000
+        extra['pageP99Ms'] = histogram_quantile(page, 0.99) * 1000
+    return [summarize('host-clone', tabs, times, sum(times), rss, extra)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the local server and native host offline')
+    parser.add_argument('target', choices=['server', 'host', 'all'])
+    parser.add_argument('--tabs', type=int, nargs='+', default=[10, 1000, 10000],
+                        help='snapshot sizes to run (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5, help='repetitions per size (default: %(default)s)')
+    parser.add_argument('--gzip', action='store_true', help='also POST gzip-compressed bodies')
+    parser.add_argument('--history', action='store_true', help='keep the server\'s SQLite history on')
+    parser.add_argument('--unix', action='store_true', help='also run the server benchmarks over a Unix socket')
+    parser.add_argument('--concurrency', type=int, default=8, help='host page loads in flight (default: %(default)s)')
+    parser.add_argument('--latency-ms', type=float, default=20, help='mean fake page load time (default: %(default)s)')
+    parser.add_argument('--jitter', type=float, default=0.5, help='page load spread, as a fraction of the mean')
+    parser.add_argument('--launch-ms', type=float, default=200, help='fake browser start time (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+
+    for tabs in args.tabs:
+        results = []
+        if args.target in ('server', 'all'):
+            for unix in (False, True) if args.unix else (False,):
+                results += bench_server(tabs, args.runs, history=args.history, unix=unix)
+                if args.gzip:
+                    results += bench_server(tabs, args.runs, compress=True, history=args.history, unix=unix)
+        if args.target in ('host', 'all'):
+            results += bench_host(tabs, args.runs, args.concurrency, args.latency_ms, args.jitter, args.launch_ms)
+        for result in results:
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print_result(result)
+
+
+if __name__ == '__main__':
+    main()
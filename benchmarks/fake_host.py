@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Run the native messaging host against the fake browser in fake_playwright.
+Speaks the same stdin/stdout framing as the real host; see bench.py.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'native-host'))
+
+import fake_playwright  # noqa: E402
+
+fake_playwright.install()
+
+import tab_cloner_host  # noqa: E402
+
+if __name__ == '__main__':
+    tab_cloner_host.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+A stand-in for `playwright.async_api` used by the benchmarks.
+Implements the small part of the API the native host calls, with pages that
+take a configurable time to load instead of talking to a real browser.
+
+Settings come from the environment so they reach a host subprocess:
+FAKE_PAGE_LATENCY_MS (mean load time, default 50), FAKE_PAGE_JITTER
+(spread as a fraction of the mean, default 0.5) and FAKE_LAUNCH_MS
+(browser start time, default 200).
+"""
+
+import asyncio
+import os
+import random
+import sys
+import types
+
+
+class TimeoutError(Exception):
+    """Raised by goto when a page takes longer than its timeout."""
+
+
+class Response:
+    def __init__(self, status=200):
+        self.status = status
+        self.headers = {}
+
+
+class Page:
+    def __init__(self, settings):
+        self._settings = settings
+        self._closed = False
+
+    async def goto(self, url, wait_until='load', timeout=30000):
+        latency = self._settings.page_latency()
+        if latency * 1000 > timeout:
+            await asyncio.sleep(timeout / 1000)
+            raise TimeoutError(f'Timeout {timeout}ms exceeded navigating to {url}')
+        await asyncio.sleep(latency)
+        return Response()
+
+    async def set_content(self, html):
+        pass
+
+    def is_closed(self):
+        return self._closed
+
+    async def close(self):
+        self._closed = True
+
+
+class Context:
+    def __init__(self, settings):
+        self._settings = settings
+        self.pages = 0
+
+    async def new_page(self):
+        self.pages += 1
+        return Page(self._settings)
+
+
+class Browser:
+    def __init__(self, settings, attached):
+        self._settings = settings
+        self._connected = True
+        # Over CDP the host reuses the browser's existing context
+        self.contexts = [Context(settings)] if attached else []
+
+    def is_connected(self):
+        return self._connected
+
+    async def new_context(self):
+        return Context(self._settings)
+
+    async def close(self):
+        self._connected = False
+
+
+class Chromium:
+    def __init__(self, settings):
+        self._settings = settings
+
+    async def launch(self, **kwargs):
+        await asyncio.sleep(self._settings.launch_ms / 1000)
+        return Browser(self._settings, attached=False)
+
+    async def connect_over_cdp(self, endpoint_url, **kwargs):
+        await asyncio.sleep(self._settings.launch_ms / 1000)
+        return Browser(self._settings, attached=True)
+
+
+class Playwright:
+    def __init__(self, settings):
+        self.chromium = Chromium(settings)
+
+    async def stop(self):
+        pass
+
+
+class _Starter:
+    def __init__(self, settings):
+        self._settings = settings
+
+    async def start(self):
+        return Playwright(self._settings)
+
+
+class Settings:
+    def __init__(self, latency_ms=50.0, jitter=0.5, launch_ms=200.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.launch_ms = launch_ms
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_environment(cls):
+        return cls(float(os.environ.get('FAKE_PAGE_LATENCY_MS', 50)), float(os.environ.get('FAKE_PAGE_JITTER', 0.5)),
+                   float(os.environ.get('FAKE_LAUNCH_MS', 200)))
+
+    def page_latency(self):
+        """One page load time in seconds, uniform within the jitter around the mean."""
+        spread = self.latency_ms * self.jitter
+        return max(0.0, self._random.uniform(self.latency_ms - spread, self.latency_ms + spread)) / 1000
+
+
+def install(settings=None):
+    """Register this fake as `playwright.async_api` for the current process."""
+    settings = settings or Settings.from_environment()
+    module = types.ModuleType('playwright.async_api')
+    module.async_playwright = lambda: _Starter(settings)
+    module.TimeoutError = TimeoutError
+    package = types.ModuleType('playwright')
+    package.async_api = module
+    sys.modules['playwright'] = package
+    sys.modules['playwright.async_api'] = module
+    return settings
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Synthetic tab snapshots for the benchmarks, in the `groups`/`ungroupedTabs`
+shape the Chrome extension sends. The same arguments always give the same
+snapshot.
+
+    python snapshots.py 10000 > snapshot.json
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+
+COLORS = ('grey', 'blue', 'red', 'yellow', 'green', 'pink', 'purple', 'cyan', 'orange')
+WORDS = ('docs', 'issues', 'search', 'news', 'wiki', 'blog', 'shop', 'video', 'notes', 'mail', 'maps', 'dev')
+
+
+def generate_snapshot(tabs, group_size=25, ungrouped=0.1, duplicates=0.05, hosts=None, seed=0):
+    """
+    A snapshot of `tabs` tabs.
+
+    About `ungrouped` of them are outside any group and the rest come in
+    groups of up to `group_size`. Hosts are drawn from a pool of `hosts`
+    (default tabs / 20), with a few popular ones, as in a real browser.
+    About `duplicates` of the tabs repeat an earlier URL, some with
+    tracking parameters added.
+    """
+    rng = random.Random(seed)
+    host_count = hosts or max(1, tabs // 20)
+    host_names = [f'site{i}.example.com' for i in range(host_count)]
+    # Popular hosts first: weight 1/rank
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(host_count)))
+    seen = []
+
+    def make_tab(index):
+        if seen and rng.random() < duplicates:
+            url = rng.choice(seen)
+            if rng.random() < 0.5:
+                url += ('&' if '?' in url else '?') + 'utm_source=bench'
+        else:
+            host = rng.choices(host_names, cum_weights=cum_weights)[0]
+            url = f'https://{host}/{rng.choice(WORDS)}/{index}'
+            if rng.random() < 0.3:
+                url += f'?q={rng.randrange(10 ** 6)}'
+            seen.append(url)
+        return {'url': url, 'title': f'{rng.choice(WORDS).title()} page {index}', 'pinned': False, 'index': index}
+
+    ungrouped_count = int(tabs * ungrouped)
+    snapshot = {'groups': [], 'ungroupedTabs': [make_tab(i) for i in range(ungrouped_count)]}
+    index = ungrouped_count
+    group_id = 1
+    while index < tabs:
+        size = min(rng.randint(max(1, group_size // 2), group_size), tabs - index)
+        snapshot['groups'].append({
+            'id': group_id,
+            'title': f'{rng.choice(WORDS).title()} {group_id}',
+            'color': rng.choice(COLORS),
+            'collapsed': rng.random() < 0.3,
+            'tabs': [make_tab(i) for i in range(index, index + size)]
+        })
+        index += size
+        group_id += 1
+    snapshot['totalTabs'] = tabs
+    snapshot['totalGroups'] = len(snapshot['groups'])
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print a synthetic tab snapshot as JSON')
+    parser.add_argument('tabs', type=int, help='number of tabs')
+    parser.add_argument('--group-size', type=int, default=25, help='largest group (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: %(default)s)')
+    args = parser.parse_args()
+    json.dump(generate_snapshot(args.tabs, group_size=args.group_size, seed=args.seed), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,20 @@
 // Uses local HTTP server instead of native messaging
 
 const SERVER_URL = 'http://127.0.0.1:8768';
+// Request bodies at least this large are gzip-compressed before sending
+const COMPRESS_MIN_BYTES = 16 * 1024;
 
 // Listen for messages from popup
 chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
   if (message.action === 'cloneToSidekick') {
-    cloneTabGroupsToSidekick()
+    cloneTabGroupsToSidekick(message.sync === true)
       .then(result => sendResponse({ success: true, data: result }))
       .catch(error => sendResponse({ success: false, error: error.message }));
     return true; // Keep the message channel open for async response
   }
 });
 
-async function cloneTabGroupsToSidekick() {
+async function cloneTabGroupsToSidekick(sync) {
   try {
     // Get current window
     const currentWindow = await chrome.windows.getCurrent();
@@ -27,8 +29,9 @@ async function cloneTabGroupsToSidekick() {
     // Organize data
     const tabGroupData = organizeTabGroupData(tabs, groups);
 
-    // Send to local server
-    const result = await sendToServer(tabGroupData);
+    // Send to local server. With sync on, the window ID lets it send
+    // Sidekick only what changed since this window was last cloned
+    const result = await sendToServer(tabGroupData, sync ? String(currentWindow.id) : undefined);
 
     return result;
   } catch (error) {
@@ -80,19 +83,28 @@ function organizeTabGroupData(tabs, groups) {
   };
 }
 
-async function sendToServer(data) {
+async function sendToServer(data, source) {
   console.log('Sending to local server:', SERVER_URL);
 
   try {
+    const headers = { 'Content-Type': 'application/json' };
+    const request = { action: 'cloneToSidekick', data: data };
+    if (source !== undefined) {
+      request.source = source;
+    }
+    let body = JSON.stringify(request);
+
+    // Tab snapshots are very repetitive, so large ones shrink a lot
+    if (body.length >= COMPRESS_MIN_BYTES && typeof CompressionStream !== 'undefined') {
+      const stream = new Blob([body]).stream().pipeThrough(new CompressionStream('gzip'));
+      body = await new Response(stream).arrayBuffer();
+      headers['Content-Encoding'] = 'gzip';
+    }
+
     const response = await fetch(SERVER_URL, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        action: 'cloneToSidekick',
-        data: data
-      })
+      headers: headers,
+      body: body
     });
 
     if (!response.ok) {
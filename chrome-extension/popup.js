@@ -1,5 +1,8 @@
 // Popup script for Tab Group Cloner
 
+// localStorage key remembering the "only send changes" checkbox
+const SYNC_OPTION_KEY = 'syncWindow';
+
 document.addEventListener('DOMContentLoaded', async () => {
   // Get DOM elements
   const cloneBtn = document.getElementById('clone-btn');
@@ -11,6 +14,14 @@ document.addEventListener('DOMContentLoaded', async () => {
   const successMessage = document.getElementById('success-message');
   const errorMessage = document.getElementById('error-message');
   const helpLink = document.getElementById('help-link');
+  const syncToggle = document.getElementById('sync-toggle');
+
+  // Sync is opt-in: its diffs are against what Sidekick last fetched, not
+  // what is still open there, so a plain clone must stay the default
+  syncToggle.checked = localStorage.getItem(SYNC_OPTION_KEY) === 'true';
+  syncToggle.addEventListener('change', () => {
+    localStorage.setItem(SYNC_OPTION_KEY, String(syncToggle.checked));
+  });
 
   // Load current tab stats
   await loadTabStats();
@@ -25,7 +36,8 @@ document.addEventListener('DOMContentLoaded', async () => {
 
       // Send message to background script
       const response = await chrome.runtime.sendMessage({
-        action: 'cloneToSidekick'
+        action: 'cloneToSidekick',
+        sync: syncToggle.checked
       });
 
       // Hide loading
@@ -0,0 +1,20 @@
+"""
+Makes the native host's shared modules importable by the local server.
+
+The server reuses tab_pipeline, tab_sync, tab_logging, tab_metrics,
+tab_snapshot and tab_server_client from native-host/. That directory is a
+plain script directory the native host runs from, not an installed
+package, so importing this module puts it on sys.path. This is the only
+place the server touches sys.path; import it before any of those modules.
+The server therefore has to stay next to native-host/ in the checkout.
+"""
+
+import sys
+from pathlib import Path
+
+NATIVE_HOST_DIR = Path(__file__).resolve().parent.parent / 'native-host'
+
+if not (NATIVE_HOST_DIR / 'tab_pipeline.py').is_file():
+    raise ImportError(f'The local server needs the native host modules in {NATIVE_HOST_DIR}')
+if str(NATIVE_HOST_DIR) not in sys.path:
+    sys.path.insert(0, str(NATIVE_HOST_DIR))
@@ -4,120 +4,1346 @@ Local HTTP server for Tab Group Cloner.
 Receives tab data from Chrome extension and serves it to Sidekick extension.
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import codecs
+import gzip
+import hashlib
+import itertools
 import json
 import logging
+import os
+import re
+import select
+import socket
+import sqlite3
+import stat
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Modules shared with the native host live in native-host/ (see native_host_path)
+import native_host_path  # noqa: F401
+from tab_pipeline import build_pipeline
+from tab_sync import SnapshotState, summarize
+from tab_logging import PayloadSummary, start_logging
+from tab_metrics import MetricsRegistry, SIZE_BUCKETS
+from tab_snapshot import CompactSnapshot, encode_json
+from tab_server_client import DEFAULT_SOCKET_PATH
+from snapshot_store import DEFAULT_MAX_SNAPSHOTS, SnapshotStore
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Logging is set up in main(), through a queue (see tab_logging)
 logger = logging.getLogger(__name__)
 
-# Store pending tab data for Sidekick extension to fetch
-pending_tab_data = None
+# Limits for tab data waiting to be fetched by the Sidekick extension
+PENDING_TTL_SECONDS = 15 * 60
+MAX_PENDING_JOBS = 100
+MAX_PENDING_BYTES = 64 * 1024 * 1024
+
+# Filters applied to every clone request; keys the request sets take precedence
+default_filters = {}
+
+# Where received snapshots are kept, unless --no-history is given
+DEFAULT_DB_PATH = Path.home() / '.tab_cloner' / 'snapshots.db'
+MAX_LIST_SNAPSHOTS = 500
+
+# Largest request body accepted, and the size of each read while parsing it
+MAX_BODY_BYTES = 32 * 1024 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+
+# JSON responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+# Serialized responses kept for repeat GETs, in bytes of JSON
+RESPONSE_CACHE_BYTES = 16 * 1024 * 1024
+
+# Longest a GET /pending?wait=N long-poll may block, in seconds
+MAX_WAIT_SECONDS = 60
+# How often an idle /events stream sends a keep-alive comment
+EVENT_KEEPALIVE_SECONDS = 15
+
+
+class PayloadTooLarge(Exception):
+    """Raised when a payload is over the body size limit or cannot fit in the pending queue."""
+
+
+class UnsupportedEncoding(Exception):
+    """Raised for a request Content-Encoding the server cannot decode."""
+
+
+# What may follow a decoded number in the buffer if the number is cut short
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class StreamingRequestParser:
+    """
+    Incremental parser for clone request bodies.
+
+    Reads the body from `stream` in fixed-size chunks and decodes the
+    top-level object one member at a time. The `groups` and `ungroupedTabs`
+    arrays inside `data` are decoded element by element, so the raw bytes
+    of a large snapshot are never held in memory all at once - only the
+    parsed objects and the element currently being decoded.
+    """
+
+    STREAMED_ARRAYS = ('groups', 'ungroupedTabs')
+
+    def __init__(self, stream, length=None, limit=None, chunk_size=READ_CHUNK_BYTES):
+        """
+        Read exactly `length` bytes from `stream`, or until EOF when it is
+        None (e.g. a decompressing reader); more than `limit` bytes in total
+        raises PayloadTooLarge.
+        """
+        self._stream = stream
+        self._remaining = length
+        self._limit = limit
+        self._eof = length is not None and length <= 0
+        self.bytes_read = 0
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+
+    def parse(self):
+        """Parse the whole body and return it as a dict."""
+        self._skip_ws()
+        if self._peek() != '{':
+            raise ValueError('Request body must be a JSON object')
+        result = self._object(lambda key: self._data() if key == 'data' else self._value())
+        self._skip_ws()
+        if self._peek() is not None:
+            raise ValueError('Unexpected data after JSON object')
+        return result
+
+    def _data(self):
+        """Parse the `data` member, streaming its tab arrays."""
+        if self._peek() != '{':
+            return self._value()
+        return self._object(lambda key: self._array() if key in self.STREAMED_ARRAYS else self._value())
+
+    def _object(self, parse_member):
+        self._expect('{')
+        result = {}
+        self._skip_ws()
+        if self._peek() == '}':
+            self._pos += 1
+            return result
+        while True:
+            self._skip_ws()
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError('Expected a string key')
+            self._skip_ws()
+            self._expect(':')
+            self._skip_ws()
+            result[key] = parse_member(key)
+            self._skip_ws()
+            if self._peek() == ',':
+                self._pos += 1
+                continue
+            self._expect('}')
+            return result
+
+    def _array(self):
+        if self._peek() != '[':
+            return self._value()
+        self._expect('[')
+        items = []
+        self._skip_ws()
+        if self._peek() == ']':
+            self._pos += 1
+            return items
+        while True:
+            self._skip_ws()
+            items.append(self._value())
+            self._skip_ws()
+            if self._peek() == ',':
+                self._pos += 1
+                continue
+            self._expect(']')
+            return items
+
+    def _value(self):
+        """Decode one complete JSON value, reading more input until it fits."""
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(len(self._buf) - self._pos):
+                    raise
+                continue
+            # A number or literal touching the end of the buffer may continue,
+            # and so may a number the buffer cuts off after '1.' or '1e'
+            # (decoded as just 1)
+            if (end == len(self._buf) or isinstance(value, (int, float)) and
+                    NUMBER_TAIL.match(self._buf, end)) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _skip_ws(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buf) or not self._fill():
+                return
+
+    def _peek(self):
+        if self._pos >= len(self._buf) and not self._fill():
+            return None
+        return self._buf[self._pos]
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f'Expected {char!r} at offset {self._pos}')
+        self._pos += 1
+
+    def _fill(self, at_least=0):
+        """
+        Append more decoded input to the buffer; False at end of body.
+
+        Reads at least `at_least` bytes so a value that keeps failing to
+        decode grows the buffer geometrically rather than chunk by chunk.
+        """
+        if self._eof:
+            return False
+        # Drop what has already been consumed
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        size = max(self._chunk_size, at_least)
+        if self._remaining is not None:
+            size = min(self._remaining, size)
+        chunk = self._stream.read(size)
+        if self._remaining is None:
+            self._eof = not chunk
+        else:
+            if not chunk:
+                raise ValueError('Request body ended before Content-Length bytes')
+            self._remaining -= len(chunk)
+            self._eof = self._remaining <= 0
+        self.bytes_read += len(chunk)
+        if self._limit is not None and self.bytes_read > self._limit:
+            raise PayloadTooLarge(f'Request body exceeds {self._limit} bytes')
+        self._buf += self._decoder.decode(chunk, final=self._eof)
+        return bool(chunk)
+
+
+class BoundedReader:
+    """File-like view of the next `length` bytes of a stream."""
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        if size <= 0:
+            return b''
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readable(self):
+        return True
+
+
+# Decoder errors that are not already ValueError/OSError subclasses
+DECOMPRESSION_ERRORS = (zstandard.ZstdError,) if zstandard is not None else ()
+
+
+def supported_encodings():
+    """Content codings this server can decode and produce, best first."""
+    if zstandard is not None:
+        return ('zstd', 'gzip')
+    return ('gzip',)
+
+
+def open_decoder(stream, encoding):
+    """Wrap a raw body stream in a decompressing reader for `encoding`."""
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    raise UnsupportedEncoding(encoding)
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+def choose_encoding(accept_encoding):
+    """Pick the best encoding from an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and params[2:] in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    for encoding in supported_encodings():
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+class CloneQueue:
+    """
+    Pending clone jobs keyed by job ID, consumed in FIFO order.
+
+    Jobs expire after `ttl` seconds. When the queue holds more than
+    `max_jobs` jobs or `max_bytes` of payload, the oldest jobs are evicted
+    to make room. Safe to use from several request threads.
+    """
+
+    def __init__(self, ttl=PENDING_TTL_SECONDS, max_jobs=MAX_PENDING_JOBS, max_bytes=MAX_PENDING_BYTES):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes
+        self._jobs = OrderedDict()
+        self._bytes = 0
+        # Bumped on every change, so responses built from the queue can be cached
+        self._version = 0
+        self._lock = threading.Lock()
+        # Signalled whenever a job is stored, for long-polling readers
+        self._changed = threading.Condition(self._lock)
+
+    def put(self, data, size, job_id=None):
+        """Store a payload of roughly `size` bytes and return its job ID."""
+        if size > self.max_bytes:
+            raise PayloadTooLarge(f'Payload of {size} bytes exceeds the {self.max_bytes} byte limit')
+
+        job_id = job_id or uuid.uuid4().hex
+        with self._changed:
+            # Re-pushing a job ID replaces it and moves it to the back
+            self._remove(job_id)
+            self._expire()
+            while self._jobs and (len(self._jobs) >= self.max_jobs or self._bytes + size > self.max_bytes):
+                evicted_id, (_data, _received_at, evicted_size) = self._jobs.popitem(last=False)
+                self._bytes -= evicted_size
+                logger.warning("Evicted pending job %s to stay within limits", evicted_id)
+            self._jobs[job_id] = (data, time.time(), size)
+            self._bytes += size
+            self._version += 1
+            self._changed.notify_all()
+        return job_id
+
+    def pop(self, job_id=None, timeout=0):
+        """
+        Remove and return (job_id, data, received_at, size), or None if
+        nothing matches.
+
+        With a `timeout`, wait up to that many seconds for a matching job to
+        be stored before giving up.
+        """
+        with self._changed:
+            entry = self._wait_for(lambda: self._take(job_id), timeout)
+        return entry
+
+    def pop_many(self, limit, timeout=0):
+        """Remove and return up to `limit` of the oldest jobs, waiting like pop()."""
+        def take_batch():
+            jobs = []
+            while self._jobs and len(jobs) < limit:
+                jobs.append(self._take(None))
+            return jobs
+
+        with self._changed:
+            return self._wait_for(take_batch, timeout) or []
+
+    def wait(self, timeout):
+        """Block until at least one job is pending; returns whether one is."""
+        with self._changed:
+            return bool(self._wait_for(lambda: bool(self._jobs), timeout))
+
+    def discard(self, job_id):
+        """Drop a job without handing it out; returns whether it was pending."""
+        with self._changed:
+            return self._remove(job_id) is not None
+
+    def restore(self, job_id, data, received_at, size):
+        """
+        Put a popped job back at the front, e.g. when delivering it failed.
+
+        Returns whether it went back. A job stored since under the same ID
+        supersedes it, and as the oldest job it is the one dropped if the
+        queue has filled up meanwhile.
+        """
+        with self._changed:
+            if job_id in self._jobs:
+                return False
+            self._expire()
+            if len(self._jobs) >= self.max_jobs or self._bytes + size > self.max_bytes:
+                logger.warning("Dropped pending job %s instead of restoring it, to stay within limits", job_id)
+                return False
+            self._jobs[job_id] = (data, received_at, size)
+            self._jobs.move_to_end(job_id, last=False)
+            self._bytes += size
+            self._version += 1
+            self._changed.notify_all()
+        return True
+
+    def peek(self, job_id=None, limit=1):
+        """
+        Return ([(job_id, data, received_at), ...], version) without removing
+        anything: `job_id`'s job, or up to `limit` of the oldest.
+        """
+        with self._changed:
+            self._expire()
+            if job_id is not None:
+                entry = self._jobs.get(job_id)
+                jobs = [(job_id, entry[0], entry[1])] if entry is not None else []
+            else:
+                jobs = [(jid, entry[0], entry[1]) for jid, entry in itertools.islice(self._jobs.items(), limit)]
+            return jobs, self._version
+
+    def stats(self):
+        """Return (number of pending jobs, version)."""
+        with self._changed:
+            self._expire()
+            return len(self._jobs), self._version
+
+    @property
+    def version(self):
+        """Changes whenever a job is stored, handed out, dropped or expires."""
+        with self._changed:
+            self._expire()
+            return self._version
+
+    def __len__(self):
+        with self._changed:
+            self._expire()
+            return len(self._jobs)
+
+    @property
+    def size_bytes(self):
+        """Approximate payload bytes of the pending jobs."""
+        with self._changed:
+            self._expire()
+            return self._bytes
+
+    def _wait_for(self, take, timeout):
+        """Call `take` until it returns something truthy or `timeout` passes."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._expire()
+            result = take()
+            remaining = deadline - time.monotonic()
+            if result or remaining <= 0:
+                return result
+            self._changed.wait(remaining)
+
+    def _take(self, job_id):
+        if job_id is None:
+            if not self._jobs:
+                return None
+            job_id = next(iter(self._jobs))
+        entry = self._remove(job_id)
+        if entry is None:
+            return None
+        return (job_id,) + entry
+
+    def _remove(self, job_id):
+        entry = self._jobs.pop(job_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            self._version += 1
+        return entry
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._jobs:
+            job_id, (_data, received_at, size) = next(iter(self._jobs.items()))
+            if received_at >= cutoff:
+                break
+            self._jobs.popitem(last=False)
+            self._bytes -= size
+            self._version += 1
+            logger.info("Expired pending job %s", job_id)
+
+
+class PendingSync:
+    """A sync request's snapshot (a CompactSnapshot), queued until the extension fetches it."""
+
+    __slots__ = ('source', 'snapshot')
+
+    def __init__(self, source, snapshot):
+        self.source = source
+        self.snapshot = snapshot
+
+
+class SyncTracker:
+    """
+    The last snapshot of each source window the Sidekick extension fetched.
+
+    A sync job is queued as its full snapshot and only turned into a diff
+    when it is fetched, against what the extension received last time. So
+    a newer snapshot can simply replace an unfetched one, and one that
+    expires unfetched does not leave the extension out of step. The new
+    baseline is committed only once the diff has been sent, so a failed
+    delivery leaves the job to be served again against the old one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fetched = {}
+
+    def diff(self, source, snapshot):
+        """Changes from what `source`'s window last delivered to `snapshot`."""
+        with self._lock:
+            base = self._fetched.get(source) or SnapshotState()
+        return base.diff(snapshot)
+
+    def serve(self, data):
+        """
+        What to hand out for a popped job: a PendingSync becomes the diff the
+        extension needs. Returns (data to send, baseline); pass the baseline
+        to commit() once the data has been sent.
+        """
+        if not isinstance(data, PendingSync):
+            return data, None
+        snapshot = data.snapshot.to_dict()
+        with self._lock:
+            base = self._fetched.get(data.source)
+        diff = (base or SnapshotState()).diff(snapshot)
+        return {'source': data.source, 'diff': diff}, (data.source, base, SnapshotState.from_snapshot(snapshot))
+
+    def commit(self, baseline):
+        """Record a served sync as delivered (a no-op for other jobs' None)."""
+        if baseline is None:
+            return
+        source, base, target = baseline
+        with self._lock:
+            # Another delivery for the source got there first; its baseline stands
+            if self._fetched.get(source) is base:
+                self._fetched[source] = target
+
+    def preview(self, data):
+        """What take() would serve for `data`, without recording it as fetched."""
+        if not isinstance(data, PendingSync):
+            return data
+        return {'source': data.source, 'diff': self.diff(data.source, data.snapshot.to_dict())}
+
+
+# Snapshots already delivered per source window, for sync requests
+sync_tracker = SyncTracker()
+
+# Tab data waiting for the Sidekick extension to fetch
+pending_jobs = CloneQueue()
+
+# History of every snapshot received (a SnapshotStore), opened by main()
+snapshot_store = None
+
+
+class CachedResponse:
+    """A serialized JSON response, with its ETag and compressed variants."""
+
+    __slots__ = ('code', 'body', 'etag', 'encoded')
+
+    def __init__(self, code, body):
+        self.code = code
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        # encoding -> compressed body, filled in as clients ask for them
+        self.encoded = {}
+
+
+class ResponseCache:
+    """
+    Serialized GET responses, each valid for one version of the data it was
+    built from.
+
+    Callers pass the version they built against (the queue's version for
+    /status and peeks), so storing or handing out a job invalidates every
+    response built from the queue without touching the cache itself. The
+    least recently used entries go first once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, code, response):
+        """Serialize `response`; keep it if it is a success small enough to cache."""
+        cached = CachedResponse(code, encode_json(response))
+        size = len(cached.body)
+        if code != 200 or size > self.max_bytes // 4:
+            return cached
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1].body)
+            self._entries[key] = (version, cached)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _key, (_version, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+        return cached
+
+
+response_cache = ResponseCache()
+
+# Served at /metrics in the Prometheus text format
+metrics = MetricsRegistry()
+request_seconds = metrics.histogram(
+    'tab_cloner_server_request_seconds', 'Time from parsing a request line to the end of the response',
+    ('method', 'route', 'code'))
+request_body_bytes = metrics.histogram(
+    'tab_cloner_server_request_body_bytes', 'Declared size of POST bodies', ('route',), buckets=SIZE_BUCKETS)
+metrics.gauge('tab_cloner_server_pending_jobs', 'Jobs waiting for the Sidekick extension', lambda: len(pending_jobs))
+metrics.gauge('tab_cloner_server_pending_bytes', 'Payload bytes waiting for the Sidekick extension',
+              lambda: pending_jobs.size_bytes)
+
+
+def metrics_route(path):
+    """The route label of a request path, with job and snapshot IDs taken out."""
+    path = urlsplit(path).path
+    if path.startswith('/pending/'):
+        return '/pending/{id}'
+    match = re.fullmatch(r'/snapshots/\d+(/serve)?', path)
+    if match:
+        return '/snapshots/{id}' + (match.group(1) or '')
+    if path in ('/', '/pending', '/events', '/snapshots', '/status', '/metrics'):
+        return path
+    return 'other'
+
 
 class TabClonerHandler(BaseHTTPRequestHandler):
+    def setup(self):
+        # Without TCP_NODELAY a small response's last segment can wait on
+        # the client's delayed ACK (~40 ms on Linux). Unix sockets have no
+        # Nagle algorithm to turn off.
+        self.disable_nagle_algorithm = self.request.family != socket.AF_UNIX
+        super().setup()
+
+    def address_string(self):
+        # Peers on a Unix socket have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def handle_one_request(self):
+        # Timed from parse_request, so idle keep-alive time is not counted
+        self._started = None
+        self._code = None
+        super().handle_one_request()
+        if self._started is not None:
+            # A malformed request line leaves no command or path, and a client
+            # that left before any status was sent is counted as code 000
+            request_seconds.observe(time.monotonic() - self._started, method=self.command or '',
+                                    route=metrics_route(getattr(self, 'path', '')),
+                                    code=self._code if self._code is not None else '000')
+
+    def parse_request(self):
+        self._started = time.monotonic()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self._code = code
+        super().send_response(code, message)
+
     def do_GET(self):
         """Handle GET requests - serve pending tab data to Sidekick extension"""
-        global pending_tab_data
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        if url.path in ('/pending', '/events') or url.path.startswith('/pending/'):
+            try:
+                wait = self._get_wait(query)
+            except ValueError:
+                self.send_error(400, 'Invalid wait')
+                return
 
-        if self.path == '/pending':
+        peek = query.get('peek', ['0'])[0].lower() in ('1', 'true', 'yes')
+
+        if url.path == '/events':
+            self._stream_events()
+        elif peek and (url.path == '/pending' or url.path.startswith('/pending/')):
+            self._peek_pending(url, query, wait)
+        elif url.path == '/pending':
+            if 'limit' in query:
+                try:
+                    limit = int(query['limit'][0])
+                    if limit < 1:
+                        raise ValueError
+                except ValueError:
+                    self.send_error(400, 'Invalid limit')
+                    return
+                jobs = pending_jobs.pop_many(limit, wait)
+                if not jobs:
+                    self._send_empty(('empty', 'limit'), {
+                        'status': 'empty', 'message': 'No pending tab data', 'jobs': []
+                    })
+                    return
+
+                def respond(served):
+                    self._send_json(200, {
+                        'status': 'success',
+                        'jobs': [
+                            {'jobId': job_id, 'data': data, 'receivedAt': received_at}
+                            for job_id, data, received_at in served
+                        ]
+                    })
+                if self._deliver(jobs, respond):
+                    logger.info("Served %s pending jobs to Sidekick extension", len(jobs))
+            else:
+                self._send_popped(None, wait)
+        elif url.path.startswith('/pending/'):
+            self._send_popped(url.path[len('/pending/'):], wait)
+        elif url.path == '/snapshots' or url.path.startswith('/snapshots/'):
+            self._get_snapshots(url.path, query)
+        elif url.path == '/metrics':
+            body = metrics.render().encode('utf-8')
             self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
+            self.wfile.write(body)
+        elif url.path == '/status':
+            def build():
+                pending_count, _version = pending_jobs.stats()
+                return 200, {
+                    'status': 'running',
+                    'hasPendingData': pending_count > 0,
+                    'pendingCount': pending_count
+                }
+            self._send_cached('/status', pending_jobs.version, build)
+        else:
+            self.send_error(404, 'Not found')
+
+    def _peek_pending(self, url, query, wait):
+        """
+        Show pending jobs without taking them off the queue (?peek=1).
+
+        Peeks are cached until the queue changes, so a client polling with
+        If-None-Match gets a bodyless 304 while nothing has happened.
+        """
+        job_id = url.path[len('/pending/'):] if url.path.startswith('/pending/') else None
+        try:
+            limit = int(query['limit'][0]) if 'limit' in query else None
+            if limit is not None and limit < 1:
+                raise ValueError
+        except ValueError:
+            self.send_error(400, 'Invalid limit')
+            return
+        if wait:
+            pending_jobs.wait(wait)
+
+        def build():
+            jobs, _version = pending_jobs.peek(job_id, limit or 1)
+            jobs = [
+                {'jobId': jid, 'data': sync_tracker.preview(data), 'receivedAt': received_at}
+                for jid, data, received_at in jobs
+            ]
+            if limit is not None:
+                return 200, {'status': 'success' if jobs else 'empty', 'jobs': jobs}
+            if job_id is not None and not jobs:
+                return 404, {'status': 'empty', 'message': f'No pending tab data for job {job_id}'}
+            if not jobs:
+                return 200, {'status': 'empty', 'message': 'No pending tab data'}
+            return 200, dict(jobs[0], status='success')
+
+        self._send_cached(('peek', url.path, limit), pending_jobs.version, build)
+
+    def _get_snapshots(self, path, query):
+        """List stored snapshots (/snapshots) or fetch one (/snapshots/<id>)."""
+        if snapshot_store is None:
+            self.send_error(404, 'Snapshot history is disabled')
+            return
+
+        if path == '/snapshots':
+            try:
+                limit = min(int(query.get('limit', ['50'])[0]), MAX_LIST_SNAPSHOTS)
+                before = int(query['before'][0]) if 'before' in query else None
+                since = float(query['since'][0]) if 'since' in query else None
+                until = float(query['until'][0]) if 'until' in query else None
+                if limit < 1:
+                    raise ValueError
+            except ValueError:
+                self.send_error(400, 'Invalid limit, before, since or until')
+                return
+            snapshots = snapshot_store.list(limit, before, query.get('source', [None])[0],
+                                            query.get('group', [None])[0], since, until)
+            self._send_json(200, {'status': 'success', 'snapshots': snapshots})
+            return
+
+        snapshot_id = self._snapshot_id(path)
+
+        def build():
+            snapshot = snapshot_store.get(snapshot_id) if snapshot_id is not None else None
+            if snapshot is None:
+                return 404, {'status': 'error', 'error': 'No such snapshot'}
+            snapshot['status'] = 'success'
+            return 200, snapshot
+
+        # Stored snapshots never change
+        self._send_cached(('snapshot', snapshot_id), 0, build)
+
+    @staticmethod
+    def _snapshot_id(path):
+        try:
+            return int(path[len('/snapshots/'):].split('/')[0])
+        except ValueError:
+            return None
+
+    def _serve_snapshot(self, path):
+        """Queue a stored snapshot for the Sidekick extension again."""
+        if snapshot_store is None:
+            self.send_error(404, 'Snapshot history is disabled')
+            return
+        snapshot_id = self._snapshot_id(path)
+        snapshot = snapshot_store.get(snapshot_id) if snapshot_id is not None else None
+        if snapshot is None:
+            self._send_json(404, {'status': 'error', 'error': 'No such snapshot'})
+            return
+
+        size = len(json.dumps(snapshot['data']))
+        data = CompactSnapshot.from_dict(snapshot['data'])
+        try:
+            job_id = pending_jobs.put(data, size, f'snapshot-{snapshot_id}')
+        except PayloadTooLarge as e:
+            self._send_json(413, {'status': 'error', 'error': str(e)})
+            return
+        logger.info("Queued stored snapshot %s again as job %s", snapshot_id, job_id)
+        self._send_json(200, {
+            'status': 'success',
+            'message': f'Snapshot {snapshot_id} queued for the Sidekick extension',
+            'jobId': job_id,
+            'snapshotId': snapshot_id
+        })
+
+    def _remember(self, tab_data, source, job_id):
+        """Add a received snapshot to the history; returns its ID, or None."""
+        if snapshot_store is None:
+            return None
+        try:
+            return snapshot_store.add(tab_data, source, job_id)
+        except sqlite3.Error as e:
+            # Losing history must not lose the clone itself
+            logger.error("Cannot store snapshot: %s", e)
+            return None
+
+    def _can_block(self):
+        """Long-polls would stall every other client on the single-threaded engine."""
+        return isinstance(self.server, ThreadingMixIn)
+
+    def _get_wait(self, query):
+        """Seconds a GET may block waiting for data (`?wait=N`, capped)."""
+        wait = float(query.get('wait', ['0'])[0])
+        if not wait >= 0:
+            raise ValueError(wait)
+        if not self._can_block():
+            return 0
+        return min(wait, MAX_WAIT_SECONDS)
+
+    def _stream_events(self):
+        """
+        Server-Sent Events stream: push each job as a `pending` event as soon
+        as it is stored, so the Sidekick extension never has to poll.
+        """
+        if not self._can_block():
+            self.send_error(501, 'Event stream requires the threaded engine')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        # The stream has no length, so the connection ends with it
+        self.close_connection = True
 
-            if pending_tab_data:
-                response = {'status': 'success', 'data': pending_tab_data}
-                # Clear pending data after serving
-                pending_tab_data = None
-                logger.info("Served pending tab data to Sidekick extension")
+        def send_event(served):
+            job_id, data, received_at = served[0]
+            event = {'status': 'success', 'jobId': job_id, 'data': data, 'receivedAt': received_at}
+            self.wfile.write(f'id: {job_id}\nevent: pending\ndata: '.encode() + encode_json(event) + b'\n\n')
+            self.wfile.flush()
+
+        while True:
+            job = None
+            if pending_jobs.wait(EVENT_KEEPALIVE_SECONDS):
+                # Don't take a job off the queue for a client that already left
+                if self._client_gone():
+                    logger.info("Event stream client disconnected")
+                    return
+                job = pending_jobs.pop()
+            if job is not None:
+                if not self._deliver([job], send_event):
+                    return
+                logger.info("Pushed pending job %s to event stream", job[0])
+                continue
+            try:
+                self.wfile.write(b': keep-alive\n\n')
+                self.wfile.flush()
+            except OSError:
+                logger.info("Event stream client disconnected")
+                return
+
+    def _client_gone(self):
+        """Whether the peer has closed its end of the connection."""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _send_popped(self, job_id, wait=0):
+        """Take one job (the oldest, or `job_id`) off the queue and send it."""
+        job = pending_jobs.pop(job_id, wait)
+        if job is None:
+            if job_id is not None:
+                self._send_json(404, {'status': 'empty', 'message': f'No pending tab data for job {job_id}'})
             else:
-                response = {'status': 'empty', 'message': 'No pending tab data'}
+                self._send_empty(('empty', None), {'status': 'empty', 'message': 'No pending tab data'})
+            return
 
-            self.wfile.write(json.dumps(response).encode())
-        elif self.path == '/status':
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
+        def respond(served):
+            job_id, data, received_at = served[0]
+            self._send_json(200, {'status': 'success', 'jobId': job_id, 'data': data, 'receivedAt': received_at})
+        if self._deliver([job], respond):
+            logger.info("Served pending job %s to Sidekick extension", job[0])
+
+    def _send_empty(self, key, response):
+        """
+        Answer a pop that found nothing through the response cache, so a
+        client polling an empty queue with If-None-Match gets a bodyless 304.
+        """
+        self._send_cached(key, pending_jobs.version, lambda: (200, response))
+
+    def _deliver(self, jobs, respond):
+        """
+        Hand popped jobs to the client with `respond([(job_id, data,
+        received_at), ...])`. Sync jobs are turned into diffs here, outside
+        the queue lock, and their baselines only move on once `respond`
+        succeeded. Otherwise the jobs go back on the queue as they were.
+        Returns whether they were sent.
+        """
+        baselines = []
+        try:
+            served = []
+            for job_id, data, received_at, _size in jobs:
+                data, baseline = sync_tracker.serve(data)
+                served.append((job_id, data, received_at))
+                baselines.append(baseline)
+            respond(served)
+        except Exception as e:
+            for job in reversed(jobs):
+                pending_jobs.restore(*job)
+            if not isinstance(e, OSError):
+                raise
+            logger.info("Client disconnected before receiving %s pending jobs", len(jobs))
+            self.close_connection = True
+            return False
+        for baseline in baselines:
+            sync_tracker.commit(baseline)
+        return True
+
+    def _send_json(self, code, response):
+        self._send_body(code, encode_json(response))
+
+    def _send_cached(self, key, version, build):
+        """
+        Send the response `build()` returns as (code, response), reusing the
+        bytes already serialized for `key` at `version`. Answers 304 when the
+        client's If-None-Match already has it.
+        """
+        cached = response_cache.get(key, version)
+        if cached is None:
+            code, response = build()
+            cached = response_cache.put(key, version, code, response)
+
+        if cached.code == 200 and self._etag_matches(cached.etag):
+            self.send_response(304)
+            self.send_header('ETag', cached.etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            response = {
-                'status': 'running',
-                'hasPendingData': pending_tab_data is not None
-            }
-            self.wfile.write(json.dumps(response).encode())
-        else:
-            self.send_error(404, 'Not found')
+            return
+        self._send_body(cached.code, cached.body, cached)
+
+    def _etag_matches(self, etag):
+        header = self.headers.get('If-None-Match')
+        if not header:
+            return False
+        if header.strip() == '*':
+            return True
+        # Weak comparison, as If-None-Match calls for
+        for tag in header.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
+    def _send_body(self, code, body, cached=None):
+        encoding = None
+        if len(body) >= MIN_COMPRESS_BYTES:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+            if encoding:
+                if cached is None:
+                    body = compress(body, encoding)
+                else:
+                    if encoding not in cached.encoded:
+                        cached.encoded[encoding] = compress(body, encoding)
+                    body = cached.encoded[encoding]
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        if cached is not None:
+            self.send_header('ETag', cached.etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Access-Control-Expose-Headers', 'ETag')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
 
     def do_OPTIONS(self):
         """Handle CORS preflight"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Content-Encoding, If-None-Match')
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def do_POST(self):
         """Handle clone request from Chrome extension"""
-        global pending_tab_data
+        # Validate the declared size before reading any of the body
+        length_header = self.headers['Content-Length']
+        if length_header is None:
+            self.send_error(411, 'Content-Length required')
+            return
+        try:
+            content_length = int(length_header)
+            if content_length < 0:
+                raise ValueError
+        except ValueError:
+            self.send_error(400, 'Invalid Content-Length')
+            return
+        if content_length > MAX_BODY_BYTES:
+            self.send_error(413, f'Request body exceeds {MAX_BODY_BYTES} bytes')
+            return
+
+        path = urlsplit(self.path).path
+        request_body_bytes.observe(content_length, route=metrics_route(path))
+        if re.fullmatch(r'/snapshots/\d+/serve', path):
+            # The body, if any, is ignored
+            self.rfile.read(content_length)
+            self._serve_snapshot(path)
+            return
+
+        encoding = (self.headers.get('Content-Encoding') or 'identity').strip().lower()
 
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            try:
+                if encoding == 'identity':
+                    parser = StreamingRequestParser(self.rfile, content_length)
+                else:
+                    body = open_decoder(BoundedReader(self.rfile, content_length), encoding)
+                    parser = StreamingRequestParser(body, limit=MAX_BODY_BYTES)
+                data = parser.parse()
+            # The rest of the body may still be unread, so these all close the connection
+            except UnsupportedEncoding:
+                self.send_error(415, f'Unsupported Content-Encoding: {encoding}')
+                return
+            except PayloadTooLarge as e:
+                self.send_error(413, str(e))
+                return
+            except (ValueError, EOFError, OSError) + DECOMPRESSION_ERRORS as e:
+                self.send_error(400, f'Invalid request body: {e}')
+                return
 
-            logger.info(f"Received request: {data.get('action')}")
+            logger.info("Received request: %s", PayloadSummary(data))
 
             if data.get('action') == 'cloneToSidekick':
-                tab_data = data.get('data', {})
-                groups = tab_data.get('groups', [])
-                ungrouped = tab_data.get('ungroupedTabs', [])
+                job_id = data.get('jobId')
+                if job_id is not None and (not isinstance(job_id, str) or not job_id or '/' in job_id):
+                    self.send_error(400, 'Invalid jobId')
+                    return
+
+                # Normalize, filter and dedup before queueing, so the
+                # Sidekick extension only sees the tabs it should open
+                filters = data.get('filters') or {}
+                try:
+                    if not isinstance(filters, dict):
+                        raise ValueError(f'Invalid filters: {filters!r}')
+                    pipeline = build_pipeline(dict(default_filters, **filters))
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                tab_data = pipeline.process(data.get('data') or {})
+                groups = tab_data['groups']
+                ungrouped = tab_data['ungroupedTabs']
 
-                # Store the data for Sidekick extension to fetch
-                pending_tab_data = tab_data
+                source = data.get('source')
+                if source is not None:
+                    if isinstance(source, bool) or not isinstance(source, (str, int)) or \
+                            not str(source) or '/' in str(source):
+                        self.send_error(400, 'Invalid source')
+                        return
+                    self._queue_sync(str(source), tab_data, parser.bytes_read, pipeline)
+                    return
+
+                # Queue the data for Sidekick extension to fetch, in compact
+                # form since it may wait in memory for a while
+                try:
+                    job_id = pending_jobs.put(CompactSnapshot.from_dict(tab_data), parser.bytes_read, job_id)
+                except PayloadTooLarge as e:
+                    self._send_json(413, {'status': 'error', 'error': str(e)})
+                    return
 
                 total_tabs = sum(len(g.get('tabs', [])) for g in groups) + len(ungrouped)
-                logger.info(f"Stored {len(groups)} groups with {total_tabs} tabs for Sidekick extension")
+                logger.info("Stored %s groups with %s tabs for Sidekick extension as job %s (%s dropped by filters)",
+                            len(groups), total_tabs, job_id, sum(pipeline.dropped.values()))
 
                 result = {
                     'status': 'success',
                     'message': f'Stored {total_tabs} tabs from {len(groups)} groups. Open Sidekick extension and click "Fetch from Chrome" to import.',
+                    'jobId': job_id,
                     'groupsCount': len(groups),
                     'tabsCount': total_tabs
                 }
+                result.update(pipeline.report())
+                snapshot_id = self._remember(tab_data, None, job_id)
+                if snapshot_id is not None:
+                    result['snapshotId'] = snapshot_id
 
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(result).encode())
+                self._send_json(200, result)
             else:
                 self.send_error(400, 'Unknown action')
 
         except Exception as e:
-            logger.error(f"Error: {e}", exc_info=True)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({'status': 'error', 'error': str(e)}).encode())
+            logger.error("Error: %s", e, exc_info=True)
+            self._send_json(500, {'status': 'error', 'error': str(e)})
+
+    def _queue_sync(self, source, tab_data, size, pipeline):
+        """
+        Queue `source`'s snapshot so the extension fetches only what changed
+        since its last fetch. There is at most one sync job per source; a
+        newer snapshot replaces an unfetched one.
+        """
+        job_id = f'sync-{source}'
+        diff = sync_tracker.diff(source, tab_data)
+        summary = summarize(diff)
+        result = {'status': 'success', 'jobId': job_id, 'sync': summary}
+        result.update(pipeline.report())
+        snapshot_id = self._remember(tab_data, source, job_id)
+        if snapshot_id is not None:
+            result['snapshotId'] = snapshot_id
+
+        if diff['unchanged']:
+            # The window is back to what the extension has, so an unfetched
+            # sync would only undo that
+            pending_jobs.discard(job_id)
+            result['message'] = 'Nothing changed since the last sync'
+            self._send_json(200, result)
+            return
+
+        try:
+            pending_jobs.put(PendingSync(source, CompactSnapshot.from_dict(tab_data)), size, job_id)
+        except PayloadTooLarge as e:
+            self._send_json(413, {'status': 'error', 'error': str(e)})
+            return
+
+        logger.info("Stored sync of %s as job %s: %s", source, job_id, summary)
+        result['message'] = (f"Stored {summary['tabsAdded']} new, {summary['tabsRemoved']} removed and "
+                             f"{summary['tabsMoved']} moved tabs. Open Sidekick extension to apply them.")
+        self._send_json(200, result)
 
     def log_message(self, format, *args):
-        logger.info(f"{self.address_string()} - {format % args}")
+        logger.info("%s - " + format, self.address_string(), *args)
+
+
+class KeepAliveTabClonerHandler(TabClonerHandler):
+    """TabClonerHandler speaking HTTP/1.1 so clients can reuse connections."""
+
+    protocol_version = 'HTTP/1.1'
+    # Drop idle keep-alive connections after this many seconds
+    timeout = 30
+
+
+ENGINES = {
+    # One request at a time; HTTP/1.0 so an idle client cannot hold the server
+    'single': (HTTPServer, TabClonerHandler),
+    # A thread per connection, with keep-alive
+    'threaded': (ThreadingHTTPServer, KeepAliveTabClonerHandler),
+}
+
+
+def create_server(host='127.0.0.1', port=8768, engine='threaded'):
+    """Build (but do not start) a server using the given engine."""
+    server_class, handler_class = ENGINES[engine]
+    server = server_class((host, port), handler_class)
+    server.daemon_threads = True
+    return server
 
 
-def main():
-    port = 8768
-    server = HTTPServer(('127.0.0.1', port), TabClonerHandler)
-    print(f"Tab Group Cloner server running on http://127.0.0.1:{port}")
-    print("Keep this terminal open while using the extension")
-    print("Press Ctrl+C to stop")
+class UnixHTTPServer(HTTPServer):
+    """
+    HTTPServer on a Unix domain socket that only its owner can connect to.
+
+    Local tools and the native host can skip the TCP loopback stack this
+    way. The socket file is removed again by server_close().
+    """
+
+    address_family = socket.AF_UNIX
+    allow_reuse_address = False
+
+    def server_bind(self):
+        path = self.server_address
+        remove_stale_socket(path)
+        # Create the socket file as 0600 rather than chmod it after bind,
+        # so it is never open to other users
+        old_umask = os.umask(0o177)
+        try:
+            self.socket.bind(path)
+        finally:
+            os.umask(old_umask)
+        self.server_address = self.socket.getsockname()
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixHTTPServer):
+    daemon_threads = True
+
+
+UNIX_SERVERS = {'single': UnixHTTPServer, 'threaded': ThreadingUnixHTTPServer}
+
+
+def remove_stale_socket(path):
+    """
+    Delete a socket file left behind by a server that is gone. Refuses to
+    touch anything that is not a socket, or one a server still answers on.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f'{path} exists and is not a socket')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise OSError(f'Another server is listening on {path}')
+
+
+def create_unix_server(path=DEFAULT_SOCKET_PATH, engine='threaded'):
+    """Build (but do not start) a server on a Unix domain socket, alongside the TCP one."""
+    path = Path(path).expanduser()
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return UNIX_SERVERS[engine](str(path), ENGINES[engine][1])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Tab Group Cloner local relay server')
+    parser.add_argument('--host', default='127.0.0.1', help='address to bind (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8768, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='threaded',
+                        help='request handling engine (default: %(default)s)')
+    parser.add_argument('--db', default=str(DEFAULT_DB_PATH),
+                        help='SQLite file keeping the history of received snapshots (default: %(default)s)')
+    parser.add_argument('--no-history', action='store_true', help='do not keep received snapshots')
+    parser.add_argument('--history-limit', type=int, default=DEFAULT_MAX_SNAPSHOTS, metavar='N',
+                        help='keep only the newest N snapshots, 0 for no limit (default: %(default)s)')
+    parser.add_argument('--log-file', help='also log to this file, rotated as it grows')
+    parser.add_argument('--unix', nargs='?', const=str(DEFAULT_SOCKET_PATH), metavar='PATH',
+                        help='also listen on a Unix domain socket, for local tools (default path: %(const)s)')
+    parser.add_argument('--dedup', choices=['group', 'global'],
+                        help='drop repeated URLs within each group or across the whole snapshot')
+    parser.add_argument('--deny-domain', action='append', default=[], metavar='DOMAIN',
+                        help='never queue tabs from DOMAIN or its subdomains (repeatable)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global snapshot_store
+    args = parse_args(argv)
+    if args.history_limit < 0:
+        sys.exit(f"Invalid --history-limit: {args.history_limit}")
+    if args.dedup:
+        default_filters['dedup'] = args.dedup
+    if args.deny_domain:
+        default_filters['denyDomains'] = args.deny_domain
+
+    # Bind first, so a port or socket already in use leaves nothing to clean up
+    try:
+        server = create_server(args.host, args.port, args.engine)
+    except OSError as e:
+        sys.exit(f"Cannot listen on {args.host}:{args.port}: {e}")
+    unix_server = None
+    if args.unix:
+        try:
+            unix_server = create_unix_server(args.unix, args.engine)
+        except OSError as e:
+            server.server_close()
+            sys.exit(f"Cannot listen on {args.unix}: {e}")
+
+    log_listener = unix_thread = None
     try:
+        log_listener = start_logging(args.log_file, stream=True)
+        if not args.no_history:
+            Path(args.db).parent.mkdir(parents=True, exist_ok=True)
+            snapshot_store = SnapshotStore(args.db, args.history_limit or None)
+        if unix_server is not None:
+            unix_thread = threading.Thread(target=unix_server.serve_forever, name='unix-server', daemon=True)
+            unix_thread.start()
+        print(f"Tab Group Cloner server running on http://{args.host}:{args.port} ({args.engine})")
+        if unix_server is not None:
+            print(f"Also listening on unix:{unix_server.server_address}")
+        print("Keep this terminal open while using the extension")
+        print("Press Ctrl+C to stop")
         server.serve_forever()
     except KeyboardInterrupt:
         print("\nServer stopped")
+    finally:
+        if unix_server is not None:
+            if unix_thread is not None:
+                unix_server.shutdown()
+            unix_server.server_close()
+        server.server_close()
+        if snapshot_store is not None:
+            snapshot_store.close()
+            snapshot_store = None
+        if log_listener is not None:
+            log_listener.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Persistent history of received tab snapshots, stored in SQLite.
+Every snapshot the server accepts is kept so it can be listed, fetched
+and served to the Sidekick extension again later.
+"""
+
+import sqlite3
+import threading
+import time
+
+# Host parameters per statement; SQLite builds before 3.32 allow only 999
+MAX_SQL_PARAMS = 900
+# Snapshots kept by default; older ones are deleted as new ones arrive
+DEFAULT_MAX_SNAPSHOTS = 1000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    received_at REAL NOT NULL,
+    source TEXT,
+    job_id TEXT,
+    group_count INTEGER NOT NULL,
+    tab_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_received ON snapshots (received_at);
+CREATE INDEX IF NOT EXISTS snapshots_source ON snapshots (source);
+CREATE TABLE IF NOT EXISTS tab_groups (
+    id INTEGER PRIMARY KEY,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    chrome_id INTEGER,
+    title TEXT,
+    color TEXT,
+    collapsed INTEGER
+);
+CREATE INDEX IF NOT EXISTS tab_groups_snapshot ON tab_groups (snapshot_id, position);
+CREATE INDEX IF NOT EXISTS tab_groups_title ON tab_groups (title, snapshot_id);
+CREATE TABLE IF NOT EXISTS tabs (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    group_id INTEGER REFERENCES tab_groups (id) ON DELETE CASCADE,
+    url_id INTEGER NOT NULL REFERENCES urls (id),
+    title TEXT,
+    pinned INTEGER,
+    tab_index INTEGER,
+    PRIMARY KEY (snapshot_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tabs_url ON tabs (url_id);
+'''
+
+
+class SnapshotStore:
+    """
+    Tab snapshots in a SQLite database in WAL mode.
+
+    Snapshots are indexed by arrival time, source window and group title;
+    URLs live once in a shared table and tabs refer to them by ID. Each
+    thread gets its own connection, so the request threads of a threaded
+    server read concurrently while one of them writes. Only the newest
+    `max_snapshots` or so are kept (all of them with None).
+    """
+
+    def __init__(self, path, max_snapshots=DEFAULT_MAX_SNAPSHOTS):
+        self.path = str(path)
+        self.max_snapshots = max_snapshots
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # Every thread's connection, so close() can reach them all
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        with self._write_lock:
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit; writes open their own transaction
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def add(self, snapshot, source=None, job_id=None, received_at=None):
+        """Store a `groups`/`ungroupedTabs` snapshot in one transaction; returns its ID."""
+        sections = [(None, snapshot.get('ungroupedTabs', []))]
+        sections.extend((group, group.get('tabs', [])) for group in snapshot.get('groups', []))
+        tab_count = sum(1 for _group, tabs in sections for tab in tabs if tab.get('url'))
+        urls = list({tab['url'] for _group, tabs in sections for tab in tabs if tab.get('url')})
+
+        connection = self._connection()
+        with self._write_lock:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                snapshot_id = connection.execute(
+                    'INSERT INTO snapshots (received_at, source, job_id, group_count, tab_count) VALUES (?, ?, ?, ?, ?)',
+                    (received_at or time.time(), source, job_id, len(sections) - 1, tab_count)
+                ).lastrowid
+                url_ids = self._url_ids(connection, urls)
+
+                rows = []
+                position = 0
+                for group_position, (group, tabs) in enumerate(sections):
+                    group_id = None
+                    if group is not None:
+                        chrome_id = group.get('id')
+                        group_id = connection.execute(
+                            'INSERT INTO tab_groups (snapshot_id, position, chrome_id, title, color, collapsed) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            (snapshot_id, group_position, chrome_id if isinstance(chrome_id, int) else None,
+                             group.get('title'), group.get('color'), _flag(group.get('collapsed')))
+                        ).lastrowid
+                    for tab in tabs:
+                        url = tab.get('url')
+                        if not url:
+                            continue
+                        index = tab.get('index')
+                        rows.append((snapshot_id, position, group_id, url_ids[url], tab.get('title'),
+                                     _flag(tab.get('pinned')), index if isinstance(index, int) else None))
+                        position += 1
+                connection.executemany(
+                    'INSERT INTO tabs (snapshot_id, position, group_id, url_id, title, pinned, tab_index) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                self._prune(connection)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        return snapshot_id
+
+    def _prune(self, connection):
+        """
+        Delete the snapshots beyond `max_snapshots`, and the URLs only they
+        used. Up to a tenth more are let in first, so the URL table is only
+        swept every so often rather than on every add.
+        """
+        if self.max_snapshots is None:
+            return
+        newest = 'SELECT id FROM snapshots ORDER BY id DESC LIMIT 1 OFFSET ?'
+        if connection.execute(newest, (self.max_snapshots + self.max_snapshots // 10,)).fetchone() is None:
+            return
+        row = connection.execute(newest, (self.max_snapshots,)).fetchone()
+        # Their groups and tabs go with them (ON DELETE CASCADE)
+        connection.execute('DELETE FROM snapshots WHERE id <= ?', (row[0],))
+        connection.execute('DELETE FROM urls WHERE NOT EXISTS (SELECT 1 FROM tabs WHERE tabs.url_id = urls.id)')
+
+    def _url_ids(self, connection, urls):
+        """Map each URL to its row in the shared table, adding the missing ones."""
+        connection.executemany('INSERT OR IGNORE INTO urls (url) VALUES (?)', ((url,) for url in urls))
+        ids = {}
+        for start in range(0, len(urls), MAX_SQL_PARAMS):
+            batch = urls[start:start + MAX_SQL_PARAMS]
+            placeholders = ','.join('?' * len(batch))
+            ids.update((url, url_id) for url_id, url in connection.execute(
+                f'SELECT id, url FROM urls WHERE url IN ({placeholders})', batch))
+        return ids
+
+    def list(self, limit=50, before=None, source=None, group=None, since=None, until=None):
+        """
+        Summaries of stored snapshots, newest first.
+
+        Page with `before` (the smallest ID already seen); filter by
+        `source`, by a group `title` the snapshot contains, or by arrival
+        time (`since` <= receivedAt < `until`, in epoch seconds).
+        """
+        clauses = []
+        params = []
+        if before is not None:
+            clauses.append('s.id < ?')
+            params.append(before)
+        if since is not None:
+            clauses.append('s.received_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('s.received_at < ?')
+            params.append(until)
+        if source is not None:
+            clauses.append('s.source = ?')
+            params.append(source)
+        if group is not None:
+            clauses.append('s.id IN (SELECT snapshot_id FROM tab_groups WHERE title = ?)')
+            params.append(group)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        params.append(limit)
+        rows = self._connection().execute(
+            'SELECT s.id, s.received_at, s.source, s.job_id, s.group_count, s.tab_count '
+            f'FROM snapshots s {where} ORDER BY s.id DESC LIMIT ?', params)
+        return [
+            {'id': row[0], 'receivedAt': row[1], 'source': row[2], 'jobId': row[3],
+             'groupsCount': row[4], 'tabsCount': row[5]}
+            for row in rows
+        ]
+
+    def get(self, snapshot_id):
+        """Rebuild a stored snapshot, or return None if there is no such ID."""
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT received_at, source, job_id FROM snapshots WHERE id = ?', (snapshot_id,)).fetchone()
+        if row is None:
+            return None
+
+        groups = {}
+        snapshot = {'groups': [], 'ungroupedTabs': []}
+        for group_id, chrome_id, title, color, collapsed in connection.execute(
+                'SELECT id, chrome_id, title, color, collapsed FROM tab_groups '
+                'WHERE snapshot_id = ? ORDER BY position', (snapshot_id,)):
+            group = {'title': title, 'color': color, 'collapsed': bool(collapsed), 'tabs': []}
+            if chrome_id is not None:
+                group['id'] = chrome_id
+            groups[group_id] = group
+            snapshot['groups'].append(group)
+
+        for group_id, url, title, pinned, tab_index in connection.execute(
+                'SELECT t.group_id, u.url, t.title, t.pinned, t.tab_index FROM tabs t '
+                'JOIN urls u ON u.id = t.url_id WHERE t.snapshot_id = ? ORDER BY t.position', (snapshot_id,)):
+            tab = {'url': url, 'title': title, 'pinned': bool(pinned)}
+            if tab_index is not None:
+                tab['index'] = tab_index
+            if group_id is None:
+                snapshot['ungroupedTabs'].append(tab)
+            else:
+                groups[group_id]['tabs'].append(tab)
+
+        return {'id': snapshot_id, 'receivedAt': row[0], 'source': row[1], 'jobId': row[2], 'data': snapshot}
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM snapshots').fetchone()[0]
+
+    def close(self):
+        """Close every thread's connection; the store cannot be used afterwards."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+
+def _flag(value):
+    return None if value is None else int(bool(value))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the native messaging host.
+Spawns the host the way Chrome does, sends one `status` frame and measures
+the time from spawn to its reply, over several runs.
+
+    python bench_startup.py --runs 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HOST = Path(__file__).resolve().parent / 'tab_cloner_host.py'
+
+
+def send_message(process, message):
+    encoded = json.dumps(message).encode('utf-8')
+    process.stdin.write(struct.pack('I', len(encoded)))
+    process.stdin.write(encoded)
+    process.stdin.flush()
+
+
+def read_message(process):
+    length_bytes = process.stdout.read(4)
+    if len(length_bytes) < 4:
+        return None
+    length = struct.unpack('I', length_bytes)[0]
+    return json.loads(process.stdout.read(length))
+
+
+def time_first_reply(env):
+    """Seconds from spawning the host to reading its first reply."""
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, str(HOST)], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               env=env)
+    try:
+        send_message(process, {'action': 'status', 'requestId': 'bench'})
+        reply = read_message(process)
+        elapsed = time.perf_counter() - started
+        if reply is None or reply.get('status') != 'success':
+            raise RuntimeError(f'Unexpected reply: {reply}')
+        return elapsed
+    finally:
+        process.stdin.close()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure native host time to first reply')
+    parser.add_argument('--runs', type=int, default=10, help='Number of host launches (default: 10)')
+    parser.add_argument('--no-prewarm', action='store_true', help='Disable the background pre-warm')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.no_prewarm:
+        env['TAB_CLONER_PREWARM'] = '0'
+
+    # The first launch fills the OS and bytecode caches; leave it out
+    time_first_reply(env)
+    samples = sorted(time_first_reply(env) * 1000 for _ in range(args.runs))
+    print(f"Time to first reply over {args.runs} runs: "
+          f"min {samples[0]:.1f} ms, median {statistics.median(samples):.1f} ms, max {samples[-1]:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
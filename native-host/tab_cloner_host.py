@@ -5,250 +5,2203 @@ Receives tab group data from Chrome and clones them to Sidekick browser.
 Uses Playwright for browser automation (no manual driver installation needed).
 """
 
-# Early startup logging - write immediately to catch any issues
+# Chrome starts a fresh process for every connectNative, so only what the
+# first reply needs is imported here. asyncio (the bulk of the import time)
+# and the compression modules load on first use; see _lazy_import.
 import os
-from pathlib import Path
-_early_log = Path.home() / 'tab_cloner_host.log'
-with open(_early_log, 'a') as f:
-    f.write(f"Script starting at {__file__}\n")
-
 import sys
+import collections
+import importlib.util
 import json
+import queue
 import struct
 import logging
-import subprocess
+import threading
 import time
-import platform
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from tab_pipeline import build_pipeline
+from tab_sync import SnapshotState, UNGROUPED, summarize
+from tab_logging import PayloadSummary, start_logging
+from tab_metrics import MetricsRegistry, SIZE_BUCKETS
+
+
+def _lazy_import(name):
+    """
+    Return module `name`, executed on first attribute access rather than now.
+
+    Returns None if the module is not installed, so optional dependencies
+    can be checked without paying for their import.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+_lazy_lock = threading.Lock()
+
+
+def _finish_import(*modules):
+    """
+    Run the deferred import of _lazy_import'ed `modules` now, one thread at
+    a time. Before Python 3.12 LazyLoader is not thread-safe: a thread that
+    touches a module while another is still executing it can find it half
+    initialized. So any thread that may be the first to use one calls this
+    beforehand.
+    """
+    with _lazy_lock:
+        for module in modules:
+            if module is not None:
+                module.__name__
 
-# Configure logging
-logging.basicConfig(
-    filename=str(Path.home() / 'tab_cloner_host.log'),
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 
-# Sidekick browser paths (platform-specific)
+asyncio = _lazy_import('asyncio')
+zstandard = _lazy_import('zstandard')
+
+# Configure logging: records are written by a listener thread to a
+# size-capped, rotated file, opened by the first record rather than at import
+LOG_FILE = Path.home() / 'tab_cloner_host.log'
+log_listener = start_logging(LOG_FILE)
+
+# Sidekick browser paths (platform-specific), tried in order; entries with
+# a * are globbed, for package managers that name the launcher by app ID
 SIDEKICK_PATHS = {
-    'darwin': '/Applications/Sidekick.app/Contents/MacOS/Sidekick',
-    'win32': r'C:\Program Files\Sidekick\Application\sidekick.exe',
-    'linux': '/usr/bin/sidekick'
+    'darwin': [
+        '/Applications/Sidekick.app/Contents/MacOS/Sidekick',
+        '~/Applications/Sidekick.app/Contents/MacOS/Sidekick',
+    ],
+    'win32': [
+        r'C:\Program Files\Sidekick\Application\sidekick.exe',
+        r'C:\Program Files (x86)\Sidekick\Application\sidekick.exe',
+        r'%LOCALAPPDATA%\Sidekick\Application\sidekick.exe',
+    ],
+    'linux': [
+        '/usr/bin/sidekick',
+        '/usr/local/bin/sidekick',
+        '/opt/sidekick/sidekick',
+        '/snap/bin/sidekick',
+        '/var/lib/flatpak/exports/bin/*[Ss]idekick*',
+        '~/.local/share/flatpak/exports/bin/*[Ss]idekick*',
+    ]
 }
+# Overrides the search (a request's `sidekickPath` option wins over it)
+SIDEKICK_PATH_ENV = 'SIDEKICK_PATH'
+# Where the last binary found is remembered between host processes
+SIDEKICK_CACHE_FILE = Path.home() / '.tab_cloner' / 'sidekick.json'
+
+# Page loads kept in flight at once when a request does not specify one
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 32
+NAVIGATION_TIMEOUT_MS = 30000
+# What a page load waits for before the tab counts as open
+WAIT_POLICIES = ('commit', 'domcontentloaded', 'load')
+DEFAULT_WAIT_UNTIL = 'domcontentloaded'
+# Bounds of the per-tab timeout derived from past load times, and the
+# samples needed before it is trusted over NAVIGATION_TIMEOUT_MS
+MIN_TAB_TIMEOUT_MS = 5000
+MIN_LATENCY_SAMPLES = 5
+# Load times kept per host (and wait policy) across runs
+LATENCY_FILE = Path.home() / '.tab_cloner' / 'latency.json'
+MAX_LATENCY_HOSTS = 2000
+# Tabs created ahead of their page load, so loads for other hosts can start
+# while one host is being held back
+LOOKAHEAD_TABS = 16
+# Per-host limits on page loads: how many at once, how many per second
+# (with bursts of up to PER_HOST_BURST), and retries after 429/503 or a
+# dropped connection, backing off exponentially from RETRY_BASE_SECONDS
+DEFAULT_PER_HOST_CONCURRENCY = 2
+DEFAULT_PER_HOST_RATE = 4.0
+PER_HOST_BURST = 4
+DEFAULT_RETRIES = 2
+RETRY_BASE_SECONDS = 1.0
+MAX_RETRY_DELAY_SECONDS = 30.0
+RETRY_STATUSES = frozenset([429, 503])
+RETRYABLE_NET_ERRORS = ('ERR_CONNECTION_RESET', 'ERR_CONNECTION_CLOSED', 'ERR_EMPTY_RESPONSE',
+                        'ERR_NETWORK_CHANGED', 'ERR_HTTP2_PROTOCOL_ERROR')
+# Requests (clones) handled at the same time
+MAX_WORKERS = 4
+# Job IDs double as journal file names
+JOB_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+# Where clone jobs checkpoint their progress, and how long a journal that
+# was never resumed is kept
+JOURNAL_DIR = Path.home() / '.tab_cloner' / 'jobs'
+JOURNAL_MAX_AGE_SECONDS = 7 * 24 * 3600
+# Minimum seconds between progress frames when a request asks for them
+DEFAULT_PROGRESS_INTERVAL = 0.5
+
+# Set to 0 to skip warming up Playwright and the Sidekick lookup after the
+# first message
+PREWARM_ENV = 'TAB_CLONER_PREWARM'
+
+# Chrome rejects host -> extension messages larger than 1 MB
+MAX_OUTBOUND_MESSAGE_BYTES = 1024 * 1024
+# Payload characters per frame when an envelope has to be split; an identity
+# payload can double in size when escaped into the frame's JSON
+ENVELOPE_PART_CHARS = 480 * 1024
+# Upper bound on a decompressed envelope
+MAX_ENVELOPE_BYTES = 256 * 1024 * 1024
+# Limits on multi-part envelopes still waiting for parts: their payload
+# characters all together, and how long one may wait for its next part
+MAX_PENDING_ENVELOPE_CHARS = MAX_ENVELOPE_BYTES
+ENVELOPE_PART_TIMEOUT_SECONDS = 60
+# A chunked transfer fails when no frame arrives for this long, or when this
+# many chunks are held waiting for an earlier one
+TRANSFER_IDLE_TIMEOUT_SECONDS = 60
+MAX_OUT_OF_ORDER_CHUNKS = 32
+
+
+# Timings answered by the getStats action
+metrics = MetricsRegistry()
+frame_decode_seconds = metrics.histogram(
+    'tab_cloner_host_frame_decode_seconds',
+    'Time to read and decode an incoming frame once its length has arrived (stage=frame), '
+    'and to unpack an envelope (stage=envelope)', ('stage',))
+frame_bytes = metrics.histogram('tab_cloner_host_frame_bytes', 'Size of incoming frames', buckets=SIZE_BUCKETS)
+browser_start_seconds = metrics.histogram(
+    'tab_cloner_host_browser_start_seconds', 'Time to launch Sidekick (mode=launch) or attach over CDP (mode=cdp)',
+    ('mode',))
+navigation_seconds = metrics.histogram(
+    'tab_cloner_host_navigation_seconds', 'Latency of each page.goto attempt, by outcome', ('result',))
+request_seconds = metrics.histogram(
+    'tab_cloner_host_request_seconds', 'Time to handle a clone request, by action and status', ('action', 'status'))
+
+
+class LaunchError(Exception):
+    """Raised when the Sidekick browser cannot be started."""
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        import gzip
+        return gzip.compress(data, compresslevel=6)
+    if encoding == 'zstd' and zstandard is not None:
+        _finish_import(zstandard)
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f'Unsupported envelope encoding: {encoding}')
 
 
-def send_message(message):
-    """Send a message to Chrome extension via stdout."""
+def _decompress(data, encoding):
+    if encoding == 'gzip':
+        import zlib
+        decompressor = zlib.decompressobj(wbits=31)
+        result = decompressor.decompress(data, MAX_ENVELOPE_BYTES)
+        if decompressor.unconsumed_tail:
+            raise ValueError(f'Envelope decompresses to more than {MAX_ENVELOPE_BYTES} bytes')
+        return result
+    if encoding == 'zstd' and zstandard is not None:
+        _finish_import(zstandard)
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=MAX_ENVELOPE_BYTES)
+    raise ValueError(f'Unsupported envelope encoding: {encoding}')
+
+
+def encode_envelope(message, encoding='identity'):
+    """Serialize a message into an envelope payload string."""
+    text = json.dumps(message)
+    if encoding == 'identity':
+        return text
+    import base64
+    return base64.b64encode(_compress(text.encode('utf-8'), encoding)).decode('ascii')
+
+
+def decode_envelope(payload, encoding):
+    """Inverse of encode_envelope."""
+    if encoding == 'identity':
+        return json.loads(payload)
+    import base64
+    return json.loads(_decompress(base64.b64decode(payload), encoding).decode('utf-8'))
+
+
+# Serializes writers: replies come from worker threads and the browser loop
+_write_lock = threading.RLock()
+
+
+def _write_frame(encoded_message):
+    with _write_lock:
+        sys.stdout.buffer.write(struct.pack('I', len(encoded_message)))
+        sys.stdout.buffer.write(encoded_message)
+        sys.stdout.buffer.flush()
+
+
+def send_message(message, compress=None):
+    """
+    Send a message to Chrome extension via stdout.
+
+    With `compress` ('gzip' or 'zstd') the message goes out as a compressed
+    envelope. Anything that would exceed Chrome's 1 MB limit on messages to
+    the extension is split into several envelope parts sharing a
+    transferId, which the extension concatenates before decoding.
+    """
     encoded_message = json.dumps(message).encode('utf-8')
-    sys.stdout.buffer.write(struct.pack('I', len(encoded_message)))
-    sys.stdout.buffer.write(encoded_message)
-    sys.stdout.buffer.flush()
-    logging.info(f"Sent message: {message}")
+    if not compress and len(encoded_message) <= MAX_OUTBOUND_MESSAGE_BYTES:
+        _write_frame(encoded_message)
+    else:
+        encoding = compress or 'identity'
+        payload = encode_envelope(message, encoding)
+        parts = max(1, -(-len(payload) // ENVELOPE_PART_CHARS))
+        import uuid
+        transfer_id = uuid.uuid4().hex
+        # Keep the parts of one message together
+        with _write_lock:
+            for part in range(parts):
+                piece = payload[part * ENVELOPE_PART_CHARS:(part + 1) * ENVELOPE_PART_CHARS]
+                _write_frame(json.dumps({
+                    'envelope': encoding,
+                    'transferId': transfer_id,
+                    'part': part,
+                    'parts': parts,
+                    'payload': piece
+                }).encode('utf-8'))
+    logging.info("Sent message: %s", PayloadSummary(message, encoded_message))
 
 def _read_exact(stream, size):
     """Read exactly size bytes from stream or return None on EOF."""
-    chunks = []
-    remaining = size
-    while remaining > 0:
-        chunk = stream.read(remaining)
-        if not chunk:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    filled = 0
+    while filled < size:
+        count = stream.readinto(view[filled:])
+        if not count:
             return None
-        chunks.append(chunk)
-        remaining -= len(chunk)
-    return b''.join(chunks)
+        filled += count
+    return buffer
 
-def read_message():
-    """Read a message from Chrome extension via stdin."""
+def _read_frame():
+    """Read one length-prefixed JSON frame from stdin as (frame, raw bytes), or None on EOF."""
     # Read the message length (first 4 bytes)
     text_length_bytes = _read_exact(sys.stdin.buffer, 4)
     if not text_length_bytes:
         return None
 
+    started = time.perf_counter()
     text_length = struct.unpack('I', text_length_bytes)[0]
     text_bytes = _read_exact(sys.stdin.buffer, text_length)
     if text_bytes is None:
         return None
-    text = text_bytes.decode('utf-8')
-    message = json.loads(text)
-    logging.info(f"Received message: {message}")
+    frame = json.loads(text_bytes)
+    frame_decode_seconds.observe(time.perf_counter() - started, stage='frame')
+    frame_bytes.observe(text_length)
+    return frame, text_bytes
+
+class PartialEnvelope:
+    """The parts of a multi-part envelope received so far."""
+
+    __slots__ = ('parts', 'received', 'chars', 'updated')
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.received = {}
+        self.chars = 0
+        self.updated = time.monotonic()
+
+
+# Multi-part envelopes missing parts, by transferId. Other frames may arrive
+# between parts, so this outlives each read_message() call; only the reader
+# thread touches it.
+partial_envelopes = {}
+
+
+def _drop_envelope(transfer_id, reason):
+    partial_envelopes.pop(transfer_id, None)
+    logging.warning("Dropped envelope %s: %s", transfer_id, reason)
+    send_message({'status': 'error', 'transferId': transfer_id, 'error': f'Envelope {transfer_id} {reason}'})
+
+
+def _collect_envelope_part(frame):
+    """Add one part of a multi-part envelope; returns the whole payload once every part is in, else None."""
+    now = time.monotonic()
+    for transfer_id, partial in list(partial_envelopes.items()):
+        if now - partial.updated > ENVELOPE_PART_TIMEOUT_SECONDS:
+            _drop_envelope(transfer_id, f'timed out with {len(partial.received)} of {partial.parts} parts')
+
+    transfer_id = frame.get('transferId')
+    parts = frame['parts']
+    part = frame.get('part')
+    partial = partial_envelopes.get(transfer_id)
+    if partial is None and isinstance(parts, int):
+        partial = partial_envelopes[transfer_id] = PartialEnvelope(parts)
+    if partial is None or parts != partial.parts or not isinstance(part, int) or not 0 <= part < parts:
+        _drop_envelope(transfer_id, f'has an invalid part {part!r} of {parts!r}')
+        return None
+    payload = frame['payload']
+    partial.chars += len(payload) - len(partial.received.get(part, ''))
+    partial.received[part] = payload
+    partial.updated = now
+    if sum(p.chars for p in partial_envelopes.values()) > MAX_PENDING_ENVELOPE_CHARS:
+        _drop_envelope(transfer_id, f'would hold more than {MAX_PENDING_ENVELOPE_CHARS} characters in parts')
+        return None
+    if len(partial.received) < partial.parts:
+        return None
+    del partial_envelopes[transfer_id]
+    return ''.join(partial.received[i] for i in range(partial.parts))
+
+
+def read_message():
+    """
+    Read a message from Chrome extension via stdin.
+
+    Envelope frames (see send_message) are unwrapped; multi-part envelopes
+    are collected until every part has arrived, while other frames are
+    returned in between.
+    """
+    while True:
+        read = _read_frame()
+        if read is None:
+            return None
+        frame, raw = read
+        if not isinstance(frame, dict) or 'envelope' not in frame:
+            message = frame
+            break
+
+        encoding = frame['envelope']
+        parts = frame.get('parts', 1)
+        if parts == 1:
+            raw = frame['payload']
+        else:
+            raw = _collect_envelope_part(frame)
+            if raw is None:
+                continue
+        started = time.perf_counter()
+        message = decode_envelope(raw, encoding)
+        frame_decode_seconds.observe(time.perf_counter() - started, stage='envelope')
+        break
+
+    logging.info("Received message: %s", PayloadSummary(message, raw))
     return message
 
 
-def find_sidekick_binary():
-    """Find the Sidekick browser binary."""
-    system = platform.system().lower()
+def start_reader():
+    """
+    Read and decode frames on a background thread.
 
-    if system == 'darwin':
-        path = SIDEKICK_PATHS['darwin']
-    elif system == 'windows':
-        path = SIDEKICK_PATHS['win32']
-    else:
-        path = SIDEKICK_PATHS['linux']
+    Returns a queue of decoded messages. EOF is signalled with None; a frame
+    that cannot be decoded ends the stream with the exception instead.
+    """
+    inbox = queue.Queue()
 
-    if Path(path).exists():
-        return path
+    def run():
+        try:
+            while True:
+                message = read_message()
+                inbox.put(message)
+                if message is None:
+                    return
+        except Exception as e:
+            inbox.put(e)
 
-    # Try to find via which command (macOS/Linux)
+    threading.Thread(target=run, name='frame-reader', daemon=True).start()
+    return inbox
+
+
+def _binary_mtime(path):
+    """Modification time of an executable file, or None if it is not one."""
     try:
-        result = subprocess.run(['which', 'sidekick'], capture_output=True, text=True)
-        if result.returncode == 0:
-            return result.stdout.strip()
-    except:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path) or not os.access(path, os.X_OK):
+        return None
+    return stat.st_mtime
+
+
+def _search_sidekick_binary():
+    """Look for Sidekick in the usual install locations, then on PATH."""
+    import glob
+    import shutil
+    platform_key = 'win32' if sys.platform == 'win32' else 'darwin' if sys.platform == 'darwin' else 'linux'
+    for candidate in SIDEKICK_PATHS[platform_key]:
+        candidate = os.path.expandvars(os.path.expanduser(candidate))
+        for path in sorted(glob.glob(candidate)) if '*' in candidate else [candidate]:
+            if _binary_mtime(path) is not None:
+                return path
+    return shutil.which('sidekick') or shutil.which('Sidekick')
+
+
+def _read_sidekick_cache():
+    try:
+        with open(SIDEKICK_CACHE_FILE) as f:
+            cached = json.load(f)
+        return cached['path'], cached['mtime']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+
+def _write_sidekick_cache(path, mtime):
+    try:
+        SIDEKICK_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        temp = SIDEKICK_CACHE_FILE.with_suffix('.tmp')
+        with open(temp, 'w') as f:
+            json.dump({'path': path, 'mtime': mtime}, f)
+        os.replace(temp, SIDEKICK_CACHE_FILE)
+    except OSError as e:
+        logging.warning("Cannot cache Sidekick location: %s", e)
+
+
+def find_sidekick_binary(override=None):
+    """
+    Find the Sidekick browser binary.
+
+    `override` (or $SIDEKICK_PATH) names it outright. Otherwise the last
+    binary found is remembered in SIDEKICK_CACHE_FILE with its mtime, so a
+    later host process only needs a stat to trust it; the install
+    locations are searched again only if it has gone away. Returns None if
+    Sidekick cannot be found.
+    """
+    override = override or os.environ.get(SIDEKICK_PATH_ENV)
+    if override:
+        return override if _binary_mtime(override) is not None else None
+
+    path, mtime = _read_sidekick_cache()
+    if path is not None:
+        current = _binary_mtime(path)
+        if current is not None:
+            if current != mtime:
+                # Updated in place; still the same install
+                logging.info("Sidekick at %s has changed since it was found", path)
+                _write_sidekick_cache(path, current)
+            return path
+
+    path = _search_sidekick_binary()
+    if path is not None:
+        _write_sidekick_cache(path, _binary_mtime(path))
+    return path
+
+
+def prewarm():
+    """
+    Do the slow parts of a first clone ahead of time: import asyncio and
+    Playwright, start the session's event loop and look up Sidekick.
+
+    Runs on a background thread once the first message has been handled,
+    so it never delays that reply.
+    """
+    started = time.monotonic()
+    try:
+        _finish_import(asyncio)
+        get_session()
+        import playwright.async_api  # noqa: F401
+    except ImportError:
         pass
+    except Exception as e:
+        logging.warning("Pre-warm failed: %s", e)
+        return
+    if not os.environ.get('SIDEKICK_CDP_URL'):
+        find_sidekick_binary()
+    logging.debug("Pre-warmed in %.3fs", time.monotonic() - started)
+
+
+def start_prewarm():
+    if os.environ.get(PREWARM_ENV, '1') != '0':
+        threading.Thread(target=prewarm, name='prewarm', daemon=True).start()
+
+
+def collect_urls(tab_group_data):
+    """
+    Flatten tab group data into an ordered list of (group_title, url, title).
+
+    Run the data through a TabPipeline first; this does no filtering itself.
+    """
+    groups = tab_group_data.get('groups', [])
+    ungrouped_tabs = tab_group_data.get('ungroupedTabs', [])
+
+    all_urls = []
+
+    # Add ungrouped tabs
+    for tab_data in ungrouped_tabs:
+        url = tab_data.get('url', '')
+        if url:
+            all_urls.append(('ungrouped', url, tab_data.get('title', '')))
+
+    # Add grouped tabs
+    for group in groups:
+        group_title = group.get('title', 'Untitled')
+        group_tabs = group.get('tabs', [])
+
+        for tab_data in group_tabs:
+            url = tab_data.get('url', '')
+            if url:
+                all_urls.append((group_title, url, tab_data.get('title', '')))
+
+    return all_urls
 
-    return None
 
+def get_concurrency(options):
+    """Read the number of page loads to keep in flight from request options."""
+    concurrency = options.get('concurrency', DEFAULT_CONCURRENCY)
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int):
+        raise ValueError(f'Invalid concurrency: {concurrency!r}')
+    return max(1, min(concurrency, MAX_CONCURRENCY))
 
-def clone_tabs_to_sidekick(tab_group_data):
-    """Clone tab groups to Sidekick browser using Playwright."""
+
+def get_schedule(options):
+    """Read per-host load limits from request options, as HostScheduler arguments."""
+    per_host = options.get('perHostConcurrency', DEFAULT_PER_HOST_CONCURRENCY)
+    if isinstance(per_host, bool) or not isinstance(per_host, int) or per_host < 1:
+        raise ValueError(f'Invalid perHostConcurrency: {per_host!r}')
+    # None or 0 means no rate limit
+    rate = options.get('perHostRate', DEFAULT_PER_HOST_RATE)
+    if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate < 0):
+        raise ValueError(f'Invalid perHostRate: {rate!r}')
+    retries = options.get('retries', DEFAULT_RETRIES)
+    if isinstance(retries, bool) or not isinstance(retries, int) or retries < 0:
+        raise ValueError(f'Invalid retries: {retries!r}')
+    return {'per_host': per_host, 'rate': rate or None, 'retries': retries}
+
+
+def get_navigation_policy(options):
+    """Build the NavigationPolicy a request asks for."""
+    wait_until = options.get('waitUntil', DEFAULT_WAIT_UNTIL)
+    if wait_until not in WAIT_POLICIES:
+        raise ValueError(f'Invalid waitUntil: {wait_until!r}')
+    tab_timeout = options.get('tabTimeout', 'auto')
+    if tab_timeout != 'auto' and (isinstance(tab_timeout, bool) or not isinstance(tab_timeout, int)
+                                  or tab_timeout <= 0):
+        raise ValueError(f'Invalid tabTimeout: {tab_timeout!r}')
+    deadline = options.get('deadline')
+    if deadline is not None and (isinstance(deadline, bool) or not isinstance(deadline, (int, float))
+                                 or deadline <= 0):
+        raise ValueError(f'Invalid deadline: {deadline!r}')
+    return NavigationPolicy(wait_until, None if tab_timeout == 'auto' else tab_timeout, deadline)
+
+
+def make_eager_check(options):
+    """
+    Decide which tabs are navigated immediately.
+
+    Returns a function called once per tab, in order, with the tab's group
+    name. Without `lazy` every tab loads. In lazy mode only the first
+    `eagerPerGroup` tabs of each group (ungrouped tabs count as one group)
+    load; the rest become placeholders.
+    """
+    if not options.get('lazy'):
+        return lambda group_name: True
+
+    eager_per_group = options.get('eagerPerGroup', 0)
+    if isinstance(eager_per_group, bool) or not isinstance(eager_per_group, int) or eager_per_group < 0:
+        raise ValueError(f'Invalid eagerPerGroup: {eager_per_group!r}')
+
+    seen = {}
+
+    def is_eager(group_name):
+        count = seen.get(group_name, 0)
+        seen[group_name] = count + 1
+        return count < eager_per_group
+
+    return is_eager
+
+
+def placeholder_html(url, title):
+    """
+    Build a placeholder page for a lazily cloned tab.
+
+    The page carries the original title and navigates to the real URL the
+    first time the tab is brought to the foreground (or when clicked), so
+    untouched tabs never fetch anything or spin up a full renderer. The
+    script reads the URL from the link, so no URL text ends up inside it.
+    """
+    import html
+    label = html.escape(title or url)
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f'<title>{label}</title></head>'
+        '<body style="font-family:sans-serif;margin:2em;color:#555">'
+        f'<p>{label}</p><p><a id="load" href="{html.escape(url)}">{html.escape(url)}</a></p>'
+        '<script>'
+        'const target = document.getElementById("load").getAttribute("href");'
+        'let seenHidden = document.visibilityState !== "visible";'
+        'document.addEventListener("visibilitychange", () => {'
+        '  if (document.visibilityState !== "visible") { seenHidden = true; }'
+        '  else if (seenHidden) { location.replace(target); }'
+        '});'
+        '</script></body></html>'
+    )
+
+
+async def iterate(entries):
+    """Adapt a plain list of URL entries to the async iteration open_tabs expects."""
+    for entry in entries:
+        yield entry
+
+
+class LatencyHistory:
+    """
+    Smoothed page load times per host and wait policy, kept across runs.
+
+    Works like TCP's retransmission timer: each host keeps a moving average
+    of its load times and of their deviation, and its timeout is the
+    average plus four deviations. Hosts without enough samples fall back to
+    the same estimate over all hosts.
+    """
+
+    def __init__(self, path=LATENCY_FILE):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def record(self, host, wait_until, seconds):
+        entries = self._load()
+        for key in (f'{wait_until} {host}', f'{wait_until} *'):
+            entry = entries.pop(key, None)
+            if entry is None:
+                entry = {'avg': seconds, 'dev': seconds / 2, 'n': 0}
+            else:
+                error = seconds - entry['avg']
+                entry['avg'] += error / 8
+                entry['dev'] += (abs(error) - entry['dev']) / 4
+            entry['n'] += 1
+            # Re-inserted last, so the least recently seen hosts go first
+            entries[key] = entry
+        while len(entries) > MAX_LATENCY_HOSTS:
+            del entries[next(iter(entries))]
+        self._dirty = True
+
+    def timeout_ms(self, host, wait_until):
+        """Suggested timeout for a load, or None while there is too little history."""
+        entries = self._load()
+        for key in (f'{wait_until} {host}', f'{wait_until} *'):
+            entry = entries.get(key)
+            if entry is not None and entry['n'] >= MIN_LATENCY_SAMPLES:
+                timeout = (entry['avg'] + 4 * entry['dev']) * 1000
+                return int(min(max(timeout, MIN_TAB_TIMEOUT_MS), NAVIGATION_TIMEOUT_MS))
+        return None
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp = self.path.with_suffix('.tmp')
+            with open(temp, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(temp, self.path)
+            self._dirty = False
+        except OSError as e:
+            logging.warning("Cannot save load times: %s", e)
+
+
+# Only touched from the session's event loop
+latency_history = LatencyHistory()
+
+
+class NavigationPolicy:
+    """
+    How long a clone waits for each page.
+
+    `wait_until` is the Playwright load state a tab must reach. Each tab
+    gets `tab_timeout` ms, or with None a timeout derived from past load
+    times of its host. With a `deadline` (seconds for the whole clone), no
+    tab waits past it, and tabs reached afterwards are navigated without
+    waiting at all. A tab that runs out of time stays open and keeps
+    loading; it is reported as `started` rather than failed.
+    """
+
+    def __init__(self, wait_until=DEFAULT_WAIT_UNTIL, tab_timeout=None, deadline=None, history=None):
+        self.wait_until = wait_until
+        self.tab_timeout = tab_timeout
+        self.history = history if history is not None else latency_history
+        self.deadline = time.monotonic() + deadline if deadline is not None else None
+
+    def remaining(self):
+        """Seconds left before the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def host_timeout_ms(self, host):
+        """The wait for a page of `host`, before the deadline is taken into account."""
+        return self.tab_timeout or self.history.timeout_ms(host, self.wait_until) or NAVIGATION_TIMEOUT_MS
+
+    def timeout_ms(self, host):
+        timeout = self.host_timeout_ms(host)
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = min(timeout, max(1, int(remaining * 1000)))
+        return timeout
+
+    def record(self, host, seconds):
+        self.history.record(host, self.wait_until, seconds)
+
+
+class HostLimiter:
+    """Concurrency cap and token bucket for the page loads of one host."""
+
+    def __init__(self, concurrency, rate):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.rate = rate
+        self.tokens = PER_HOST_BURST
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def take_token(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.rate is None:
+                return
+            self.tokens = min(PER_HOST_BURST, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Hold back every load of this host, e.g. after it answered 429."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class HostScheduler:
+    """
+    Spreads page loads over hosts.
+
+    At most `concurrency` loads run in total and `per_host` per host, and
+    each host gets loads at no more than `rate` per second. A load waits
+    for its host before taking one of the overall slots, so tabs for a busy
+    host never hold up the others. Loads answered with 429/503, or whose
+    connection dropped, are retried up to `retries` times with exponential
+    backoff (or the server's Retry-After), pausing the whole host.
+    """
+
+    def __init__(self, concurrency, per_host=DEFAULT_PER_HOST_CONCURRENCY, rate=DEFAULT_PER_HOST_RATE,
+                 retries=DEFAULT_RETRIES, policy=None):
+        self.loading = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.rate = rate
+        self.retries = retries
+        self.policy = policy or NavigationPolicy()
+        self._hosts = {}
+
+    def limiter(self, host):
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = self._hosts[host] = HostLimiter(self.per_host, self.rate)
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, limiter):
+        async with limiter.slots:
+            await limiter.take_token()
+            async with self.loading:
+                yield
+
+    async def navigate(self, page, url):
+        """
+        Load `url` in `page` within the host's limits, retrying as needed.
+
+        Returns (response, retries used). Load times are recorded with the
+        navigation policy, which also sets what to wait for and how long.
+        """
+        host = host_of(url)
+        limiter = self.limiter(host)
+        policy = self.policy
+        attempt = 0
+        while True:
+            retry_after = None
+            async with self.slot(limiter):
+                timeout = policy.timeout_ms(host)
+                cut_short = timeout < policy.host_timeout_ms(host)
+                started = time.monotonic()
+                try:
+                    response = await page.goto(url, wait_until=policy.wait_until, timeout=timeout)
+                    elapsed = time.monotonic() - started
+                    policy.record(host, elapsed)
+                    failed = response is not None and response.status >= 400
+                    navigation_seconds.observe(elapsed, result='http_error' if failed else 'ok')
+                except Exception as e:
+                    timed_out = is_navigation_timeout(e)
+                    navigation_seconds.observe(time.monotonic() - started, result='timeout' if timed_out else 'error')
+                    if timed_out:
+                        # Too slow for this policy: make the next estimate more
+                        # patient. A wait the deadline cut short says nothing
+                        # about the host, and would drag the estimate down.
+                        if not cut_short:
+                            policy.record(host, timeout / 1000)
+                        raise
+                    if attempt >= self.retries or not any(code in str(e) for code in RETRYABLE_NET_ERRORS):
+                        raise
+                else:
+                    status = response.status if response is not None else None
+                    if status not in RETRY_STATUSES or attempt >= self.retries:
+                        return response, attempt
+                    retry_after = response.headers.get('retry-after')
+
+            delay = self.backoff(attempt, retry_after)
+            limiter.pause(delay)
+            logging.info("Retrying %s in %.1fs", url, delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def load_in_background(self, page, url):
+        """
+        Start loading `url` in `page` within the host's limits, waiting only
+        for the navigation to commit. The deadline does not apply, and as
+        nothing waited for the page, its load time is not recorded.
+        """
+        async with self.slot(self.limiter(host_of(url))):
+            await page.goto(url, wait_until='commit', timeout=NAVIGATION_TIMEOUT_MS)
+
+    def start(self, page, url):
+        """Navigate `page` in the background, without waiting for the load."""
+        task = asyncio.ensure_future(self.load_in_background(page, url))
+        _background_loads.add(task)
+        task.add_done_callback(_background_load_done)
+
+    @staticmethod
+    def backoff(attempt, retry_after=None):
+        """Seconds to wait before retry number `attempt + 1`."""
+        if retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0.0), MAX_RETRY_DELAY_SECONDS)
+            except ValueError:
+                pass  # An HTTP date; fall back to our own schedule
+        delay = RETRY_BASE_SECONDS * (2 ** attempt)
+        import random
+        return min(delay * random.uniform(0.5, 1.0), MAX_RETRY_DELAY_SECONDS)
+
+
+# Loads started after a clone's deadline, which outlive the clone
+_background_loads = set()
+
+
+def _background_load_done(task):
+    _background_loads.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.info("Background load failed: %s", task.exception())
+
+
+def host_of(url):
     try:
-        from playwright.sync_api import sync_playwright
+        return urlsplit(url).hostname or ''
+    except ValueError:
+        return ''
+
+
+def is_navigation_timeout(error):
+    """Whether `error` is Playwright giving up waiting on a navigation."""
+    try:
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
     except ImportError:
+        return False
+    return isinstance(error, PlaywrightTimeoutError)
+
+
+async def open_tabs(context, entries, concurrency, is_eager=None, progress=None, cancelled=None, journal=None,
+                    pages=None, schedule=None, policy=None):
+    """
+    Open URLs in new tabs, keeping up to `concurrency` page loads in flight.
+
+    `entries` is an async iterable of (group_title, url, title), so tabs can
+    start opening before the whole snapshot has arrived. Pages are created
+    in that order so the tab strip matches the snapshot; only the
+    navigations overlap, scheduled across hosts by a HostScheduler built
+    from `schedule` (see get_schedule), and wait as the NavigationPolicy
+    `policy` says. Tabs for which `is_eager(group_title)` is false get a
+    placeholder instead of loading the URL. `progress`, if given, is a
+    ProgressReporter told about each tab, and `journal` a JobJournal that
+    checkpoints each opened tab. Once the `cancelled` event is set no
+    further tabs are opened. Returns one result per URL opened, in the
+    same order as `entries`; if a `pages` list is given, the page of each
+    result (None if it could not be created) is appended to it.
+    """
+    results = []
+    scheduler = HostScheduler(concurrency, policy=policy, **(schedule or {}))
+    # Tabs created but not yet loaded; serial mode keeps strictly one
+    slots = asyncio.Semaphore(concurrency + LOOKAHEAD_TABS if concurrency > 1 else 1)
+    if is_eager is None:
+        is_eager = lambda group_name: True
+
+    async def load(index, page, group_name, url, title, eager):
+        result = {'group': group_name, 'url': url, 'title': title}
+        try:
+            if eager and scheduler.policy.expired():
+                scheduler.start(page, url)
+                result['status'] = 'started'
+                logging.info("Started without waiting (deadline passed): %s", url)
+            elif eager:
+                try:
+                    response, retries = await scheduler.navigate(page, url)
+                except Exception as e:
+                    if not is_navigation_timeout(e):
+                        raise
+                    # The tab is open and still loading; just stop waiting
+                    result['status'] = 'started'
+                    logging.info("Stopped waiting for: %s", url)
+                else:
+                    result['status'] = 'success'
+                    if retries:
+                        result['retries'] = retries
+                    if response is not None and response.status >= 400:
+                        result['httpStatus'] = response.status
+                    logging.info("Opened: %s", url)
+            else:
+                await page.set_content(placeholder_html(url, title))
+                result['status'] = 'deferred'
+                logging.info("Deferred: %s", url)
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+            logging.error("Error opening %s: %s", url, e)
+        finally:
+            slots.release()
+        results[index] = result
+        if journal is not None:
+            journal.record_tab(result)
+        if progress is not None:
+            progress.tab_finished(result)
+
+    loads = []
+    # The last tab created, which is the one in the foreground
+    last = None
+    async for group_name, url, title in entries:
+        if cancelled is not None and cancelled.is_set():
+            logging.info("Clone cancelled, not opening further tabs")
+            break
+        index = len(results)
+        results.append(None)
+        eager = is_eager(group_name)
+        await slots.acquire()
+        if progress is not None:
+            progress.tab_started(group_name)
+        try:
+            page = await context.new_page()
+        except Exception as e:
+            slots.release()
+            if pages is not None:
+                pages.append(None)
+            logging.error("Error creating tab for %s: %s", url, e)
+            results[index] = {'group': group_name, 'url': url, 'title': title,
+                              'status': 'error', 'error': str(e)}
+            if progress is not None:
+                progress.tab_finished(results[index])
+            continue
+        if pages is not None:
+            pages.append(page)
+        last = (index, page)
+        loads.append(asyncio.create_task(load(index, page, group_name, url, title, eager)))
+        if concurrency == 1 and eager:
+            # Serial mode: one tab at a time, paced by the host limits
+            await loads[-1]
+
+    await asyncio.gather(*loads)
+    # A placeholder in the foreground would only load once the user had
+    # switched away and back, so that tab loads its real URL now
+    if last is not None and results[last[0]]['status'] == 'deferred':
+        index, page = last
+        scheduler.start(page, results[index]['url'])
+        results[index]['status'] = 'started'
+        logging.info("Loading the foreground tab: %s", results[index]['url'])
+    return results
+
+
+class ProgressReporter:
+    """
+    Sends `progress` frames to the extension while a clone runs.
+
+    Frames are rate-limited to one per `interval` seconds (the last state
+    always goes out with the final reply instead), so a fast clone of many
+    tabs does not spend its time writing and flushing stdout. With no
+    interval nothing is sent, but the counts are still kept for `status`.
+    """
+
+    def __init__(self, interval, total=None, extra=None):
+        self.interval = interval
+        self.total = total
+        self.extra = extra or {}
+        self.opened = 0
+        self.failed = 0
+        self.current_group = None
+        self._started = time.monotonic()
+        self._last_sent = None
+
+    def tab_started(self, group_name):
+        self.current_group = group_name
+
+    def tab_finished(self, result):
+        if result['status'] == 'error':
+            self.failed += 1
+        else:
+            self.opened += 1
+        self.maybe_send()
+
+    def snapshot(self):
         return {
-            'status': 'error',
-            'error': 'Playwright not installed. Run: pip install playwright && playwright install chromium'
+            'tabsOpened': self.opened,
+            'tabsFailed': self.failed,
+            'tabsTotal': self.total,
+            'currentGroup': self.current_group,
+            'elapsed': round(time.monotonic() - self._started, 3)
         }
 
+    def maybe_send(self, force=False):
+        if self.interval is None:
+            return
+        now = time.monotonic()
+        if not force and self._last_sent is not None and now - self._last_sent < self.interval:
+            return
+        self._last_sent = now
+        frame = {'status': 'progress'}
+        frame.update(self.snapshot())
+        frame.update(self.extra)
+        send_message(frame)
+
+
+def get_progress_reporter(options, total=None, extra=None):
+    """
+    Build the ProgressReporter for a clone.
+
+    Progress frames are opt-in (`progress: true`, or a number of seconds
+    between frames) because one-shot callers such as sendNativeMessage only
+    read the first reply.
+    """
+    progress = options.get('progress')
+    if not progress:
+        interval = None
+    elif progress is True:
+        interval = DEFAULT_PROGRESS_INTERVAL
+    elif isinstance(progress, (int, float)) and progress > 0:
+        interval = float(progress)
+    else:
+        raise ValueError(f'Invalid progress: {progress!r}')
+    return ProgressReporter(interval, total, extra)
+
+
+class JobJournal:
+    """
+    On-disk checkpoint of one clone job, so it can be resumed.
+
+    A JSON-lines file under JOURNAL_DIR: a header with the job's options
+    and snapshot, then one line per tab opened. Chunked transfers have no
+    snapshot up front, so each chunk is appended as it arrives instead.
+    Lines are flushed as they are written, so the journal survives the
+    host process being killed mid-clone.
+    """
+
+    def __init__(self, job_id, file):
+        self.job_id = job_id
+        self._file = file
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(job_id):
+        if not isinstance(job_id, str) or not JOB_ID_PATTERN.fullmatch(job_id):
+            raise ValueError(f'Invalid jobId: {job_id!r}')
+        return JOURNAL_DIR / f'{job_id}.jsonl'
+
+    @classmethod
+    def create(cls, job_id, options, data):
+        path = cls.path_for(job_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Never clobber the checkpoint of an earlier job with this ID
+            file = open(path, 'x', encoding='utf-8')
+        except FileExistsError:
+            raise ValueError(f'Job {job_id} already has a journal; resume it with resumeClone') from None
+        journal = cls(job_id, file)
+        journal._write({'jobId': job_id, 'created': time.time(), 'options': options, 'data': data})
+        return journal
+
+    @classmethod
+    def resume(cls, job_id):
+        """
+        Reopen a journal for appending.
+
+        Returns (journal, options, data, completed) where `completed` counts
+        the (group, url) pairs already opened.
+        """
+        path = cls.path_for(job_id)
+        if not path.exists():
+            raise ValueError(f'No journal for job {job_id}')
+
+        header = None
+        chunks = []
+        completed = collections.Counter()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short when the host died
+                    break
+                if header is None:
+                    header = record
+                elif 'done' in record:
+                    completed[tuple(record['done'])] += 1
+                elif 'chunk' in record:
+                    chunks.append(record['chunk'])
+
+        if header is None:
+            raise ValueError(f'Journal for job {job_id} is empty')
+        data = header.get('data')
+        if data is None:
+            data = merge_chunks(chunks)
+        return cls(job_id, open(path, 'a', encoding='utf-8')), header.get('options'), data, completed
+
+    def record_chunk(self, chunk):
+        self._write({'chunk': chunk})
+
+    def record_tab(self, result):
+        if result['status'] != 'error':
+            self._write({'done': [result['group'], result['url']]})
+
+    def _write(self, record):
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(json.dumps(record) + '\n')
+                self._file.flush()
+            except OSError as e:
+                # Losing the checkpoint must not fail the clone itself
+                logging.error("Cannot write journal for job %s: %s", self.job_id, e)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        """Delete the journal once the job has finished."""
+        self.close()
+        try:
+            self.path_for(self.job_id).unlink()
+        except OSError:
+            pass
+
+
+def prune_journals():
+    """Delete journals of jobs nobody resumed within JOURNAL_MAX_AGE_SECONDS."""
+    cutoff = time.time() - JOURNAL_MAX_AGE_SECONDS
     try:
-        # Find Sidekick binary
-        sidekick_path = find_sidekick_binary()
-        if not sidekick_path:
-            return {
-                'status': 'error',
-                'error': 'Sidekick browser not found. Please install Sidekick from https://www.meetsidekick.com/'
-            }
+        for path in JOURNAL_DIR.glob('*.jsonl'):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+    except OSError as e:
+        logging.warning("Cannot prune old journals: %s", e)
 
-        logging.info(f"Found Sidekick at: {sidekick_path}")
 
-        groups = tab_group_data.get('groups', [])
-        ungrouped_tabs = tab_group_data.get('ungroupedTabs', [])
+def merge_chunks(chunks):
+    """Rebuild a snapshot from transfer chunks, joining groups split across them."""
+    groups = []
+    by_id = {}
+    ungrouped = []
+    for chunk in chunks:
+        ungrouped.extend(chunk.get('ungroupedTabs', []))
+        for group in chunk.get('groups', []):
+            key = group.get('id', group.get('title', 'Untitled'))
+            if key in by_id:
+                by_id[key]['tabs'].extend(group.get('tabs', []))
+            else:
+                merged = dict(group, tabs=list(group.get('tabs', [])))
+                by_id[key] = merged
+                groups.append(merged)
+    return {'groups': groups, 'ungroupedTabs': ungrouped}
+
+
+async def skip_completed(entries, job):
+    """Drop entries a resumed job already opened, counting them on the job."""
+    async for entry in entries:
+        key = (entry[0], entry[1])
+        if job.completed[key] > 0:
+            job.completed[key] -= 1
+            job.tabs_skipped += 1
+            continue
+        yield entry
+
+
+class SidekickSession:
+    """
+    The Sidekick browsers kept alive across clone requests.
+
+    The native host handles many messages per process, so a browser is
+    launched (or attached to over CDP) on first use and reused afterwards.
+    There is one per endpoint - binary path or CDP URL - so a request for
+    another endpoint never closes a browser other clones are still using.
+    If a browser has gone away - the user quit Sidekick, the CDP endpoint
+    closed - the next request for its endpoint relaunches it.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='sidekick-loop', daemon=True)
+        self._thread.start()
+        self._start_lock = asyncio.Lock()
+        self._playwright = None
+        # endpoint -> (browser, attached over CDP)
+        self._browsers = {}
+
+    def run(self, coro):
+        """
+        Run a coroutine on the session's event loop and wait for its result.
+
+        The loop lives on its own thread, so several worker threads can run
+        clones against the same browser at once.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def is_alive(self, endpoint):
+        browser, _attached = self._browsers.get(endpoint, (None, False))
+        return browser is not None and browser.is_connected()
+
+    async def get_context(self, sidekick_path, cdp_url=None):
+        """Return (context, reused) for the endpoint's live browser, starting one if needed."""
+        endpoint = cdp_url or sidekick_path
+        # Concurrent clones must not each launch their own browser
+        async with self._start_lock:
+            if self.is_alive(endpoint):
+                return await self._new_context(endpoint), True
 
-        tabs_cloned = 0
-        groups_cloned = 0
+            await self._discard_browser(endpoint)
+            started = time.monotonic()
+            try:
+                browser = await self._start(sidekick_path, cdp_url)
+            except Exception:
+                # The Playwright driver itself may be wedged; start from scratch once.
+                # That also ends the other endpoints' browsers it launched.
+                await self._stop_playwright()
+                browser = await self._start(sidekick_path, cdp_url)
+            browser_start_seconds.observe(time.monotonic() - started, mode='cdp' if cdp_url else 'launch')
+            self._browsers[endpoint] = (browser, bool(cdp_url))
+            return await self._new_context(endpoint), False
+
+    async def _start(self, sidekick_path, cdp_url):
+        from playwright.async_api import async_playwright
+
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
 
-        with sync_playwright() as p:
-            # Launch Sidekick browser using Playwright
+        if cdp_url:
+            browser = await self._playwright.chromium.connect_over_cdp(cdp_url)
+            logging.info("Connected to Sidekick over CDP at %s", cdp_url)
+        else:
             # Sidekick is Chromium-based, so we use the chromium channel with custom executable
+            browser = await self._playwright.chromium.launch(
+                executable_path=sidekick_path,
+                headless=False,  # We want to see the browser
+                args=['--disable-blink-features=AutomationControlled']
+            )
+            logging.info("Launched Sidekick browser successfully")
+        return browser
+
+    async def _new_context(self, endpoint):
+        browser, attached = self._browsers[endpoint]
+        # Over CDP, open tabs in the user's existing profile rather than a
+        # fresh incognito-like context
+        if attached and browser.contexts:
+            return browser.contexts[0]
+        return await browser.new_context()
+
+    async def _discard_browser(self, endpoint):
+        browser, _attached = self._browsers.pop(endpoint, (None, False))
+        if browser is not None:
+            logging.info("Sidekick browser at %s is gone, starting a new one", endpoint)
             try:
-                browser = p.chromium.launch(
-                    executable_path=sidekick_path,
-                    headless=False,  # We want to see the browser
-                    args=['--disable-blink-features=AutomationControlled']
-                )
-                logging.info("Launched Sidekick browser successfully")
-            except Exception as e:
-                logging.error(f"Failed to launch Sidekick: {e}")
+                await browser.close()
+            except Exception:
+                pass
+
+    async def _stop_playwright(self):
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+        self._playwright = None
+        self._browsers.clear()
+
+    def close(self):
+        """Shut down Playwright (and with it any browser it launched)."""
+        try:
+            self.run(self._stop_playwright())
+        finally:
+            self._browsers.clear()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide Sidekick session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = SidekickSession()
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+async def _clone_with_session(session, sidekick_path, cdp_url, entries, concurrency, is_eager,
+                              progress, cancelled, journal, sync=None, schedule=None, policy=None):
+    """
+    Open all URLs in the session's browser; returns (per-tab results, reused).
+
+    With a WindowSync, `entries` is ignored and only the tabs its diff adds
+    are opened, in the context earlier syncs of the same source used.
+    """
+    try:
+        context, reused = await session.get_context(sidekick_path, cdp_url)
+    except Exception as e:
+        logging.error("Failed to launch Sidekick: %s", e)
+        raise LaunchError(f'Failed to launch Sidekick browser: {str(e)}') from e
+
+    pages = None
+    if sync is not None:
+        entries, context = await sync.begin(context, reused, cdp_url or sidekick_path)
+        pages = []
+
+    logging.info("Opening URLs in Sidekick (%s in flight, %s browser)",
+                 concurrency, 'reused' if reused else 'new')
+    if progress is not None:
+        progress.maybe_send(force=True)
+    try:
+        results = await open_tabs(context, entries, concurrency, is_eager, progress, cancelled, journal, pages,
+                                  schedule, policy)
+    finally:
+        latency_history.save()
+        if sync is not None:
+            sync.finish(pages)
+
+    # Keep browser open (don't close it)
+    # The user can manage the browser from here, and later clones reuse it
+    return results, reused
+
+
+def _run_clone(make_entries, options, count_groups, total=None, extra=None, job=None, pipeline=None, sync=None):
+    """
+    Shared body of a clone request.
+
+    `make_entries` is called on the session's event loop and returns the
+    async iterable of URL entries to open; `count_groups` is called once
+    they have all been opened. `total` (the number of URLs, if known) and
+    `extra` (fields identifying the request) go into progress frames.
+    `job`, if given, is the CloneJob through which the clone can be
+    watched, cancelled and checkpointed; tabs it records as `completed`
+    (when resuming) are skipped. `pipeline` is the TabPipeline the entries
+    went through, whose drop counts are added to the reply. `sync`, a
+    WindowSync, opens and closes only what changed since the last sync.
+    """
+    try:
+        import playwright.async_api  # noqa: F401
+    except ImportError:
+        return {
+            'status': 'error',
+            'error': 'Playwright not installed. Run: pip install playwright && playwright install chromium'
+        }
+
+    try:
+        options = options or {}
+        concurrency = get_concurrency(options)
+        schedule = get_schedule(options)
+        policy = get_navigation_policy(options)
+        is_eager = make_eager_check(options)
+        progress = get_progress_reporter(options, total, extra)
+        cancelled = journal = None
+        resuming = job is not None and job.completed is not None
+        if job is not None:
+            job.progress = progress
+            cancelled = job.cancelled
+            journal = job.journal
+        cdp_url = options.get('cdpUrl') or os.environ.get('SIDEKICK_CDP_URL')
+
+        sidekick_path = None
+        if not cdp_url:
+            # Find Sidekick binary
+            override = options.get('sidekickPath')
+            sidekick_path = find_sidekick_binary(override)
+            if not sidekick_path and (override or os.environ.get(SIDEKICK_PATH_ENV)):
+                return {
+                    'status': 'error',
+                    'error': f'Sidekick not found at {override or os.environ.get(SIDEKICK_PATH_ENV)}'
+                }
+            if not sidekick_path:
                 return {
                     'status': 'error',
-                    'error': f'Failed to launch Sidekick browser: {str(e)}'
+                    'error': 'Sidekick browser not found. Please install Sidekick from https://www.meetsidekick.com/'
                 }
 
-            # Create a new browser context and page
-            context = browser.new_context()
-
-            # Collect all URLs to open
-            all_urls = []
-
-            # Add ungrouped tabs
-            for tab_data in ungrouped_tabs:
-                url = tab_data.get('url', '')
-                # Skip special Chrome URLs
-                if url.startswith('chrome://') or url.startswith('chrome-extension://'):
-                    logging.warning(f"Skipping special URL: {url}")
-                    continue
-                if url:
-                    all_urls.append(('ungrouped', url, tab_data.get('title', '')))
-
-            # Add grouped tabs
-            for group in groups:
-                group_title = group.get('title', 'Untitled')
-                group_tabs = group.get('tabs', [])
-
-                for tab_data in group_tabs:
-                    url = tab_data.get('url', '')
-                    # Skip special Chrome URLs
-                    if url.startswith('chrome://') or url.startswith('chrome-extension://'):
-                        logging.warning(f"Skipping special URL: {url}")
-                        continue
-                    if url:
-                        all_urls.append((group_title, url, tab_data.get('title', '')))
-
-            logging.info(f"Opening {len(all_urls)} URLs in Sidekick")
-
-            # Open first URL in the initial page
-            if all_urls:
-                first_page = context.new_page()
-                group_name, url, title = all_urls[0]
-                try:
-                    first_page.goto(url, wait_until='domcontentloaded', timeout=30000)
-                    tabs_cloned += 1
-                    logging.info(f"Opened: {url}")
-                except Exception as e:
-                    logging.error(f"Error opening {url}: {e}")
+            logging.info("Found Sidekick at: %s", sidekick_path)
 
-            # Open remaining URLs in new tabs
-            for group_name, url, title in all_urls[1:]:
-                try:
-                    page = context.new_page()
-                    page.goto(url, wait_until='domcontentloaded', timeout=30000)
-                    tabs_cloned += 1
-                    logging.info(f"Opened: {url}")
-                    time.sleep(0.2)  # Small delay between tabs
-                except Exception as e:
-                    logging.error(f"Error opening {url}: {e}")
+        async def clone():
+            if job is not None:
+                job.started = True
+            source = make_entries()
+            entries = skip_completed(source, job) if resuming else source
+            try:
+                return await _clone_with_session(session, sidekick_path, cdp_url, entries, concurrency, is_eager,
+                                                 progress, cancelled, journal, sync, schedule, policy)
+            finally:
+                if hasattr(source, 'finish'):
+                    await source.finish()
 
-            groups_cloned = len(groups)
+        try:
+            session = get_session()
+            results, reused = session.run(clone())
+        except LaunchError as e:
+            return {
+                'status': 'error',
+                'error': str(e)
+            }
 
-            logging.info(f"Successfully cloned {groups_cloned} groups with {tabs_cloned} tabs")
+        tabs_deferred = sum(1 for r in results if r['status'] == 'deferred')
+        tabs_started = sum(1 for r in results if r['status'] == 'started')
+        tabs_failed = sum(1 for r in results if r['status'] == 'error')
+        tabs_cloned = len(results) - tabs_failed
+        groups_cloned = count_groups()
 
-            # Keep browser open (don't close it)
-            # The user can manage the browser from here
-            # We detach by not calling browser.close()
+        logging.info("Successfully cloned %s groups with %s tabs (%s deferred, %s still loading, %s failed)",
+                     groups_cloned, tabs_cloned, tabs_deferred, tabs_started, tabs_failed)
 
-        return {
+        result = {
             'status': 'success',
             'message': f'Opened {tabs_cloned} tabs from {groups_cloned} groups in Sidekick',
             'groupsCloned': groups_cloned,
-            'tabsCloned': tabs_cloned
+            'tabsCloned': tabs_cloned,
+            'tabsFailed': tabs_failed,
+            'tabsDeferred': tabs_deferred,
+            'tabsStarted': tabs_started,
+            'browserReused': reused,
+            'tabs': results
         }
+        if pipeline is not None:
+            result.update(pipeline.report())
+        if sync is not None:
+            result['sync'] = sync.report()
+            if result['sync']['unchanged']:
+                result['message'] = 'Nothing changed since the last sync'
+        if resuming:
+            result['tabsSkipped'] = job.tabs_skipped
+        if cancelled is not None and cancelled.is_set():
+            result['status'] = 'cancelled'
+            result['message'] = f'Cancelled after opening {tabs_cloned} tabs in Sidekick'
+        return result
 
     except Exception as e:
-        logging.error(f"Error cloning tabs: {e}", exc_info=True)
+        logging.error("Error cloning tabs: %s", e, exc_info=True)
         return {
             'status': 'error',
             'error': str(e)
         }
 
 
+def clone_tabs_to_sidekick(tab_group_data, options=None, job=None):
+    """
+    Clone tab groups to Sidekick browser using Playwright.
+
+    `options` are the request's clone options; see "Clone Options" in
+    ARCHITECTURE.md.
+    """
+    try:
+        pipeline = build_pipeline((options or {}).get('filters'))
+        tab_group_data = pipeline.process(tab_group_data)
+    except ValueError as e:
+        return {'status': 'error', 'error': str(e)}
+    except (AttributeError, TypeError) as e:
+        logging.error("Malformed snapshot: %s", e)
+        return {'status': 'error', 'error': f'Malformed snapshot: {e}'}
+    source = (options or {}).get('source')
+    if source is not None:
+        return sync_tabs_to_sidekick(source, tab_group_data, options, job, pipeline)
+    groups = tab_group_data['groups']
+    all_urls = collect_urls(tab_group_data)
+    logging.info("Cloning %s URLs (%s dropped by filters)", len(all_urls), pipeline.report()['tabsDropped'])
+    extra = job.reply_fields() if job else None
+    return _run_clone(lambda: iterate(all_urls), options, lambda: len(groups), total=len(all_urls),
+                      extra=extra, job=job, pipeline=pipeline)
+
+
+class SyncedWindow:
+    """
+    The tabs a source window's syncs have opened in Sidekick.
+
+    Pages are tracked per group key alongside a SnapshotState of the same
+    groups, so the next snapshot from the window is diffed against what is
+    really open: tabs the user closed in Sidekick are forgotten (and
+    reopened if still wanted), and once the browser has been relaunched or
+    another endpoint is used the window starts over from nothing.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.context = None
+        # The browser endpoint `context` belongs to
+        self.endpoint = None
+        # group key -> [[url, page], ...]
+        self.pages = {}
+        self.fields = {}
+        self.state = SnapshotState()
+        self.lock = asyncio.Lock()
+
+    def refresh(self, context, reused, endpoint):
+        """Bring the state in line with the pages still open in the browser."""
+        if not reused or self.context is None or endpoint != self.endpoint:
+            self.context = context
+            self.endpoint = endpoint
+            self.pages.clear()
+            self.fields.clear()
+            self.state = SnapshotState()
+            return
+        for key, tabs in list(self.pages.items()):
+            alive = [tab for tab in tabs if not tab[1].is_closed()]
+            if len(alive) != len(tabs):
+                self.set_group(key, self.fields.get(key, {}), alive)
+
+    def set_group(self, key, fields, tabs):
+        if tabs:
+            self.pages[key] = tabs
+            self.fields[key] = fields
+        else:
+            self.pages.pop(key, None)
+            self.fields.pop(key, None)
+        self.state.set_group(key, fields, [url for url, _page in tabs])
+
+    def take(self, key, url):
+        """Remove and return the page showing `url` in group `key`, if any."""
+        tabs = self.pages.get(key, [])
+        for index, (tab_url, page) in enumerate(tabs):
+            if tab_url == url:
+                del tabs[index]
+                return page
+        return None
+
+
+class WindowSync:
+    """One sync of a snapshot into a SyncedWindow, run on the session's loop."""
+
+    def __init__(self, window, snapshot):
+        self.window = window
+        self.snapshot = snapshot
+        self.diff = None
+        self.closed = 0
+        self._added = []
+
+    async def begin(self, context, reused, endpoint):
+        """
+        Diff against what is open and close removed tabs.
+
+        Returns the entries to open and the context to open them in.
+        """
+        window = self.window
+        await window.lock.acquire()
+        try:
+            window.refresh(context, reused, endpoint)
+            self.diff = diff = window.state.diff(self.snapshot)
+            names = {UNGROUPED: 'ungrouped'}
+            names.update((group['key'], group.get('title') or 'Untitled') for group in diff['groups'])
+
+            for tab in diff['removed']:
+                page = window.take(tab['group'], tab['url'])
+                if page is not None:
+                    try:
+                        await page.close()
+                        self.closed += 1
+                    except Exception as e:
+                        logging.warning("Error closing %s: %s", tab['url'], e)
+
+            # Playwright cannot regroup tabs, so a move only changes which
+            # group a page is tracked under
+            self._added = list(diff['added'])
+            for tab in diff['moved']:
+                page = window.take(tab['from'], tab['url'])
+                if page is None:
+                    self._added.append({'group': tab['to'], 'url': tab['url'], 'title': tab['title']})
+                else:
+                    window.pages.setdefault(tab['to'], []).append([tab['url'], page])
+
+            logging.info("Syncing source %s: %s", window.source, summarize(diff))
+            entries = [(names.get(tab['group'], 'Untitled'), tab['url'], tab['title']) for tab in self._added]
+            return iterate(entries), window.context
+        except BaseException:
+            window.lock.release()
+            raise
+
+    def finish(self, pages):
+        """Track the pages opened for the diff and record the window's new state."""
+        window = self.window
+        try:
+            for tab, page in zip(self._added, pages or ()):
+                if page is not None:
+                    window.pages.setdefault(tab['group'], []).append([tab['url'], page])
+
+            for key in self.diff['removedGroups']:
+                window.set_group(key, {}, [])
+            for group in self.diff['groups']:
+                key = group['key']
+                fields = {f: v for f, v in group.items() if f not in ('key', 'tabs')}
+                tabs = window.pages.get(key, [])
+                # Keep the snapshot's order when every tab made it, so the
+                # group hash matches next time
+                by_url = collections.defaultdict(collections.deque)
+                for tab in tabs:
+                    by_url[tab[0]].append(tab)
+                ordered = []
+                for tab_data in group['tabs']:
+                    matches = by_url.get(tab_data['url'])
+                    if matches:
+                        ordered.append(matches.popleft())
+                ordered.extend(tab for rest in by_url.values() for tab in rest)
+                window.set_group(key, fields, ordered)
+        finally:
+            window.lock.release()
+
+    def report(self):
+        summary = summarize(self.diff) if self.diff is not None else {}
+        summary['tabsClosed'] = self.closed
+        return summary
+
+
+# Windows synced with a `source` option, keyed by source
+synced_windows = {}
+_synced_lock = threading.Lock()
+
+
+def get_synced_window(source):
+    with _synced_lock:
+        window = synced_windows.get(source)
+        if window is None:
+            window = synced_windows[source] = SyncedWindow(source)
+        return window
+
+
+def sync_tabs_to_sidekick(source, tab_group_data, options=None, job=None, pipeline=None):
+    """Apply only what changed in `source`'s snapshot since its last sync."""
+    sync = WindowSync(get_synced_window(source), tab_group_data)
+    if job is not None:
+        # Tabs opened before a cancel are already tracked, so the diff
+        # leaves them out without the journal's help
+        job.completed = None
+    extra = job.reply_fields() if job else None
+    return _run_clone(lambda: None, options, lambda: sum(1 for g in sync.diff['groups'] if g['key'] is not UNGROUPED),
+                      extra=extra, job=job, pipeline=pipeline, sync=sync)
+
+
+class ChunkedTransfer:
+    """
+    A snapshot sent as several frames because it is too big for one.
+
+    The extension sends a `begin` frame (transferId, action, options), then
+    `chunk` frames numbered by `seq`, each holding a slice of the snapshot
+    in the usual `groups`/`ungroupedTabs` shape (a group may continue over
+    several chunks under the same id), and finally an `end` frame with the
+    total number of chunks. Chunks are reassembled in `seq` order and their
+    tabs handed to the clone as soon as they are in sequence, so the first
+    tabs open while later chunks are still in transit. The dispatcher routes
+    this transfer's frames to it with `route()`.
+    """
+
+    def __init__(self, begin_frame):
+        self.transfer_id = begin_frame.get('transferId')
+        if not self.transfer_id:
+            raise ValueError('Transfer begin frame without transferId')
+        self.options = begin_frame.get('options')
+        # One pipeline for the whole transfer, so dedup spans chunks
+        self.pipeline = build_pipeline((self.options or {}).get('filters'))
+        self.truncated = False
+        self.error = None
+        self._ended = False
+        self._out_of_order = {}
+        self._next_seq = 0
+        self._total = None
+        self._group_ids = set()
+        self._frames = queue.Queue()
+        self.journal = None
+        self._queue = None
+        self._producer = None
+
+    @property
+    def done(self):
+        if self.truncated:
+            return True
+        return self._ended and (self.error is not None or self._next_seq >= self._total)
+
+    @property
+    def groups_seen(self):
+        return len(self._group_ids)
+
+    def accept(self, frame):
+        """Take one chunk/end frame; returns the chunks now ready, in order."""
+        kind = frame.get('transfer')
+        if kind == 'end':
+            self._ended = True
+            total = frame.get('chunks')
+            if isinstance(total, bool) or not isinstance(total, int) or total < self._next_seq:
+                self._fail(f'Invalid chunk count in end frame: {total!r}')
+            else:
+                self._total = total
+        else:
+            seq = frame.get('seq')
+            if isinstance(seq, bool) or not isinstance(seq, int) or seq < 0:
+                self._fail(f'Invalid chunk seq: {seq!r}')
+            elif self.error is not None or seq < self._next_seq:
+                pass
+            elif len(self._out_of_order) >= MAX_OUT_OF_ORDER_CHUNKS and seq not in self._out_of_order:
+                self._fail(f'More than {MAX_OUT_OF_ORDER_CHUNKS} chunks waiting for chunk {self._next_seq}')
+            else:
+                self._out_of_order[seq] = frame
+
+        ready = []
+        while self.error is None and self._next_seq in self._out_of_order:
+            chunk = self._out_of_order.pop(self._next_seq)
+            self._next_seq += 1
+            for group in chunk.get('groups', []):
+                self._group_ids.add(group.get('id', group.get('title', 'Untitled')))
+            ready.append(chunk)
+        return ready
+
+    def _fail(self, error):
+        # Keep reading to the end frame so the rest of the transfer is not
+        # mistaken for new messages, but open nothing more
+        if self.error is None:
+            logging.error("Transfer %s: %s", self.transfer_id, error)
+            self.error = error
+        self._out_of_order.clear()
+
+    def route(self, frame):
+        """Hand over a chunk/end frame (or None at end of input)."""
+        self._frames.put(frame)
+
+    def next_frame(self):
+        """Block for this transfer's next frame, or None if input ended or the sender went quiet."""
+        try:
+            frame = self._frames.get(timeout=TRANSFER_IDLE_TIMEOUT_SECONDS)
+        except queue.Empty:
+            # Whatever is still missing is not coming
+            self._ended = True
+            self._fail(f'No frame received for {TRANSFER_IDLE_TIMEOUT_SECONDS} seconds')
+            return None
+        if frame is None:
+            logging.warning("Input ended during transfer %s", self.transfer_id)
+            self.truncated = True
+        return frame
+
+    def drain(self):
+        """Consume the rest of the transfer without opening anything."""
+        while not self.done:
+            frame = self.next_frame()
+            if frame is not None:
+                self.accept(frame)
+
+    async def _produce(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while not self.done:
+                frame = await loop.run_in_executor(None, self.next_frame)
+                if frame is None:
+                    break
+                for chunk in self.accept(frame):
+                    if self.journal is not None:
+                        self.journal.record_chunk(chunk)
+                    for entry in collect_urls(self.pipeline.process(chunk)):
+                        await self._queue.put(entry)
+        finally:
+            await self._queue.put(None)
+
+    def __aiter__(self):
+        if self._producer is None:
+            self._queue = asyncio.Queue()
+            self._producer = asyncio.ensure_future(self._produce())
+        return self
+
+    async def __anext__(self):
+        entry = await self._queue.get()
+        if entry is None:
+            raise StopAsyncIteration
+        return entry
+
+    def start(self):
+        """Begin reading frames on the running loop, before anything iterates."""
+        self.__aiter__()
+        return self
+
+    async def finish(self):
+        """Wait for the reader to stop so nothing else touches stdin afterwards."""
+        if self._producer is not None:
+            await self._producer
+            self._producer = None
+
+
+def clone_transfer(transfer, job=None):
+    """Clone a snapshot that arrives as a chunked transfer."""
+    logging.info("Receiving chunked transfer %s", transfer.transfer_id)
+    extra = {'transferId': transfer.transfer_id}
+    if job is not None:
+        extra.update(job.reply_fields())
+    result = _run_clone(transfer.start, transfer.options, lambda: transfer.groups_seen,
+                        extra=extra, job=job, pipeline=transfer.pipeline)
+    # Early failures (no Sidekick, bad options) never started reading
+    transfer.drain()
+    result['transferId'] = transfer.transfer_id
+    if transfer.error is not None:
+        result['status'] = 'error'
+        result['error'] = transfer.error
+    elif transfer.truncated and result.get('status') == 'success':
+        result['status'] = 'partial'
+        result['message'] += ' (transfer was cut off before its last chunk)'
+    return result
+
+
+class CloneJob:
+    """
+    A request being worked on, visible to `status` and `cancel`.
+
+    Clones also carry a `job_id` naming their on-disk journal, which stays
+    behind if the clone does not finish so `resumeClone` can pick it up.
+    """
+
+    def __init__(self, request_id, action, job_id=None, journal=None, data=None, options=None, completed=None):
+        self.request_id = request_id
+        self.action = action
+        self.job_id = job_id
+        self.journal = journal
+        self.data = data
+        self.options = options
+        # (group, url) pairs opened before a resume, and how many were skipped
+        self.completed = completed
+        self.tabs_skipped = 0
+        # Set once the clone gets past validation and starts opening tabs
+        self.started = False
+        self.cancelled = threading.Event()
+        self.progress = None
+        self._started = time.monotonic()
+
+    def reply_fields(self):
+        """Fields that tie a reply or progress frame back to its request."""
+        fields = {}
+        if self.request_id is not None:
+            fields['requestId'] = self.request_id
+        if self.job_id is not None:
+            fields['jobId'] = self.job_id
+        return fields
+
+    def open_journal(self):
+        """
+        Write a new job's journal header, or read back a resumed job's
+        journal. Done on the worker, as either holds the whole snapshot.
+        A resume keeps the snapshot and options the request gave, if any.
+        """
+        if self.action != 'resumeClone':
+            self.journal = JobJournal.create(self.job_id, self.options, self.data)
+            return
+        journal, options, data, completed = JobJournal.resume(self.job_id)
+        self.journal = journal
+        self.data = self.data or data
+        self.options = self.options or options
+        self.completed = completed
+        logging.info("Resuming job %s, %s tabs already open", self.job_id, sum(completed.values()))
+
+    def finish(self, result):
+        """
+        Drop the journal of a job that completed, or of a new job that
+        failed before opening anything; keep it otherwise.
+        """
+        if self.journal is None:
+            return
+        if result.get('status') == 'success' or not self.started and self.action != 'resumeClone':
+            self.journal.remove()
+        else:
+            self.journal.close()
+
+    def describe(self):
+        state = {
+            'requestId': self.request_id,
+            'jobId': self.job_id,
+            'action': self.action,
+            'cancelled': self.cancelled.is_set(),
+            'elapsed': round(time.monotonic() - self._started, 3)
+        }
+        if self.progress is not None:
+            state.update(self.progress.snapshot())
+        return state
+
+
+# Requests in progress, keyed by requestId (or an internal key when the
+# sender did not give one)
+active_jobs = {}
+_jobs_lock = threading.Lock()
+# Chunked transfers still receiving frames, keyed by transferId
+transfers = {}
+metrics.gauge('tab_cloner_host_active_requests', 'Clone requests in progress', lambda: len(active_jobs))
+
+
+def reply(message, result, job=None):
+    """Send the final reply to `message`, echoing its requestId (and the job's ID)."""
+    request_id = message.get('requestId')
+    if request_id is not None:
+        result['requestId'] = request_id
+    if job is not None and job.job_id is not None:
+        result['jobId'] = job.job_id
+    # Opt-in compressed replies: 'gzip' or 'zstd'
+    send_message(result, message.get('compress'))
+
+
+def handle_request(message, job, transfer=None):
+    """Run one request on a worker thread and send its reply."""
+    result = {'status': 'error', 'error': 'Request did not complete'}
+    started = time.monotonic()
+    try:
+        _finish_import(asyncio)
+        if job.journal is None:
+            job.open_journal()
+            if transfer is not None:
+                transfer.journal = job.journal
+        if transfer is not None:
+            result = clone_transfer(transfer, job)
+        else:
+            logging.info("Processing %s request for job %s", job.action, job.job_id)
+            result = clone_tabs_to_sidekick(job.data, job.options, job)
+    except Exception as e:
+        logging.error("Error handling request: %s", e, exc_info=True)
+        result = {'status': 'error', 'error': str(e)}
+        if transfer is not None:
+            # E.g. the journal could not be opened: still consume the rest
+            # of the transfer, so its frames are not taken for new messages
+            transfer.drain()
+    finally:
+        request_seconds.observe(time.monotonic() - started, action=job.action, status=result.get('status'))
+        # Settle the journal and deregister before replying, so a client
+        # acting on the reply (e.g. resuming a cancelled job) finds it done
+        job.finish(result)
+        with _jobs_lock:
+            active_jobs.pop(id(job) if job.request_id is None else job.request_id, None)
+            if transfer is not None:
+                transfers.pop(transfer.transfer_id, None)
+    reply(message, result, job)
+
+
+def handle_push(message):
+    """
+    Run a pushToServer request on a worker thread: queue the message's
+    snapshot on the local server (over its Unix socket when there is one)
+    instead of opening its tabs here.
+    """
+    from tab_server_client import push_snapshot
+    started = time.monotonic()
+    result = {'status': 'error', 'error': 'Request did not complete'}
+    try:
+        data = message.get('data')
+        if not isinstance(data, dict):
+            result = {'status': 'error', 'error': 'pushToServer needs a snapshot in data'}
+        else:
+            result = push_snapshot(data, message.get('options'))
+            logging.info("Pushed snapshot to %s: %s", result.get('server'), result.get('status'))
+    except Exception as e:
+        logging.error("Error pushing to server: %s", e, exc_info=True)
+        result = {'status': 'error', 'error': str(e)}
+    finally:
+        request_seconds.observe(time.monotonic() - started, action='pushToServer', status=result.get('status'))
+        reply(message, result)
+
+
+def create_job(message, action, transfer=None):
+    """
+    Build the CloneJob for a clone or resume request.
+
+    Only the journal's name is checked here: the worker writes a new
+    job's journal, or reads back a resumed one (see CloneJob.open_journal).
+    A resume needs an existing journal; a new jobId must not have one.
+    """
+    if action == 'resumeClone':
+        job_id = message.get('jobId')
+        if not JobJournal.path_for(job_id).exists():
+            raise ValueError(f'No journal for job {job_id}')
+        return CloneJob(message.get('requestId'), action, job_id, None, message.get('data'), message.get('options'))
+
+    import uuid
+    job_id = message.get('jobId') or uuid.uuid4().hex
+    options = transfer.options if transfer is not None else message.get('options')
+    if JobJournal.path_for(job_id).exists():
+        raise ValueError(f'Job {job_id} already has a journal; resume it with resumeClone')
+    data = None if transfer is not None else message.get('data')
+    return CloneJob(message.get('requestId'), action, job_id, None, data, options)
+
+
+def dispatch(message, workers):
+    """
+    Handle one incoming message on the reader side.
+
+    Clones and pushes go to the worker pool; `status`, `getStats`, `cancel` and transfer
+    frames are answered or routed immediately so they never wait behind a clone.
+    """
+    action = message.get('action')
+    transfer_kind = message.get('transfer')
+
+    if transfer_kind in ('chunk', 'end'):
+        transfer = transfers.get(message.get('transferId'))
+        if transfer is None:
+            reply(message, {
+                'status': 'error',
+                'error': f"Unexpected {transfer_kind} frame for transfer {message.get('transferId')}"
+            })
+        else:
+            transfer.route(message)
+        return
+
+    if action == 'status':
+        with _jobs_lock:
+            jobs = [job.describe() for job in active_jobs.values()]
+        reply(message, {'status': 'success', 'jobs': jobs})
+        return
+
+    if action == 'getStats':
+        # Prometheus text with {"format": "prometheus"}, JSON otherwise
+        if message.get('format') == 'prometheus':
+            reply(message, {'status': 'success', 'metrics': metrics.render()})
+        else:
+            reply(message, {'status': 'success', 'stats': metrics.snapshot()})
+        return
+
+    if action == 'cancel':
+        target = message.get('target')
+        with _jobs_lock:
+            job = active_jobs.get(target)
+        if job is None:
+            reply(message, {'status': 'error', 'error': f'No running request {target!r}'})
+        else:
+            job.cancelled.set()
+            reply(message, {'status': 'success', 'message': f'Cancelling request {target}'})
+        return
+
+    if action == 'cancelClone':
+        job_id = message.get('jobId')
+        with _jobs_lock:
+            job = next((j for j in active_jobs.values() if j.job_id == job_id), None)
+        if job is None:
+            reply(message, {'status': 'error', 'error': f'No running clone job {job_id!r}'})
+        else:
+            job.cancelled.set()
+            reply(message, {'status': 'success', 'jobId': job_id,
+                            'message': f'Cancelling job {job_id}; resume it with resumeClone'})
+        return
+
+    if action == 'pushToServer':
+        workers.submit(handle_push, message)
+        return
+
+    if action not in ('cloneToSidekick', 'resumeClone'):
+        reply(message, {
+            'status': 'error',
+            'error': f'Unknown action: {action}'
+        })
+        return
+
+    transfer = None
+    if transfer_kind == 'begin' and action == 'cloneToSidekick':
+        try:
+            transfer = ChunkedTransfer(message)
+        except ValueError as e:
+            reply(message, {'status': 'error', 'error': str(e)})
+            return
+    elif transfer_kind is not None:
+        reply(message, {'status': 'error', 'error': f'Unknown transfer frame: {transfer_kind}'})
+        return
+
+    # Only this thread registers jobs, so checking first cannot race
+    request_id = message.get('requestId')
+    job_id = message.get('jobId')
+    with _jobs_lock:
+        if request_id is not None and request_id in active_jobs:
+            running = f'Request {request_id}'
+        elif job_id is not None and any(j.job_id == job_id for j in active_jobs.values()):
+            running = f'Job {job_id}'
+        else:
+            running = None
+    if running is not None:
+        reply(message, {'status': 'error', 'error': f'{running} is already running'})
+        return
+
+    try:
+        job = create_job(message, action, transfer)
+    except (ValueError, OSError) as e:
+        reply(message, {'status': 'error', 'error': str(e)})
+        return
+
+    with _jobs_lock:
+        active_jobs[id(job) if job.request_id is None else job.request_id] = job
+        # Register before returning so the next frames can be routed to it
+        if transfer is not None:
+            transfers[transfer.transfer_id] = transfer
+    workers.submit(handle_request, message, job, transfer)
+
+
 def main():
-    """Main entry point for the native messaging host."""
+    """
+    Main entry point for the native messaging host.
+
+    A reader thread decodes frames into a queue; this thread dispatches
+    them, running clones on a small worker pool so `status` and `cancel`
+    requests (matched to their target by `requestId`) are handled while
+    clones are in progress.
+    """
     logging.info("Native messaging host started")
 
+    prune_journals()
+    inbox = start_reader()
+    workers = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='clone')
+    warm = False
     try:
         while True:
-            message = read_message()
+            message = inbox.get()
+            if isinstance(message, Exception):
+                raise message
             if message is None:
                 logging.info("No more messages, exiting")
                 break
-
-            action = message.get('action')
-            data = message.get('data')
-
-            if action == 'cloneToSidekick':
-                logging.info("Processing cloneToSidekick request")
-                result = clone_tabs_to_sidekick(data)
-                send_message(result)
-            else:
-                send_message({
-                    'status': 'error',
-                    'error': f'Unknown action: {action}'
-                })
+            dispatch(message, workers)
+            if not warm:
+                start_prewarm()
+                warm = True
 
     except Exception as e:
-        logging.error(f"Fatal error: {e}", exc_info=True)
+        logging.error("Fatal error: %s", e, exc_info=True)
         send_message({
             'status': 'error',
             'error': str(e)
         })
         sys.exit(1)
+    finally:
+        # Let transfers still waiting for frames finish with what they have
+        for transfer in list(transfers.values()):
+            transfer.route(None)
+        workers.shutdown(wait=True)
+        close_session()
+        log_listener.stop()
 
 
 if __name__ == '__main__':
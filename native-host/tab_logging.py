@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Logging setup shared by the native messaging host and the local server.
+Records are handed to a queue and written by a listener thread, so
+formatting and disk I/O stay off the request path.
+"""
+
+import copy
+import hashlib
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Size at which a log file is rotated, and how many old files are kept
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+# Message fields worth logging as they are; everything else is summarized
+SUMMARY_FIELDS = ('action', 'requestId', 'jobId', 'transfer', 'transferId', 'seq', 'status', 'source',
+                  'envelope', 'part', 'parts')
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler merges a record's arguments into its message before
+    queueing it. Here the record is queued as it is, so callers must pass
+    arguments that will not change afterwards (strings, numbers, a
+    PayloadSummary). Records carrying a traceback are still formatted
+    here, since the frames it refers to do not outlive the call.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            return super().prepare(record)
+        return copy.copy(record)
+
+
+class PayloadSummary:
+    """
+    What a log line needs to know about a message: its identifying fields,
+    how many groups and tabs it carries, its size and a hash of its raw
+    bytes. The hash is only computed if the record is written.
+    """
+
+    __slots__ = ('fields', 'groups', 'tabs', 'raw')
+
+    def __init__(self, message, raw=None):
+        message = message if isinstance(message, dict) else {}
+        self.fields = {k: message[k] for k in SUMMARY_FIELDS if k in message}
+        # Chunk frames carry their tabs at the top level
+        data = message.get('data') if isinstance(message.get('data'), dict) else message
+        groups = data.get('groups')
+        groups = groups if isinstance(groups, list) else []
+        self.groups = len(groups)
+        self.tabs = len(data.get('ungroupedTabs') or ()) + sum(
+            len(g.get('tabs') or ()) for g in groups if isinstance(g, dict))
+        self.raw = raw
+
+    def __str__(self):
+        parts = [f'{k}={v}' for k, v in self.fields.items()]
+        if self.groups or self.tabs:
+            parts.append(f'groups={self.groups} tabs={self.tabs}')
+        if self.raw is not None:
+            raw = self.raw.encode('utf-8', 'surrogatepass') if isinstance(self.raw, str) else self.raw
+            parts.append(f'bytes={len(raw)} hash={hashlib.blake2b(raw, digest_size=8).hexdigest()}')
+        return ' '.join(parts) or '{}'
+
+
+def start_logging(path=None, level=logging.DEBUG, stream=False):
+    """
+    Route the root logger through a queue to a listener thread.
+
+    `path` adds a rotating log file (opened by its first record); `stream`
+    also writes to stderr. Returns the started QueueListener, which should
+    be stopped on exit so queued records are flushed.
+    """
+    handlers = []
+    if path is not None:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            str(path), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True))
+    if stream:
+        handlers.append(logging.StreamHandler())
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
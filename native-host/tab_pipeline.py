@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+URL preprocessing for tab snapshots.
+Normalizes, filters and de-duplicates tabs before they are opened.
+Shared by the native messaging host and the local server.
+"""
+
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit, unquote_plus
+
+# Query parameters that only identify where a click came from
+TRACKING_PARAMS = frozenset([
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid',
+    'igshid', 'mc_cid', 'mc_eid', '_hsenc', '_hsmi', 'mkt_tok', 'spm',
+])
+TRACKING_PREFIXES = ('utm_',)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Browser-internal pages that cannot be opened in another browser
+DEFAULT_DENY_SCHEMES = ('chrome', 'chrome-extension')
+
+
+class TabInfo:
+    """A tab's URL, split once and shared by every stage."""
+
+    __slots__ = ('url', 'parts', 'canonical')
+
+    def __init__(self, url, strip_tracking=True, strip_fragment=True):
+        self.url = url
+        try:
+            self.parts = urlsplit(url)
+        except ValueError:
+            self.parts = None
+        self.canonical = canonicalize(self.parts, strip_tracking, strip_fragment) if self.parts else url
+
+    @property
+    def scheme(self):
+        return self.parts.scheme.lower() if self.parts else ''
+
+    @property
+    def host(self):
+        return (self.parts.hostname or '') if self.parts else ''
+
+
+def canonicalize(parts, strip_tracking=True, strip_fragment=True):
+    """
+    Canonical form of a split URL, used as its identity for dedup.
+
+    Lower-cases the scheme and host, drops default ports, an empty path
+    and (optionally) tracking parameters and the fragment. The rest of the
+    query is kept byte for byte, in order, since some sites depend on it.
+    """
+    scheme = parts.scheme.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    host = (parts.hostname or '').rstrip('.')
+    if ':' in host:
+        # An IPv6 literal, which hostname gives without its brackets
+        host = f'[{host}]'
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        host = f'{host}:{port}'
+    if parts.username or parts.password:
+        userinfo = parts.username or ''
+        if parts.password:
+            userinfo += ':' + parts.password
+        host = f'{userinfo}@{host}'
+
+    path = parts.path
+    if not path and parts.netloc and scheme in DEFAULT_PORTS:
+        path = '/'
+
+    query = parts.query
+    if strip_tracking and query:
+        params = query.split('&')
+        kept = [param for param in params if not _is_tracking(unquote_plus(param.partition('=')[0]))]
+        if len(kept) != len(params):
+            query = '&'.join(kept)
+
+    fragment = '' if strip_fragment else parts.fragment
+    return urlunsplit((scheme, host, path, query, fragment))
+
+
+def _is_tracking(param):
+    param = param.lower()
+    return param in TRACKING_PARAMS or param.startswith(TRACKING_PREFIXES)
+
+
+def _domain_matches(host, domains):
+    """Whether `host` is one of `domains` or a subdomain of one."""
+    host = host.lower()
+    while True:
+        if host in domains:
+            return True
+        dot = host.find('.')
+        if dot < 0:
+            return False
+        host = host[dot + 1:]
+
+
+class SchemeFilter:
+    """Drops tabs whose scheme is denied, or not in the allow list if there is one."""
+
+    def __init__(self, allow=None, deny=DEFAULT_DENY_SCHEMES):
+        self.allow = frozenset(s.lower() for s in allow) if allow else None
+        self.deny = frozenset(s.lower() for s in deny or ())
+
+    def __call__(self, tab, group_key):
+        scheme = tab.scheme
+        if scheme in self.deny or (self.allow is not None and scheme not in self.allow):
+            return 'scheme'
+        return None
+
+
+class DomainFilter:
+    """Drops tabs by host, matching listed domains and their subdomains."""
+
+    def __init__(self, allow=None, deny=None):
+        self.allow = frozenset(d.lower() for d in allow) if allow else None
+        self.deny = frozenset(d.lower() for d in deny or ())
+
+    def __call__(self, tab, group_key):
+        host = tab.host
+        if self.deny and _domain_matches(host, self.deny):
+            return 'domain'
+        if self.allow is not None and not _domain_matches(host, self.allow):
+            return 'domain'
+        return None
+
+
+class Deduplicator:
+    """
+    Drops repeats of a canonical URL, keeping the first occurrence.
+
+    With scope 'group' a URL may appear once per group; with 'global' once
+    per snapshot. Seen URLs live in a set, so this is O(1) per tab.
+    """
+
+    def __init__(self, scope='global'):
+        if scope not in ('group', 'global'):
+            raise ValueError(f'Invalid dedup scope: {scope!r}')
+        self.scope = scope
+        self._seen = set()
+
+    def __call__(self, tab, group_key):
+        key = tab.canonical if self.scope == 'global' else (group_key, tab.canonical)
+        if key in self._seen:
+            return 'duplicate'
+        self._seen.add(key)
+        return None
+
+
+class TabPipeline:
+    """
+    An ordered list of stages applied to every tab of a snapshot.
+
+    A stage is any callable taking (TabInfo, group_key) and returning None
+    to keep the tab or a short reason string to drop it. Stages may keep
+    state (dedup does), so one pipeline can be fed a snapshot in several
+    pieces, such as the chunks of a transfer, and still treat it as a
+    whole. Drop counts accumulate in `dropped`, and groups left with no
+    tabs, which are dropped too, in `groups_dropped`.
+    """
+
+    def __init__(self, stages=(), strip_tracking=True, strip_fragment=True, rewrite_urls=False):
+        self.stages = list(stages)
+        self.strip_tracking = strip_tracking
+        self.strip_fragment = strip_fragment
+        self.rewrite_urls = rewrite_urls
+        self.dropped = Counter()
+        self.groups_dropped = 0
+
+    def add_stage(self, stage):
+        self.stages.append(stage)
+        return self
+
+    def process(self, snapshot):
+        """Return a filtered copy of a `groups`/`ungroupedTabs` snapshot."""
+        result = dict(snapshot)
+        result['ungroupedTabs'] = self._filter_tabs(snapshot.get('ungroupedTabs', []), None)
+
+        groups = []
+        for group in snapshot.get('groups', []):
+            group_key = group.get('id', group.get('title', 'Untitled'))
+            tabs = self._filter_tabs(group.get('tabs', []), group_key)
+            if tabs:
+                groups.append(dict(group, tabs=tabs))
+            else:
+                self.groups_dropped += 1
+        result['groups'] = groups
+        return result
+
+    def _filter_tabs(self, tabs, group_key):
+        kept = []
+        for tab_data in tabs:
+            url = tab_data.get('url', '')
+            if not url:
+                continue
+            tab = TabInfo(url, self.strip_tracking, self.strip_fragment)
+            reason = None
+            for stage in self.stages:
+                reason = stage(tab, group_key)
+                if reason:
+                    break
+            if reason:
+                self.dropped[reason] += 1
+                continue
+            if self.rewrite_urls and tab.canonical != url:
+                tab_data = dict(tab_data, url=tab.canonical)
+            kept.append(tab_data)
+        return kept
+
+    def report(self):
+        """Reply fields counting the tabs dropped, in total and by reason, and the groups left empty."""
+        return {'tabsDropped': sum(self.dropped.values()), 'dropped': dict(self.dropped),
+                'groupsDropped': self.groups_dropped}
+
+
+def _string_list(config, key, default=None):
+    """A filter setting that must be a list of strings (or null)."""
+    value = config.get(key, default)
+    if value is not None and (not isinstance(value, (list, tuple)) or
+                              not all(isinstance(item, str) for item in value)):
+        raise ValueError(f'Invalid {key}: {value!r}')
+    return value
+
+
+def build_pipeline(config=None):
+    """
+    Build the standard pipeline from a request's `filters` settings.
+
+    Recognized keys: `allowSchemes`/`denySchemes` (default denies chrome://
+    and chrome-extension://), `allowDomains`/`denyDomains`, `dedup`
+    ('group', 'global' or false), `stripTracking` and `stripFragment`
+    (whether those are ignored when comparing URLs, default true) and
+    `rewriteUrls` (open the canonical URL instead of the original).
+    """
+    config = config or {}
+    if not isinstance(config, dict):
+        raise ValueError(f'Invalid filters: {config!r}')
+    allow_domains = _string_list(config, 'allowDomains')
+    deny_domains = _string_list(config, 'denyDomains')
+
+    stages = [SchemeFilter(_string_list(config, 'allowSchemes'),
+                           _string_list(config, 'denySchemes', DEFAULT_DENY_SCHEMES))]
+    if allow_domains or deny_domains:
+        stages.append(DomainFilter(allow_domains, deny_domains))
+    if config.get('dedup'):
+        stages.append(Deduplicator(config['dedup']))
+
+    return TabPipeline(
+        stages,
+        strip_tracking=config.get('stripTracking', True),
+        strip_fragment=config.get('stripFragment', True),
+        rewrite_urls=config.get('rewriteUrls', False)
+    )
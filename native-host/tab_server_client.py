@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Client for the local server (local-server/server.py).
+Pushes snapshots to it over its Unix domain socket when that is available,
+and over TCP otherwise. Used by the native host's `pushToServer` action and
+by local tooling:
+
+    python tab_server_client.py snapshot.json --source window-1
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import os
+import socket
+import sys
+import uuid
+from pathlib import Path
+
+DEFAULT_SOCKET_PATH = Path.home() / '.tab_cloner' / 'server.sock'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8768
+REQUEST_TIMEOUT = 60
+# Bodies at least this large are sent gzip-compressed over TCP
+MIN_COMPRESS_BYTES = 64 * 1024
+# Methods safe to send again when a keep-alive connection turns out dead
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection to a server listening on a Unix domain socket."""
+
+    def __init__(self, path, timeout=REQUEST_TIMEOUT):
+        # The host name only fills in the Host header
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = str(path)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class ServerClient:
+    """
+    A keep-alive connection to the local server.
+
+    With `socket_path` set the client only uses that socket. Otherwise it
+    uses DEFAULT_SOCKET_PATH if a socket is there, and TCP `host`:`port`
+    if not. When a keep-alive connection turns out to have been dropped,
+    an idempotent request is resent once on a new one.
+    """
+
+    def __init__(self, socket_path=None, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=REQUEST_TIMEOUT):
+        if socket_path is None and DEFAULT_SOCKET_PATH.is_socket():
+            socket_path = DEFAULT_SOCKET_PATH
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._connection = None
+
+    @property
+    def address(self):
+        return f'unix:{self.socket_path}' if self.socket_path is not None else f'http://{self.host}:{self.port}'
+
+    def _connect(self):
+        if self.socket_path is not None:
+            return UnixHTTPConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None, retry=None):
+        """
+        Send one request; returns (status code, parsed JSON body).
+
+        `retry` says whether the request may be sent twice; by default only
+        idempotent methods are, since the server may have acted on the
+        first attempt before the connection dropped.
+        """
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        for attempt in (1, 2):
+            if self._connection is None:
+                self._connection = self._connect()
+            try:
+                self._connection.request(method, path, body, headers or {})
+                response = self._connection.getresponse()
+                raw = response.read()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server dropped an idle keep-alive connection
+                self.close()
+                if attempt == 2 or not retry:
+                    raise
+        try:
+            return response.status, json.loads(raw)
+        except ValueError:
+            return response.status, {'status': 'error', 'error': raw.decode('utf-8', 'replace').strip()}
+
+    def push(self, snapshot, source=None, job_id=None, filters=None):
+        """
+        Queue `snapshot` on the server for the Sidekick extension, as the
+        Chrome extension's POST would. Returns the server's reply.
+
+        The job ID is chosen here when not given, so a push resent after a
+        dropped connection replaces the first copy instead of queueing a
+        second one.
+        """
+        message = {'action': 'cloneToSidekick', 'data': snapshot, 'jobId': job_id or uuid.uuid4().hex}
+        if source is not None:
+            message['source'] = source
+        if filters:
+            message['filters'] = filters
+        body = json.dumps(message).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        # A local socket copies bytes about as fast as gzip can read them
+        if self.socket_path is None and len(body) >= MIN_COMPRESS_BYTES:
+            body = gzip.compress(body, compresslevel=1)
+            headers['Content-Encoding'] = 'gzip'
+        status, reply = self.request('POST', '/', body, headers, retry=True)
+        if status != 200 and reply.get('status') != 'error':
+            reply = {'status': 'error', 'error': f'Server replied {status}', 'reply': reply}
+        return reply
+
+    def status(self):
+        return self.request('GET', '/status')[1]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def push_snapshot(snapshot, options=None):
+    """
+    The native host's pushToServer action. `options` may give
+    `serverSocket` (a socket path), `serverHost`/`serverPort`, `source`,
+    `jobId` and `filters`.
+    """
+    options = options or {}
+    port = options.get('serverPort', DEFAULT_PORT)
+    if isinstance(port, bool) or not isinstance(port, int):
+        return {'status': 'error', 'error': f'Invalid serverPort: {port!r}'}
+    socket_path = options.get('serverSocket')
+    with ServerClient(os.path.expanduser(socket_path) if socket_path else None,
+                      options.get('serverHost', DEFAULT_HOST), port) as client:
+        try:
+            reply = client.push(snapshot, options.get('source'), options.get('jobId'), options.get('filters'))
+        except OSError as e:
+            return {'status': 'error', 'error': f'Cannot reach the local server at {client.address}: {e}'}
+        return dict(reply, server=client.address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Push a tab snapshot to the local server')
+    parser.add_argument('snapshot', help='JSON file with groups and ungroupedTabs, or - for stdin')
+    parser.add_argument('--socket', help=f'server socket (default: {DEFAULT_SOCKET_PATH} if present)')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='server address without a socket (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='server port (default: %(default)s)')
+    parser.add_argument('--source', help='window ID, to queue only the changes since its last fetch')
+    args = parser.parse_args()
+
+    if args.snapshot == '-':
+        snapshot = json.load(sys.stdin)
+    else:
+        with open(args.snapshot, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    reply = push_snapshot(snapshot, {'serverSocket': args.socket, 'serverHost': args.host,
+                                     'serverPort': args.port, 'source': args.source})
+    json.dump(reply, sys.stdout, indent=2)
+    print()
+    return 0 if reply.get('status') == 'success' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
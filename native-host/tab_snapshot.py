@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory form of a tab snapshot.
+Holds the tabs of a `groups`/`ungroupedTabs` snapshot in columns instead of
+a dict per tab, and serializes back to JSON only when asked. Used by the
+local server for the jobs it holds.
+"""
+
+import json
+import re
+import sys
+import uuid
+from array import array
+from json.encoder import encode_basestring_ascii
+
+# Tab fields kept in columns; anything else goes to a per-tab overflow dict
+_TAB_FIELDS = frozenset(('url', 'title', 'pinned', 'index'))
+# Indexes outside the range of array('q') go to the overflow dict too
+_MIN_INDEX = -2 ** 63
+_MAX_INDEX = 2 ** 63 - 1
+_HAS_TITLE = 1
+_HAS_PINNED = 2
+_PINNED = 4
+_HAS_INDEX = 8
+_NO_URL = 16
+
+# Group fields kept as attributes, in the order the Chrome extension sends them
+_GROUP_FIELDS = ('id', 'title', 'color', 'collapsed')
+_MISSING = object()
+
+# Ungrouped tabs per json_chunks() piece
+_CHUNK_TABS = 1000
+
+# scheme://authority, the part of a URL shared by every tab on a site
+_ORIGIN = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://[^/?#]*')
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class GroupRecord:
+    """One group: its fields and the slice of tab positions it owns."""
+
+    __slots__ = ('id', 'title', 'color', 'collapsed', 'start', 'stop', 'extra')
+
+    def __init__(self, group, start, stop):
+        self.id = group.get('id', _MISSING)
+        self.title = _intern(group.get('title', _MISSING))
+        self.color = _intern(group.get('color', _MISSING))
+        self.collapsed = group.get('collapsed', _MISSING)
+        self.start = start
+        self.stop = stop
+        extra = {k: v for k, v in group.items() if k not in _GROUP_FIELDS and k != 'tabs'}
+        self.extra = extra or None
+
+    def fields(self):
+        """The group's fields other than its tabs, as in the original dict."""
+        fields = {}
+        for name in _GROUP_FIELDS:
+            value = getattr(self, name)
+            if value is not _MISSING:
+                fields[name] = value
+        if self.extra:
+            fields.update(self.extra)
+        return fields
+
+
+class TextColumn:
+    """Strings stored back to back as UTF-8 and found by their end offsets."""
+
+    __slots__ = ('data', 'ends')
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array('I')
+
+    def append(self, text):
+        # JSON can carry lone surrogates, which plain UTF-8 cannot
+        self.data += text.encode('utf-8', 'surrogatepass')
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, index):
+        start = self.ends[index - 1] if index else 0
+        return self.data[start:self.ends[index]].decode('utf-8', 'surrogatepass')
+
+    def __len__(self):
+        return len(self.ends)
+
+
+class CompactSnapshot:
+    """
+    A snapshot stored column by column.
+
+    Tabs sit in one run in snapshot order (ungrouped tabs first, then each
+    group's), so a group is a slice of positions. A URL is kept as an index
+    into a table of interned origins (scheme and host) plus the rest of the
+    URL; group titles and colors are interned too. The rest of each URL and
+    each title live in TextColumns, so a tab costs its UTF-8 bytes plus a
+    few bytes of offsets and flags rather than a dict and its strings. Any
+    other tab field lands in a sparse overflow dict, so converting back
+    with to_dict() loses nothing. JSON is only built when asked for, by
+    to_json() or encode_json(), and is not kept.
+    """
+
+    __slots__ = ('groups', 'ungrouped_stop', 'origins', 'url_origins', 'url_rests', 'titles', 'flags',
+                 'indexes', 'tab_extra', 'extra', 'url_count')
+
+    def __init__(self):
+        self.groups = []
+        self.ungrouped_stop = 0
+        self.origins = []
+        self.url_origins = array('I')
+        self.url_rests = TextColumn()
+        self.titles = TextColumn()
+        self.flags = bytearray()
+        self.indexes = array('q')
+        # position -> fields that do not fit the columns
+        self.tab_extra = {}
+        # Snapshot fields other than groups and ungroupedTabs
+        self.extra = {}
+        # Tabs with a non-empty URL, i.e. how many entries() yields
+        self.url_count = 0
+
+    @classmethod
+    def from_dict(cls, snapshot):
+        compact = cls()
+        origin_ids = {}
+        for tab in snapshot.get('ungroupedTabs', []):
+            compact._add_tab(tab, origin_ids)
+        compact.ungrouped_stop = len(compact)
+        for group in snapshot.get('groups', []):
+            start = len(compact)
+            for tab in group.get('tabs', []):
+                compact._add_tab(tab, origin_ids)
+            compact.groups.append(GroupRecord(group, start, len(compact)))
+        compact.extra = {k: v for k, v in snapshot.items() if k not in ('groups', 'ungroupedTabs')}
+        return compact
+
+    def _add_tab(self, tab, origin_ids):
+        position = len(self.flags)
+        extra = {}
+        flags = 0
+        url = tab.get('url', _MISSING)
+        if url is _MISSING:
+            flags |= _NO_URL
+        elif not isinstance(url, str):
+            extra['url'] = url
+        if not isinstance(url, str):
+            url = ''
+        elif url:
+            self.url_count += 1
+        match = _ORIGIN.match(url)
+        origin = match.group() if match else ''
+        origin_id = origin_ids.get(origin)
+        if origin_id is None:
+            origin_id = origin_ids[origin] = len(self.origins)
+            self.origins.append(sys.intern(origin))
+        self.url_origins.append(origin_id)
+        self.url_rests.append(url[len(origin):])
+
+        title = tab.get('title', _MISSING)
+        if isinstance(title, str):
+            flags |= _HAS_TITLE
+        elif title is not _MISSING:
+            extra['title'] = title
+        self.titles.append(title if isinstance(title, str) else '')
+        pinned = tab.get('pinned', _MISSING)
+        if isinstance(pinned, bool):
+            flags |= _HAS_PINNED | (_PINNED if pinned else 0)
+        elif pinned is not _MISSING:
+            extra['pinned'] = pinned
+        index = tab.get('index', _MISSING)
+        if isinstance(index, int) and not isinstance(index, bool) and _MIN_INDEX <= index <= _MAX_INDEX:
+            flags |= _HAS_INDEX
+        elif index is not _MISSING:
+            extra['index'] = index
+        self.indexes.append(index if flags & _HAS_INDEX else 0)
+        self.flags.append(flags)
+
+        # More keys than the column fields present means some are unknown
+        present = (not flags & _NO_URL) + (title is not _MISSING) + (pinned is not _MISSING) + (index is not _MISSING)
+        if len(tab) > present:
+            for key, value in tab.items():
+                if key not in _TAB_FIELDS:
+                    extra[key] = value
+        if extra:
+            self.tab_extra[position] = extra
+
+    def __len__(self):
+        return len(self.flags)
+
+    def url(self, position):
+        return self.origins[self.url_origins[position]] + self.url_rests[position]
+
+    def tab(self, position):
+        """Rebuild one tab's dict."""
+        flags = self.flags[position]
+        tab = {}
+        if not flags & _NO_URL:
+            tab['url'] = self.url(position)
+        if flags & _HAS_TITLE:
+            tab['title'] = self.titles[position]
+        if flags & _HAS_PINNED:
+            tab['pinned'] = bool(flags & _PINNED)
+        if flags & _HAS_INDEX:
+            tab['index'] = self.indexes[position]
+        extra = self.tab_extra.get(position)
+        if extra:
+            tab.update(extra)
+        return tab
+
+    def entries(self):
+        """Yield (group_title, url, title) for every tab with a non-empty string URL, in group order."""
+        sections = [('ungrouped', 0, self.ungrouped_stop)]
+        sections.extend(('Untitled' if g.title is _MISSING else g.title, g.start, g.stop) for g in self.groups)
+        # Walk the offsets in step instead of going through url() and titles[]
+        origins, url_origins, tab_extra = self.origins, self.url_origins, self.tab_extra
+        url_data, url_ends = self.url_rests.data, self.url_rests.ends
+        title_data, title_ends = self.titles.data, self.titles.ends
+        for group_title, start, stop in sections:
+            url_start = url_ends[start - 1] if start else 0
+            title_start = title_ends[start - 1] if start else 0
+            for position in range(start, stop):
+                url_stop = url_ends[position]
+                title_stop = title_ends[position]
+                url = origins[url_origins[position]] + url_data[url_start:url_stop].decode('utf-8', 'surrogatepass')
+                if url:
+                    title = title_data[title_start:title_stop].decode('utf-8', 'surrogatepass')
+                    if position in tab_extra:
+                        title = tab_extra[position].get('title', title)
+                    yield group_title, url, title
+                url_start = url_stop
+                title_start = title_stop
+
+    def to_dict(self):
+        """The snapshot as plain dicts and lists again."""
+        snapshot = dict(self.extra)
+        snapshot['groups'] = [
+            dict(group.fields(), tabs=[self.tab(p) for p in range(group.start, group.stop)])
+            for group in self.groups
+        ]
+        snapshot['ungroupedTabs'] = [self.tab(p) for p in range(self.ungrouped_stop)]
+        return snapshot
+
+    def to_json(self):
+        """The snapshot as JSON text, the same as json.dumps(self.to_dict()) up to key order."""
+        return ''.join(self.json_chunks())
+
+    def json_chunks(self):
+        """
+        to_json() in pieces of about one group each, built straight from the
+        columns, so the whole text never has to exist twice while encoding.
+        """
+        head = ''.join(f'{encode_basestring_ascii(key)}: {json.dumps(value)}, ' for key, value in self.extra.items())
+        yield '{' + head + '"groups": ['
+        for number, group in enumerate(self.groups):
+            fields = json.dumps(group.fields())[:-1]
+            tabs = self._tabs_json(group.start, group.stop)
+            yield (', ' if number else '') + fields + (', "tabs": [' if len(fields) > 1 else '"tabs": [') + tabs + ']}'
+        yield '], "ungroupedTabs": ['
+        for start in range(0, self.ungrouped_stop, _CHUNK_TABS):
+            yield (', ' if start else '') + self._tabs_json(start, min(start + _CHUNK_TABS, self.ungrouped_stop))
+        yield ']}'
+
+    def _tabs_json(self, start, stop):
+        parts = []
+        for position in range(start, stop):
+            flags = self.flags[position]
+            if flags & _NO_URL or position in self.tab_extra:
+                parts.append(json.dumps(self.tab(position)))
+                continue
+            text = '{"url": ' + encode_basestring_ascii(self.url(position))
+            if flags & _HAS_TITLE:
+                text += ', "title": ' + encode_basestring_ascii(self.titles[position])
+            if flags & _HAS_PINNED:
+                text += ', "pinned": true' if flags & _PINNED else ', "pinned": false'
+            if flags & _HAS_INDEX:
+                text += f', "index": {self.indexes[position]}'
+            parts.append(text + '}')
+        return ', '.join(parts)
+
+
+def encode_json(value):
+    """
+    json.dumps(value).encode(), except that any CompactSnapshot in `value`
+    is written from its columns a group at a time instead of being turned
+    back into dicts first.
+    """
+    snapshots = []
+    token = uuid.uuid4().hex
+
+    def default(obj):
+        if isinstance(obj, CompactSnapshot):
+            snapshots.append(obj)
+            return f'\0{token}:{len(snapshots) - 1}\0'
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    text = json.dumps(value, default=default)
+    if not snapshots:
+        return text.encode()
+    # Every other piece is the number of a snapshot to splice in
+    pieces = re.split(r'"\\u0000' + token + r':(\d+)\\u0000"', text)
+    chunks = []
+    for number, piece in enumerate(pieces):
+        if number % 2:
+            chunks.extend(chunk.encode() for chunk in snapshots[int(piece)].json_chunks())
+        else:
+            chunks.append(piece.encode())
+    return b''.join(chunks)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Differential sync of tab snapshots.
+Remembers what a source window last looked like and turns the next
+snapshot into the tabs and groups that were added, removed or moved.
+Shared by the native messaging host and the local server.
+"""
+
+import hashlib
+from collections import Counter, defaultdict, deque
+
+# Group key of tabs that are not in any group
+UNGROUPED = None
+
+# Group fields that are synced besides the tabs themselves
+GROUP_FIELDS = ('title', 'color', 'collapsed')
+
+
+def group_key(group):
+    """Identity of a group across snapshots (the same key merge_chunks uses)."""
+    return group.get('id', group.get('title', 'Untitled'))
+
+
+def tab_list_hash(urls):
+    """Content hash of a group's URLs, in order."""
+    digest = hashlib.blake2b(digest_size=16)
+    for url in urls:
+        digest.update(url.encode('utf-8', 'surrogatepass'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def snapshot_groups(snapshot):
+    """Yield (key, fields, tabs) for the ungrouped tabs and each group of a snapshot."""
+    ungrouped = [t for t in snapshot.get('ungroupedTabs', []) if t.get('url')]
+    if ungrouped:
+        yield UNGROUPED, {}, ungrouped
+    for group in snapshot.get('groups', []):
+        tabs = [t for t in group.get('tabs', []) if t.get('url')]
+        if tabs:
+            yield group_key(group), {f: group.get(f) for f in GROUP_FIELDS}, tabs
+
+
+class GroupState:
+    """The URLs (in order) and fields of one group as last synced."""
+
+    __slots__ = ('fields', 'urls', 'hash')
+
+    def __init__(self, fields, urls):
+        self.fields = fields
+        self.urls = urls
+        self.hash = tab_list_hash(urls)
+
+
+class SnapshotState:
+    """
+    What a source window looked like at the last sync.
+
+    Only URLs are kept per group, with a hash of each group's list so an
+    unchanged group is recognized without comparing its tabs one by one.
+    """
+
+    def __init__(self):
+        self.groups = {}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        state = cls()
+        for key, fields, tabs in snapshot_groups(snapshot):
+            state.set_group(key, fields, [t['url'] for t in tabs])
+        return state
+
+    def set_group(self, key, fields, urls):
+        if urls:
+            self.groups[key] = GroupState(fields, urls)
+        else:
+            self.groups.pop(key, None)
+
+    def diff(self, snapshot):
+        """
+        Changes that turn this state into `snapshot`.
+
+        Returns a dict with `added` ({group, url, title}), `removed`
+        ({group, url}) and `moved` ({url, from, to}) tabs, `groups` (the
+        full target of every new or changed group, so the receiver can
+        reorder and restyle it), `removedGroups` and `unchanged`. A tab that
+        leaves one group and appears in another is a move, not a removal
+        plus an addition.
+        """
+        changed = []
+        added = []
+        removed = []
+        seen = set()
+
+        for key, fields, tabs in snapshot_groups(snapshot):
+            seen.add(key)
+            old = self.groups.get(key)
+            urls = [t['url'] for t in tabs]
+            if old is not None and old.fields == fields and old.hash == tab_list_hash(urls):
+                continue
+            changed.append(dict(fields, key=key, tabs=tabs))
+
+            remaining = Counter(old.urls) if old is not None else Counter()
+            for tab in tabs:
+                url = tab['url']
+                if remaining[url] > 0:
+                    remaining[url] -= 1
+                else:
+                    added.append({'group': key, 'url': url, 'title': tab.get('title', '')})
+            if old is not None:
+                for url in old.urls:
+                    if remaining[url] > 0:
+                        remaining[url] -= 1
+                        removed.append({'group': key, 'url': url})
+
+        removed_groups = [key for key in self.groups if key not in seen]
+        for key in removed_groups:
+            removed.extend({'group': key, 'url': url} for url in self.groups[key].urls)
+
+        # Pair removals with additions of the same URL elsewhere
+        by_url = defaultdict(deque)
+        for index, tab in enumerate(removed):
+            by_url[tab['url']].append(index)
+        moved = []
+        kept_added = []
+        paired = set()
+        for tab in added:
+            candidates = by_url.get(tab['url'])
+            if candidates:
+                index = candidates.popleft()
+                paired.add(index)
+                moved.append({'url': tab['url'], 'title': tab['title'],
+                              'from': removed[index]['group'], 'to': tab['group']})
+            else:
+                kept_added.append(tab)
+        removed = [tab for index, tab in enumerate(removed) if index not in paired]
+
+        return {
+            'unchanged': not changed and not removed_groups,
+            'groups': changed,
+            'removedGroups': removed_groups,
+            'added': kept_added,
+            'removed': removed,
+            'moved': moved
+        }
+
+
+def summarize(diff):
+    """Counts describing a diff, for replies and logs."""
+    return {
+        'unchanged': diff['unchanged'],
+        'groupsChanged': len(diff['groups']),
+        'groupsRemoved': len(diff['removedGroups']),
+        'tabsAdded': len(diff['added']),
+        'tabsRemoved': len(diff['removed']),
+        'tabsMoved': len(diff['moved'])
+    }
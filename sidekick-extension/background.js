@@ -2,6 +2,11 @@
 // Uses chrome.tabs.group() API to create real tab groups
 
 const SERVER_URL = 'http://127.0.0.1:8768';
+// Seconds the server may hold a fetch open waiting for Chrome to push tabs
+const FETCH_WAIT_SECONDS = 10;
+// Storage key of the tabs created by syncs:
+// {source: {groupKey: {groupId, tabs: [{url, tabId}]}}}
+const SYNC_STATE_KEY = 'syncState';
 
 // Listen for messages from popup
 chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
@@ -20,8 +25,8 @@ chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
 });
 
 async function fetchAndCreateTabs() {
-  // Fetch pending tab data from server
-  const response = await fetch(`${SERVER_URL}/pending`);
+  // Fetch pending tab data from server, waiting briefly if none has arrived yet
+  const response = await fetch(`${SERVER_URL}/pending?wait=${FETCH_WAIT_SECONDS}`);
   if (!response.ok) {
     throw new Error('No pending tabs to import');
   }
@@ -29,9 +34,134 @@ async function fetchAndCreateTabs() {
   if (!data || !data.data) {
     throw new Error('No tab data available');
   }
+  // Sync jobs carry only the changes since this extension's last fetch
+  if (data.data.diff) {
+    return await applyTabDiff(data.data.source, data.data.diff);
+  }
   return await createTabGroups(data.data);
 }
 
+async function applyTabDiff(source, diff) {
+  const stored = await chrome.storage.local.get(SYNC_STATE_KEY);
+  const syncState = stored[SYNC_STATE_KEY] || {};
+  const groups = syncState[source] || {};
+
+  // Ungrouped tabs have a null key, which becomes "null" here
+  const entryFor = key => {
+    const name = String(key);
+    if (!groups[name]) {
+      groups[name] = { groupId: null, tabs: [] };
+    }
+    return groups[name];
+  };
+  const takeTab = (key, url) => {
+    const entry = groups[String(key)];
+    const index = entry ? entry.tabs.findIndex(t => t.url === url) : -1;
+    return index >= 0 ? entry.tabs.splice(index, 1)[0] : null;
+  };
+
+  let tabsCreated = 0;
+  let tabsRemoved = 0;
+  let tabsMoved = 0;
+
+  for (const tab of diff.removed) {
+    const tracked = takeTab(tab.group, tab.url);
+    if (tracked) {
+      try {
+        await chrome.tabs.remove(tracked.tabId);
+        tabsRemoved++;
+      } catch (e) {
+        console.warn('Tab was already closed:', tab.url);
+      }
+    }
+  }
+
+  // A moved tab that was closed meanwhile is created again
+  const toCreate = [...diff.added];
+  for (const tab of diff.moved) {
+    const tracked = takeTab(tab.from, tab.url);
+    if (tracked) {
+      entryFor(tab.to).tabs.push(tracked);
+      tabsMoved++;
+    } else {
+      toCreate.push({ group: tab.to, url: tab.url, title: tab.title });
+    }
+  }
+
+  for (const tab of toCreate) {
+    try {
+      const created = await chrome.tabs.create({ url: tab.url, active: false });
+      entryFor(tab.group).tabs.push({ url: tab.url, tabId: created.id });
+      tabsCreated++;
+    } catch (e) {
+      console.error('Error creating tab:', e);
+    }
+  }
+
+  for (const key of diff.removedGroups) {
+    delete groups[String(key)];
+  }
+
+  // Put each changed group's tabs in snapshot order, then regroup and restyle it
+  for (const group of diff.groups) {
+    const entry = entryFor(group.key);
+    const ordered = [];
+    for (const tabInfo of group.tabs) {
+      const index = entry.tabs.findIndex(t => t.url === tabInfo.url);
+      if (index >= 0) {
+        ordered.push(entry.tabs.splice(index, 1)[0]);
+      }
+    }
+    const alive = [];
+    for (const tracked of ordered.concat(entry.tabs)) {
+      try {
+        await chrome.tabs.get(tracked.tabId);
+        alive.push(tracked);
+      } catch (e) {
+        // Closed by the user; forget it
+      }
+    }
+    entry.tabs = alive;
+    if (alive.length === 0) {
+      delete groups[String(group.key)];
+      continue;
+    }
+
+    const tabIds = alive.map(t => t.tabId);
+    try {
+      await chrome.tabs.move(tabIds, { index: -1 });
+      if (group.key === null) {
+        await chrome.tabs.ungroup(tabIds);
+        continue;
+      }
+      try {
+        entry.groupId = await chrome.tabs.group(
+          entry.groupId !== null ? { tabIds: tabIds, groupId: entry.groupId } : { tabIds: tabIds });
+      } catch (e) {
+        // The old group is gone; start a new one
+        entry.groupId = await chrome.tabs.group({ tabIds: tabIds });
+      }
+      await chrome.tabGroups.update(entry.groupId, {
+        title: group.title || 'Untitled',
+        color: group.color || 'grey'
+      });
+    } catch (e) {
+      console.error('Error updating group:', e);
+    }
+  }
+
+  syncState[source] = groups;
+  await chrome.storage.local.set({ [SYNC_STATE_KEY]: syncState });
+
+  return {
+    status: 'success',
+    message: `Synced: ${tabsCreated} tabs created, ${tabsRemoved} closed, ${tabsMoved} moved`,
+    tabsCreated: tabsCreated,
+    tabsRemoved: tabsRemoved,
+    tabsMoved: tabsMoved
+  };
+}
+
 async function createTabGroups(tabData) {
   const groups = tabData.groups || [];
   const ungroupedTabs = tabData.ungroupedTabs || [];
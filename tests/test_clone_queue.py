@@ -0,0 +1,103 @@
+"""CloneQueue hands jobs out in order and stays within its TTL and size limits."""
+
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'local-server'))
+
+from server import CloneQueue, PayloadTooLarge  # noqa: E402
+
+
+class CloneQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('server.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pops_oldest_first(self):
+        queue = CloneQueue()
+        for job_id in ('a', 'b', 'c'):
+            queue.put({'id': job_id}, 10, job_id)
+        self.assertEqual(queue.pop(), ('a', {'id': 'a'}, 1000.0, 10))
+        self.assertEqual([job[0] for job in queue.pop_many(5)], ['b', 'c'])
+        self.assertIsNone(queue.pop())
+        self.assertEqual(queue.size_bytes, 0)
+
+    def test_pop_by_id_and_repush(self):
+        queue = CloneQueue()
+        queue.put('old', 10, 'a')
+        queue.put('b', 10, 'b')
+        queue.put('new', 20, 'a')
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.size_bytes, 30)
+        self.assertEqual(queue.pop()[0], 'b')
+        self.assertEqual(queue.pop('a')[1], 'new')
+        self.assertIsNone(queue.pop('a'))
+
+    def test_jobs_expire_after_ttl(self):
+        queue = CloneQueue(ttl=60)
+        queue.put('a', 10, 'a')
+        self.now += 30
+        queue.put('b', 10, 'b')
+        self.now += 31
+        self.assertEqual(queue.peek(limit=5)[0], [('b', 'b', 1030.0)])
+        self.assertEqual(queue.size_bytes, 10)
+        self.now += 30
+        self.assertIsNone(queue.pop())
+
+    def test_evicts_oldest_to_stay_within_caps(self):
+        queue = CloneQueue(max_jobs=2)
+        for job_id in ('a', 'b', 'c'):
+            queue.put(job_id, 10, job_id)
+        self.assertEqual([job[0] for job in queue.peek(limit=5)[0]], ['b', 'c'])
+
+        queue = CloneQueue(max_bytes=100)
+        queue.put('a', 40, 'a')
+        queue.put('b', 40, 'b')
+        queue.put('c', 30, 'c')
+        self.assertEqual([job[0] for job in queue.peek(limit=5)[0]], ['b', 'c'])
+        self.assertEqual(queue.size_bytes, 70)
+        with self.assertRaises(PayloadTooLarge):
+            queue.put('d', 101, 'd')
+
+    def test_restore_puts_job_back_at_the_front(self):
+        queue = CloneQueue()
+        queue.put('a', 10, 'a')
+        queue.put('b', 10, 'b')
+        job = queue.pop()
+        self.assertTrue(queue.restore(*job))
+        self.assertEqual(queue.pop(), job)
+        self.assertEqual(queue.size_bytes, 10)
+
+    def test_restore_yields_to_newer_job_and_caps(self):
+        queue = CloneQueue()
+        queue.put('old', 10, 'a')
+        job = queue.pop()
+        queue.put('new', 10, 'a')
+        self.assertFalse(queue.restore(*job))
+        self.assertEqual(queue.pop()[1], 'new')
+
+        queue = CloneQueue(max_jobs=1)
+        queue.put('a', 10, 'a')
+        job = queue.pop()
+        queue.put('b', 10, 'b')
+        self.assertFalse(queue.restore(*job))
+        self.assertEqual(len(queue), 1)
+
+    def test_version_changes_with_contents(self):
+        queue = CloneQueue()
+        versions = [queue.version]
+        queue.put('a', 10, 'a')
+        versions.append(queue.version)
+        queue.peek()
+        self.assertEqual(queue.version, versions[-1])
+        queue.pop()
+        versions.append(queue.version)
+        self.assertEqual(len(set(versions)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""HostScheduler retries throttled and dropped loads with capped backoff."""
+
+import asyncio
+import logging
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'native-host'))
+
+import tab_cloner_host  # noqa: E402
+from tab_cloner_host import (HostScheduler, LatencyHistory, NavigationPolicy,  # noqa: E402
+                             MAX_RETRY_DELAY_SECONDS, RETRY_BASE_SECONDS)
+
+
+class FakeResponse:
+    def __init__(self, status, retry_after=None):
+        self.status = status
+        self.headers = {'retry-after': retry_after} if retry_after is not None else {}
+
+
+class FakePage:
+    """Answers each goto with the next outcome: a FakeResponse, or an exception to raise."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.gotos = 0
+
+    async def goto(self, url, wait_until=None, timeout=None):
+        self.gotos += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class BackoffTest(unittest.TestCase):
+    def test_retry_after_seconds_are_capped(self):
+        self.assertEqual(HostScheduler.backoff(0, '5'), 5.0)
+        self.assertEqual(HostScheduler.backoff(3, '0'), 0.0)
+        self.assertEqual(HostScheduler.backoff(0, '-4'), 0.0)
+        self.assertEqual(HostScheduler.backoff(0, '86400'), MAX_RETRY_DELAY_SECONDS)
+
+    def test_exponential_with_jitter(self):
+        for attempt in range(8):
+            full = min(RETRY_BASE_SECONDS * 2 ** attempt, MAX_RETRY_DELAY_SECONDS)
+            for retry_after in (None, 'Wed, 21 Oct 2015 07:28:00 GMT'):
+                with self.subTest(attempt=attempt, retry_after=retry_after):
+                    for _ in range(20):
+                        delay = HostScheduler.backoff(attempt, retry_after)
+                        self.assertLessEqual(delay, full)
+                        self.assertGreaterEqual(delay, min(full / 2, MAX_RETRY_DELAY_SECONDS))
+
+
+class NavigateTest(unittest.TestCase):
+    def setUp(self):
+        # Keep the retries out of the host's log file
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.history = LatencyHistory(Path(directory.name) / 'latency.json')
+
+    def navigate(self, page, retries=2):
+        async def run():
+            scheduler = HostScheduler(4, retries=retries, policy=NavigationPolicy(history=self.history))
+            return await scheduler.navigate(page, 'https://a.example/')
+
+        with mock.patch.object(tab_cloner_host, 'RETRY_BASE_SECONDS', 0.001):
+            return asyncio.run(run())
+
+    def test_retries_throttled_responses(self):
+        page = FakePage(FakeResponse(429, '0'), FakeResponse(503), FakeResponse(200))
+        response, retries = self.navigate(page)
+        self.assertEqual((response.status, retries, page.gotos), (200, 2, 3))
+
+    def test_gives_up_after_retries(self):
+        page = FakePage(FakeResponse(429, '0'), FakeResponse(429, '0'))
+        response, retries = self.navigate(page, retries=1)
+        self.assertEqual((response.status, retries, page.gotos), (429, 1, 2))
+
+    def test_retries_dropped_connections_only(self):
+        page = FakePage(Exception('net::ERR_CONNECTION_RESET at https://a.example/'), FakeResponse(200))
+        response, retries = self.navigate(page)
+        self.assertEqual((response.status, retries), (200, 1))
+
+        page = FakePage(Exception('net::ERR_NAME_NOT_RESOLVED at https://a.example/'), FakeResponse(200))
+        with self.assertRaises(Exception):
+            self.navigate(page)
+        self.assertEqual(page.gotos, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""SnapshotStore gives back what it stored, filters its listing and prunes old snapshots."""
+
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'local-server'))
+
+from snapshot_store import SnapshotStore  # noqa: E402
+
+
+SNAPSHOT = {
+    'ungroupedTabs': [{'url': 'https://u.example/', 'title': 'U', 'pinned': True, 'index': 0}],
+    'groups': [
+        {'id': 7, 'title': 'Work', 'color': 'blue', 'collapsed': False,
+         'tabs': [{'url': 'https://a.example/', 'title': 'A', 'pinned': False, 'index': 1},
+                  {'url': 'https://u.example/', 'title': 'U again', 'pinned': False}]},
+        {'title': 'Empty', 'color': 'red', 'collapsed': True, 'tabs': []},
+    ],
+}
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.store = self.open()
+
+    def open(self, **kwargs):
+        store = SnapshotStore(Path(self.dir) / 'snapshots.db', **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_round_trip(self):
+        snapshot_id = self.store.add(SNAPSHOT, source='window-1', job_id='job', received_at=100.0)
+        stored = self.store.get(snapshot_id)
+        self.assertEqual(stored, {'id': snapshot_id, 'receivedAt': 100.0, 'source': 'window-1', 'jobId': 'job',
+                                  'data': SNAPSHOT})
+        self.assertIsNone(self.store.get(snapshot_id + 1))
+        self.assertEqual(self.store.list(), [{'id': snapshot_id, 'receivedAt': 100.0, 'source': 'window-1',
+                                              'jobId': 'job', 'groupsCount': 2, 'tabsCount': 3}])
+
+    def test_list_filters_and_pages(self):
+        ids = [self.store.add(SNAPSHOT, source='a', received_at=100.0),
+               self.store.add({'groups': [{'title': 'Other', 'tabs': [{'url': 'https://o.example/'}]}]},
+                              source='b', received_at=200.0),
+               self.store.add(SNAPSHOT, source='a', received_at=300.0)]
+
+        def listed(**kwargs):
+            return [entry['id'] for entry in self.store.list(**kwargs)]
+
+        self.assertEqual(listed(), ids[::-1])
+        self.assertEqual(listed(limit=2), ids[:0:-1])
+        self.assertEqual(listed(before=ids[1]), ids[:1])
+        self.assertEqual(listed(source='a'), [ids[2], ids[0]])
+        self.assertEqual(listed(group='Other'), [ids[1]])
+        self.assertEqual(listed(since=200.0, until=300.0), [ids[1]])
+
+    def test_prunes_old_snapshots_and_their_urls(self):
+        store = self.open(max_snapshots=10)
+        for i in range(25):
+            store.add({'groups': [{'title': 'G', 'tabs': [{'url': f'https://{i}.example/'},
+                                                           {'url': 'https://shared.example/'}]}]})
+        kept = [entry['id'] for entry in store.list(limit=100)]
+        self.assertLessEqual(len(kept), 11)
+        self.assertEqual(kept[0], 25)
+        self.assertEqual(kept, list(range(25, 25 - len(kept), -1)))
+        urls = store._connection().execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+        self.assertEqual(urls, len(kept) + 1)
+        self.assertEqual(store.get(kept[-1])['data']['groups'][0]['tabs'][1]['url'], 'https://shared.example/')
+
+    def test_unlimited_history(self):
+        store = self.open(max_snapshots=None)
+        for _ in range(30):
+            store.add(SNAPSHOT)
+        self.assertEqual(store.count(), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
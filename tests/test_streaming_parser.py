@@ -0,0 +1,73 @@
+"""StreamingRequestParser must agree with json.loads however the body is chunked."""
+
+import io
+import json
+import random
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'local-server'))
+
+from server import StreamingRequestParser  # noqa: E402
+
+
+def parse(body, chunk_size):
+    raw = body.encode('utf-8')
+    return StreamingRequestParser(io.BytesIO(raw), len(raw), chunk_size=chunk_size).parse()
+
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        return rng.randrange(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.uniform(-1e6, 1e6) * 10 ** rng.randrange(-20, 20)
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return ''.join(rng.choice('ab"\\é\n1.') for _ in range(rng.randrange(5)))
+    if kind == 4:
+        return rng.choice([0, -0.0, 1e5, 1.5, 12345678901234567890])
+    if kind == 5:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f'k{i}': random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+class StreamingRequestParserTest(unittest.TestCase):
+    CHUNK_SIZES = (1, 2, 3, 4, 5, 8, 64)
+
+    def assert_matches(self, body):
+        expected = json.loads(body)
+        for chunk_size in self.CHUNK_SIZES:
+            with self.subTest(body=body, chunk_size=chunk_size):
+                self.assertEqual(parse(body, chunk_size), expected)
+
+    def test_numbers_split_across_chunks(self):
+        for body in ('{"a": 1.5}', '{"a": 1e5}', '{"a": -2.25E-3}', '{"a": 10}', '{"a":1.5,"b":2e+10}'):
+            self.assert_matches(body)
+
+    def test_streamed_tab_arrays(self):
+        body = json.dumps({'action': 'cloneToSidekick', 'data': {
+            'groups': [{'id': 1, 'title': 'G',
+                        'tabs': [{'url': 'https://a.example/', 'lastAccessed': 1712345678901.25}]}],
+            'ungroupedTabs': [{'url': 'https://b.example/', 'index': 3, 'pinned': False}]}})
+        self.assert_matches(body)
+
+    def test_random_documents(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            data = {'groups': [random_value(rng) for _ in range(rng.randrange(3))],
+                    'ungroupedTabs': [random_value(rng) for _ in range(rng.randrange(3))], 'x': random_value(rng)}
+            self.assert_matches(json.dumps({'action': 'cloneToSidekick', 'data': data, 'n': random_value(rng)},
+                                           separators=rng.choice([(',', ':'), (', ', ': ')])))
+
+    def test_invalid_bodies_are_rejected(self):
+        for body in ('{"a": 1.}', '{"a": 1e}', '{"a": [1, 2}', '{"a": 1} x'):
+            for chunk_size in self.CHUNK_SIZES:
+                with self.subTest(body=body, chunk_size=chunk_size), self.assertRaises(ValueError):
+                    parse(body, chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""The tab pipeline normalizes, filters and de-duplicates snapshot URLs."""
+
+import sys
+import unittest
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'native-host'))
+
+from tab_pipeline import build_pipeline, canonicalize  # noqa: E402
+
+
+def canonical(url, **kwargs):
+    return canonicalize(urlsplit(url), **kwargs)
+
+
+def urls(snapshot):
+    return ([tab['url'] for tab in snapshot['ungroupedTabs']] +
+            [tab['url'] for group in snapshot['groups'] for tab in group['tabs']])
+
+
+class CanonicalizeTest(unittest.TestCase):
+    def test_normalizes_scheme_host_and_port(self):
+        cases = {
+            'HTTPS://Example.COM': 'https://example.com/',
+            'http://example.com:80/a': 'http://example.com/a',
+            'https://example.com.:8443/a': 'https://example.com:8443/a',
+            'http://user:pw@Example.com/': 'http://user:pw@example.com/',
+            'http://[::1]:8080/a': 'http://[::1]:8080/a',
+            'https://[2001:DB8::1]/': 'https://[2001:db8::1]/',
+        }
+        for url, expected in cases.items():
+            with self.subTest(url=url):
+                self.assertEqual(canonical(url), expected)
+
+    def test_strips_tracking_and_keeps_the_rest_of_the_query(self):
+        cases = {
+            'https://a.example/?utm_source=x&b=2&a=1': 'https://a.example/?b=2&a=1',
+            'https://a.example/?q=a+b%26c&fbclid=1': 'https://a.example/?q=a+b%26c',
+            'https://a.example/?UTM%5FMEDIUM=x&k': 'https://a.example/?k',
+            'https://a.example/?q=1#section': 'https://a.example/?q=1',
+        }
+        for url, expected in cases.items():
+            with self.subTest(url=url):
+                self.assertEqual(canonical(url), expected)
+        self.assertEqual(canonical('https://a.example/?utm_source=x#s', strip_tracking=False, strip_fragment=False),
+                         'https://a.example/?utm_source=x#s')
+
+
+class TabPipelineTest(unittest.TestCase):
+    SNAPSHOT = {
+        'ungroupedTabs': [
+            {'url': 'https://a.example/?utm_source=x'},
+            {'url': 'chrome://settings'},
+            {'url': ''},
+        ],
+        'groups': [
+            {'id': 1, 'title': 'One', 'tabs': [{'url': 'https://a.example/'}, {'url': 'https://docs.b.example/'}]},
+            {'id': 2, 'title': 'Two', 'tabs': [{'url': 'chrome-extension://abc/page.html'}]},
+            {'id': 3, 'title': 'Three', 'tabs': [{'url': 'https://a.example/#top'}, {'url': 'https://c.example/'}]},
+        ],
+    }
+
+    def test_default_drops_browser_pages_and_empty_groups(self):
+        pipeline = build_pipeline()
+        result = pipeline.process(self.SNAPSHOT)
+        self.assertEqual(urls(result), ['https://a.example/?utm_source=x', 'https://a.example/',
+                                        'https://docs.b.example/', 'https://a.example/#top', 'https://c.example/'])
+        self.assertEqual([group['id'] for group in result['groups']], [1, 3])
+        self.assertEqual(pipeline.report(), {'tabsDropped': 2, 'dropped': {'scheme': 2}, 'groupsDropped': 1})
+
+    def test_dedup_scopes(self):
+        result = build_pipeline({'dedup': 'global'}).process(self.SNAPSHOT)
+        self.assertEqual(urls(result), ['https://a.example/?utm_source=x', 'https://docs.b.example/',
+                                        'https://c.example/'])
+
+        result = build_pipeline({'dedup': 'group', 'rewriteUrls': True}).process(self.SNAPSHOT)
+        self.assertEqual(urls(result), ['https://a.example/', 'https://a.example/', 'https://docs.b.example/',
+                                        'https://a.example/', 'https://c.example/'])
+
+    def test_domain_filters_match_subdomains(self):
+        result = build_pipeline({'denyDomains': ['b.example']}).process(self.SNAPSHOT)
+        self.assertNotIn('https://docs.b.example/', urls(result))
+
+        pipeline = build_pipeline({'allowDomains': ['b.example', 'c.example']})
+        result = pipeline.process(self.SNAPSHOT)
+        self.assertEqual(urls(result), ['https://docs.b.example/', 'https://c.example/'])
+        self.assertEqual(pipeline.report()['dropped'], {'scheme': 2, 'domain': 3})
+
+    def test_state_carries_across_pieces(self):
+        pipeline = build_pipeline({'dedup': 'global'})
+        first = pipeline.process({'groups': [{'id': 1, 'tabs': [{'url': 'https://a.example/'}]}]})
+        second = pipeline.process({'groups': [{'id': 2, 'tabs': [{'url': 'https://a.example/'}]}]})
+        self.assertEqual(len(first['groups']), 1)
+        self.assertEqual(second['groups'], [])
+        self.assertEqual(pipeline.report(), {'tabsDropped': 1, 'dropped': {'duplicate': 1}, 'groupsDropped': 1})
+
+    def test_rejects_invalid_settings(self):
+        for config in ({'denyDomains': 'example.com'}, {'allowSchemes': ['https', 1]}, {'dedup': 'window'},
+                       ['https']):
+            with self.subTest(config=config):
+                with self.assertRaises(ValueError):
+                    build_pipeline(config)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""CompactSnapshot must give back exactly the snapshot it was built from."""
+
+import json
+import sys
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'native-host'))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from snapshots import generate_snapshot  # noqa: E402
+from tab_snapshot import CompactSnapshot, encode_json  # noqa: E402
+
+
+def collect_urls(snapshot):
+    """The (group_title, url, title) entries the native host clones, in order; URLs must be strings."""
+    def has_url(tab):
+        return isinstance(tab.get('url'), str) and tab['url']
+
+    entries = [('ungrouped', tab['url'], tab.get('title', ''))
+               for tab in snapshot.get('ungroupedTabs', []) if has_url(tab)]
+    for group in snapshot.get('groups', []):
+        entries += [(group.get('title', 'Untitled'), tab['url'], tab.get('title', ''))
+                    for tab in group.get('tabs', []) if has_url(tab)]
+    return entries
+
+
+ODD_TABS = [
+    {'url': 'https://a.example/', 'title': 'A', 'index': 1, 'favIconUrl': 'https://a.example/f.ico'},
+    {'url': 'https://a.example/x', 'title': 'X', 'pinned': True, 'index': 2, 'active': True},
+    {'title': 'no url'},
+    {'url': '', 'title': 'empty url'},
+    {'url': 'about:blank'},
+    {'url': 5, 'title': None, 'pinned': 1, 'index': '3'},
+    {'url': 'https://b.example/', 'index': 2 ** 70},
+    {'url': 'https://b.example/', 'index': -2 ** 63 - 1},
+    {'url': 'https://b.example/', 'index': True},
+    {'url': 'https://ü.example/é\ud800', 'title': 'ü "quoted" \\ \n'},
+    {},
+]
+
+
+class CompactSnapshotTest(unittest.TestCase):
+    def assert_round_trip(self, snapshot):
+        compact = CompactSnapshot.from_dict(snapshot)
+        self.assertEqual(compact.to_dict(), snapshot)
+        self.assertEqual(json.loads(compact.to_json()), snapshot)
+        self.assertEqual(json.loads(encode_json({'jobs': [{'data': compact}, {'data': compact}]})),
+                         {'jobs': [{'data': snapshot}, {'data': snapshot}]})
+        self.assertEqual(list(compact.entries()), collect_urls(snapshot))
+        self.assertEqual(compact.url_count, len(collect_urls(snapshot)))
+
+    def test_generated_snapshots(self):
+        for tabs in (0, 1, 30, 3000):
+            with self.subTest(tabs=tabs):
+                self.assert_round_trip(generate_snapshot(tabs))
+
+    def test_unusual_tabs(self):
+        for tab in ODD_TABS:
+            with self.subTest(tab=tab):
+                self.assert_round_trip({'groups': [{'id': 1, 'title': 'G', 'tabs': [tab]}], 'ungroupedTabs': [tab]})
+
+    def test_unusual_groups(self):
+        self.assert_round_trip({
+            'groups': [{'tabs': []}, {'title': None, 'tabs': ODD_TABS},
+                       {'id': 7, 'color': 'red', 'extra': [1], 'tabs': []}],
+            'ungroupedTabs': ODD_TABS,
+            'totalTabs': 3
+        })
+        self.assert_round_trip({'groups': [], 'ungroupedTabs': []})
+
+    def test_plain_values(self):
+        self.assertEqual(encode_json({'a': [1, 'é']}), json.dumps({'a': [1, 'é']}).encode())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""SnapshotState.diff reports exactly the tabs and groups that changed."""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'native-host'))
+
+from tab_sync import UNGROUPED, SnapshotState  # noqa: E402
+
+
+def snapshot(groups, ungrouped=()):
+    return {
+        'ungroupedTabs': [{'url': url, 'title': url} for url in ungrouped],
+        'groups': [dict({'id': gid, 'title': f'G{gid}', 'color': 'blue', 'collapsed': False},
+                        tabs=[{'url': url, 'title': url} for url in urls])
+                   for gid, urls in groups.items()],
+    }
+
+
+BASE = snapshot({1: ['https://a/', 'https://b/'], 2: ['https://c/']}, ungrouped=['https://u/'])
+
+
+class SnapshotStateDiffTest(unittest.TestCase):
+    def diff(self, target, base=BASE):
+        return SnapshotState.from_snapshot(base).diff(target)
+
+    def test_unchanged(self):
+        diff = self.diff(BASE)
+        self.assertTrue(diff['unchanged'])
+        self.assertEqual((diff['groups'], diff['added'], diff['removed'], diff['moved'], diff['removedGroups']),
+                         ([], [], [], [], []))
+
+    def test_added_and_removed(self):
+        diff = self.diff(snapshot({1: ['https://a/', 'https://d/'], 2: ['https://c/']}, ungrouped=['https://u/']))
+        self.assertFalse(diff['unchanged'])
+        self.assertEqual(diff['added'], [{'group': 1, 'url': 'https://d/', 'title': 'https://d/'}])
+        self.assertEqual(diff['removed'], [{'group': 1, 'url': 'https://b/'}])
+        self.assertEqual(diff['moved'], [])
+        self.assertEqual([group['key'] for group in diff['groups']], [1])
+        self.assertEqual([tab['url'] for tab in diff['groups'][0]['tabs']], ['https://a/', 'https://d/'])
+
+    def test_move_between_groups(self):
+        diff = self.diff(snapshot({1: ['https://a/'], 2: ['https://c/', 'https://b/']}, ungrouped=['https://u/']))
+        self.assertEqual(diff['moved'], [{'url': 'https://b/', 'title': 'https://b/', 'from': 1, 'to': 2}])
+        self.assertEqual((diff['added'], diff['removed']), ([], []))
+        self.assertEqual([group['key'] for group in diff['groups']], [1, 2])
+
+    def test_reorder_and_restyle_resend_the_group_only(self):
+        reordered = snapshot({1: ['https://b/', 'https://a/'], 2: ['https://c/']}, ungrouped=['https://u/'])
+        diff = self.diff(reordered)
+        self.assertFalse(diff['unchanged'])
+        self.assertEqual([group['key'] for group in diff['groups']], [1])
+        self.assertEqual((diff['added'], diff['removed'], diff['moved']), ([], [], []))
+
+        restyled = snapshot({1: ['https://a/', 'https://b/'], 2: ['https://c/']}, ungrouped=['https://u/'])
+        restyled['groups'][1]['color'] = 'red'
+        diff = self.diff(restyled)
+        self.assertEqual([(group['key'], group['color']) for group in diff['groups']], [(2, 'red')])
+
+    def test_removed_group_and_ungrouped_tabs(self):
+        diff = self.diff(snapshot({1: ['https://a/', 'https://b/']}))
+        self.assertEqual(diff['removedGroups'], [UNGROUPED, 2])
+        self.assertEqual(diff['removed'], [{'group': UNGROUPED, 'url': 'https://u/'},
+                                           {'group': 2, 'url': 'https://c/'}])
+        self.assertFalse(diff['unchanged'])
+
+    def test_duplicate_urls_are_counted(self):
+        base = snapshot({1: ['https://a/', 'https://a/']})
+        diff = self.diff(snapshot({1: ['https://a/', 'https://a/', 'https://a/']}), base)
+        self.assertEqual(diff['added'], [{'group': 1, 'url': 'https://a/', 'title': 'https://a/'}])
+        diff = self.diff(snapshot({1: ['https://a/']}), base)
+        self.assertEqual(diff['removed'], [{'group': 1, 'url': 'https://a/'}])
+
+    def test_from_empty_state(self):
+        diff = SnapshotState().diff(BASE)
+        self.assertEqual([tab['url'] for tab in diff['added']],
+                         ['https://u/', 'https://a/', 'https://b/', 'https://c/'])
+        self.assertEqual([group['key'] for group in diff['groups']], [UNGROUPED, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()